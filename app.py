@@ -18,28 +18,239 @@ import google.generativeai as genai
 from PIL import Image
 import requests
 import time
+import random
+import threading
 import pytz
 import hashlib
+import json
+import sqlite3
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import google.generativeai as genai
 transport="rest"
 
 # [As suas importações de bibliotecas continuam aqui em cima intactas...]
 
-def verificar_status_odoo(codigo_produto):
+def consultar_vitrine_odoo(codigo_produto, sessao=None):
+    """Busca o SKU na loja Odoo. Devolve (achou, link); erros de rede sobem para quem chamou."""
     cod_limpo = str(codigo_produto).strip()
     url_busca = f"https://sweethomecomfort.odoo.com/shop?&search={cod_limpo}"
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        resposta = requests.get(url_busca, headers=headers, timeout=10)
-        conteudo = resposta.text.lower()
-        if f'nenhum resultado para "{cod_limpo.lower()}"' in conteudo or "nenhum resultado encontrado" in conteudo:
-            return False, ""
-        if "oe_product" in conteudo or "o_wsale_products_item" in conteudo:
-            return True, url_busca
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    resposta = (sessao or requests).get(url_busca, headers=headers, timeout=10)
+    conteudo = resposta.text.lower()
+    if f'nenhum resultado para "{cod_limpo.lower()}"' in conteudo or "nenhum resultado encontrado" in conteudo:
         return False, ""
+    if "oe_product" in conteudo or "o_wsale_products_item" in conteudo:
+        return True, url_busca
+    return False, ""
+
+def verificar_status_odoo(codigo_produto, sessao=None):
+    try:
+        return consultar_vitrine_odoo(codigo_produto, sessao)
     except:
         return False, ""
 
+# ⚙️ Limites do robô da vitrine. Podem ser ajustados nos secrets, na seção [odoo]:
+# requisicoes_por_segundo, robos_simultaneos e validade_cache_min
+def config_odoo(chave, padrao):
+    try: return type(padrao)(st.secrets.get("odoo", {}).get(chave, padrao))
+    except Exception: return padrao
+
+@st.cache_resource(show_spinner=False)
+def recursos_odoo():
+    """Sessão HTTP reaproveitada (pool de conexões), cache de resultados por SKU e o balde de fichas do limite de taxa."""
+    sessao = requests.Session()
+    sessao.mount("https://", requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=8))
+    return {
+        "sessao": sessao,
+        "cache": {}, # {sku: (achou, link, consultado_em)}
+        "balde": {"fichas": 1.0, "ultimo": time.monotonic(), "trava": threading.Lock()}
+    }
+
+def aguardar_ficha(balde, taxa, capacidade):
+    """Balde de fichas: libera no máximo 'taxa' consultas por segundo, com rajada de até 'capacidade'."""
+    while True:
+        with balde["trava"]:
+            agora = time.monotonic()
+            balde["fichas"] = min(capacidade, balde["fichas"] + (agora - balde["ultimo"]) * taxa)
+            balde["ultimo"] = agora
+            if balde["fichas"] >= 1:
+                balde["fichas"] -= 1
+                return
+            espera = (1 - balde["fichas"]) / taxa
+        time.sleep(espera)
+
+def varrer_odoo(codigos, ao_progredir=None):
+    """
+    Consulta vários SKUs na vitrine ao mesmo tempo e devolve {sku: (achou, link)}.
+    SKUs consultados há menos de 'validade_cache_min' vêm do cache, sem nova visita ao site.
+    'ao_progredir(feitos, total)' roda na thread principal a cada SKU concluído (pode usar st.*).
+    """
+    recursos = recursos_odoo()
+    taxa = max(0.1, config_odoo("requisicoes_por_segundo", 2.0))
+    robos = max(1, config_odoo("robos_simultaneos", 4))
+    validade = config_odoo("validade_cache_min", 30) * 60
+
+    codigos = list(dict.fromkeys(str(c).strip() for c in codigos))
+    resultados, pendentes = {}, []
+    agora = time.time()
+    for cod in codigos:
+        guardado = recursos["cache"].get(cod)
+        if guardado and agora - guardado[2] < validade: resultados[cod] = guardado[:2]
+        else: pendentes.append(cod)
+    if ao_progredir: ao_progredir(len(resultados), len(codigos))
+
+    def consultar(cod):
+        aguardar_ficha(recursos["balde"], taxa, capacidade=robos)
+        return consultar_vitrine_odoo(cod, recursos["sessao"])
+
+    with ThreadPoolExecutor(max_workers=robos) as pool:
+        futuros = {pool.submit(consultar, cod): cod for cod in pendentes}
+        for futuro in as_completed(futuros):
+            cod = futuros[futuro]
+            try:
+                resultados[cod] = futuro.result()
+                recursos["cache"][cod] = (*resultados[cod], time.time())
+            except Exception as e:
+                print(f"Odoo: falha ao consultar {cod} ({e})") # Falha de rede não vai para o cache
+                resultados[cod] = (False, "")
+            if ao_progredir: ao_progredir(len(resultados), len(codigos))
+    return resultados
+
+# ==========================================
+# 🤖 VARREDURA ODOO EM SEGUNDO PLANO (RETOMÁVEL)
+# ==========================================
+ARQUIVO_VARREDURA = os.environ.get("SWEET_ARQUIVO_VARREDURA", "varredura_odoo.json") # Progresso salvo em disco
+LOTE_VARREDURA = 20 # SKUs consultados entre um salvamento e outro
+
+def salvar_varredura(estado):
+    """Grava o progresso de forma atômica (arquivo temporário + troca) para um reinício não corromper o JSON."""
+    temporario = ARQUIVO_VARREDURA + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(estado, arquivo, ensure_ascii=False)
+    os.replace(temporario, ARQUIVO_VARREDURA)
+
+def ler_varredura():
+    try:
+        with open(ARQUIVO_VARREDURA, encoding="utf-8") as arquivo: return json.load(arquivo)
+    except (FileNotFoundError, ValueError): return None
+
+def montar_resultado_varredura(plano, resultados, df_inv, df_docs):
+    """
+    Transforma as respostas do site em (gravações para a planilha, linhas do relatório).
+    O plano só guarda os códigos: as linhas do INVENTÁRIO e dos DOCUMENTOS (e o lote mais novo de cada família)
+    são achadas agora, numa leitura fresca, porque a varredura pode ter sido retomada muito depois do início.
+    """
+    codigos = df_inv.iloc[:, 0].astype(str).str.strip() if not df_inv.empty else pd.Series(dtype=str)
+    linhas_por_cod = {}
+    for idx, cod in codigos.items(): linhas_por_cod.setdefault(cod, []).append(int(idx) + 2)
+    familias = montar_familias(codigos.tolist())
+    vinculos = df_docs['VINCULO'].astype(str) if 'VINCULO' in df_docs.columns else pd.Series(dtype=str)
+
+    atualizacoes, relatorio = [], []
+    for item in plano:
+        cod_atual = item["cod"]
+        linhas_p = linhas_por_cod.get(cod_atual, [])
+        achou, link_ref = resultados.get(cod_atual, (False, ""))
+
+        if not linhas_p:
+            res_obs = "🚫 Saiu do Inventário" # Apagado ou renomeado durante a varredura: nada é gravado
+        elif achou:
+            # Lógica de diagnóstico de versão
+            if cod_atual == familias[cod_atual.split(".")[0]]["topo"]:
+                status_inv, res_obs = "Publicado", "✅ Publicado (Atualizado)"
+            else:
+                status_inv, res_obs = "Publicado (Site Desatualizado)", "⚠️ Site com Versão Antiga"
+            
+            # Atualiza ABA INVENTÁRIO (K = Link, L = Status)
+            for linha_p in linhas_p:
+                atualizacoes.append({"range": f"'INVENTÁRIO'!K{linha_p}", "values": [[link_ref]]})
+                atualizacoes.append({"range": f"'INVENTÁRIO'!L{linha_p}", "values": [[status_inv]]})
+            
+            # 🔗 INTEGRAÇÃO COM DOCUMENTOS (Limpeza da Linha de Montagem)
+            for m_idx in vinculos[vinculos.str.contains(cod_atual, regex=False, na=False)].index:
+                atualizacoes.append({"range": f"'DOCUMENTOS'!G{int(m_idx) + 2}", "values": [["Publicado no Odoo"]]})
+        else:
+            # Caso não encontre no site
+            for linha_p in linhas_p:
+                atualizacoes.append({"range": f"'INVENTÁRIO'!L{linha_p}", "values": [["Não Publicado"]]})
+            res_obs = "❌ Não Encontrado"
+
+        relatorio.append({
+            "Linha": linhas_p[0] if linhas_p else None,
+            "Cód. SKU": cod_atual,
+            "Status Site": res_obs,
+            "Ação": "OK" if "✅" in res_obs else ("⚠️ Atualizar Odoo" if "⚠️" in res_obs else ("❌ Publicar" if "❌" in res_obs else "-"))
+        })
+    return atualizacoes, relatorio
+
+def executar_varredura(gerente):
+    """Corpo da thread: consulta o plano em lotes, salvando o progresso em disco ao fim de cada lote."""
+    estado = gerente["estado"]
+    try:
+        plano = estado["plano"]
+        while estado["proximo"] < len(plano):
+            lote = plano[estado["proximo"]:estado["proximo"] + LOTE_VARREDURA]
+            novos = varrer_odoo([item["cod"] for item in lote if item["cod"] not in estado["resultados"]])
+            with gerente["trava"]:
+                estado["resultados"].update({cod: list(resposta) for cod, resposta in novos.items()})
+                estado["proximo"] += len(lote)
+                salvar_varredura(estado)
+
+        with gerente["trava"]:
+            estado["status"] = "gravando"
+            salvar_varredura(estado)
+        # 🎯 Relê as abas na hora de gravar: linhas podem ter sido inseridas/apagadas desde o início da varredura
+        invalidar("INVENTÁRIO", "DOCUMENTOS", completo=True)
+        abas = obter_abas(["INVENTÁRIO", "DOCUMENTOS"])
+        atualizacoes, relatorio = montar_resultado_varredura(plano, estado["resultados"], abas["INVENTÁRIO"], abas["DOCUMENTOS"])
+        if atualizacoes:
+            planilha_mestre.values_batch_update({"valueInputOption": "USER_ENTERED", "data": atualizacoes})
+        invalidar("INVENTÁRIO", "DOCUMENTOS")
+
+        with gerente["trava"]:
+            estado["relatorio"], estado["status"] = relatorio, "concluida"
+            estado["concluida_em"] = datetime.now().strftime("%d/%m/%Y %H:%M")
+            salvar_varredura(estado)
+    except Exception as e:
+        print(f"🤖 Varredura Odoo interrompida: {e}")
+        with gerente["trava"]:
+            estado["status"], estado["erro"] = "erro", str(e)
+            salvar_varredura(estado)
+
+def disparar_varredura(gerente):
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    thread = threading.Thread(target=executar_varredura, args=(gerente,), name="varredura_odoo", daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx()) # Permite usar os cache_resource de dentro da thread
+    gerente["thread"] = thread
+    thread.start()
+
+@st.cache_resource(show_spinner=False)
+def gerente_varredura():
+    """Memória do processo com a varredura Odoo. Quando o servidor sobe, retoma a que foi interrompida."""
+    gerente = {"estado": ler_varredura(), "thread": None, "trava": threading.Lock()}
+    if gerente["estado"] and gerente["estado"].get("status") in ("rodando", "gravando"):
+        print(f"🤖 Retomando varredura Odoo a partir do item {gerente['estado']['proximo']}...")
+        disparar_varredura(gerente)
+    return gerente
+
+def varredura_rodando():
+    thread = gerente_varredura()["thread"]
+    return thread is not None and thread.is_alive()
+
+def iniciar_varredura(plano):
+    """Começa uma varredura nova com o plano [{cod}] (as linhas são achadas de novo na hora de gravar). False se já houver uma rodando."""
+    gerente = gerente_varredura()
+    with gerente["trava"]:
+        if gerente["thread"] is not None and gerente["thread"].is_alive(): return False
+        gerente["estado"] = {
+            "status": "rodando", "iniciada_em": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+            "plano": plano, "proximo": 0, "resultados": {}, "relatorio": [], "erro": ""
+        }
+        salvar_varredura(gerente["estado"])
+        disparar_varredura(gerente)
+    return True
+
 # ==========================================
 # 🧠 0. CONFIGURAÇÕES INICIAIS E I.A.
 # ==========================================
@@ -63,6 +274,89 @@ ESPECIFICACOES = [
     "https://www.googleapis.com/auth/drive.file"
 ]
 
+# ==========================================
+# 🚦 COTA DO GOOGLE SHEETS (orçamento por minuto + nova tentativa em 429)
+# ==========================================
+# O Sheets aceita por padrão 60 leituras e 60 escritas por minuto por usuário. Os limites podem ser
+# ajustados nos secrets, na seção [cota]: leituras_minuto e escritas_minuto.
+def config_cota(chave, padrao):
+    try: return type(padrao)(st.secrets.get("cota", {}).get(chave, padrao))
+    except Exception: return padrao
+
+def novo_estado_cota(leituras_minuto, escritas_minuto):
+    return {
+        "limites": {"leituras": leituras_minuto, "escritas": escritas_minuto},
+        "janelas": {"leituras": [], "escritas": []}, # horários das chamadas do último minuto
+        "esperas": 0, "retentativas": 0, "erros_429": 0, "ultimo_429": 0.0, "trava": threading.Lock()
+    }
+
+@st.cache_resource(show_spinner=False)
+def estado_cota():
+    """Memória do processo com o uso da cota do Sheets (compartilhada por todas as sessões e threads)."""
+    return novo_estado_cota(config_cota("leituras_minuto", 60), config_cota("escritas_minuto", 60))
+
+def reservar_cota(cota, tipo, dormir=time.sleep):
+    """Fila: se o orçamento do último minuto acabou, espera a vaga mais antiga da janela abrir antes de liberar a chamada."""
+    with cota["trava"]:
+        agora = time.time()
+        janela = cota["janelas"][tipo]
+        while janela and agora - janela[0] >= 60: janela.pop(0)
+        espera = 0.0
+        if len(janela) >= cota["limites"][tipo]:
+            # A vaga é reservada já (no horário em que vai abrir), então quem chegar depois espera mais
+            espera = 60 - (agora - janela[len(janela) - cota["limites"][tipo]]) + 0.05
+            cota["esperas"] += 1
+        janela.append(agora + espera)
+    if espera > 0: dormir(espera)
+
+def pressao_cota(cota=None):
+    """Resumo para o painel: uso do último minuto, filas e 429 recebidos."""
+    cota = cota or estado_cota()
+    with cota["trava"]:
+        agora = time.time()
+        uso = {tipo: sum(1 for t in janela if agora - t < 60) for tipo, janela in cota["janelas"].items()}
+        return {
+            "leituras": uso["leituras"], "escritas": uso["escritas"], "limites": dict(cota["limites"]),
+            "esperas": cota["esperas"], "retentativas": cota["retentativas"], "erros_429": cota["erros_429"],
+            "ultimo_429": cota["ultimo_429"]
+        }
+
+class ClienteSheetsComCota(gspread.http_client.HTTPClient):
+    """
+    HTTPClient do gspread que passa toda chamada pelo orçamento da cota (GET = leitura, o resto = escrita)
+    e repete, com espera exponencial + jitter (≈1s, 2s, 4s... até ESPERA_MAXIMA):
+    - leituras: 429/408/5xx e quedas de rede;
+    - escritas: só 429/408 (o Google recusou sem gravar). Um 5xx ou queda de rede pode chegar depois
+      da linha já gravada (append_rows, insertDimension): repetir duplicaria vendas e documentos.
+    Testado sem o Google em tests/test_cota.py (sessão falsa + 'cota' e 'dormir' trocados na instância).
+    """
+    TENTATIVAS = 6
+    ESPERA_MAXIMA = 32
+    cota = None
+    dormir = staticmethod(time.sleep)
+
+    def request(self, method, endpoint, *args, **kwargs):
+        cota = self.cota if self.cota is not None else estado_cota()
+        tipo = "leituras" if str(method).upper() == "GET" else "escritas"
+        for tentativa in range(self.TENTATIVAS):
+            reservar_cota(cota, tipo, self.dormir)
+            try:
+                return super().request(method, endpoint, *args, **kwargs)
+            except gspread.exceptions.APIError as erro:
+                codigo = erro.code
+                repete = codigo in (408, 429) or (codigo >= 500 and tipo == "leituras")
+                if not repete or tentativa == self.TENTATIVAS - 1: raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                # Escrita que caiu por rede pode ter chegado ao Google: repetir duplicaria a linha
+                codigo = 0
+                if tipo == "escritas" or tentativa == self.TENTATIVAS - 1: raise
+            espera = min(2 ** tentativa, self.ESPERA_MAXIMA) * random.uniform(0.5, 1.5)
+            with cota["trava"]:
+                cota["retentativas"] += 1
+                if codigo == 429: cota["erros_429"], cota["ultimo_429"] = cota["erros_429"] + 1, time.time()
+            print(f"🚦 Sheets respondeu {codigo or 'erro de rede'} ({method} {tipo}). Nova tentativa em {espera:.1f}s...")
+            self.dormir(espera)
+
 @st.cache_resource(show_spinner=False)
 def conectar_google():
     try:
@@ -71,7 +365,7 @@ def conectar_google():
         if "gcp_service_account" in st.secrets:
             creds_info = st.secrets["gcp_service_account"]
             creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_info, ESPECIFICACOES)
-            return gspread.authorize(creds).open_by_key(st.secrets["cliente"]["spreadsheet_id"])
+            return gspread.authorize(creds, http_client=ClienteSheetsComCota).open_by_key(st.secrets["cliente"]["spreadsheet_id"])
         return None
     except Exception as e:
         st.error(f"Erro de ligação com a base de dados do cliente: {e}")
@@ -79,6 +373,70 @@ def conectar_google():
 
 planilha_mestre = conectar_google()
 
+# ==========================================
+# 📇 REGISTRO DE ABAS (Worksheet em memória)
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def registro_abas():
+    """Memória do processo com os objetos Worksheet já resolvidos (título -> aba)."""
+    return {"abas": {}, "trava": threading.Lock()}
+
+def aba_registrada(nome):
+    """
+    Worksheet guardado no registro do processo. Todas as abas (títulos e IDs) vêm de um único fetch na
+    primeira vez; a lista só é buscada de novo quando pedem uma aba que não está no registro
+    (ex: aba criada depois, ou esquecida pelo esquecer_aba).
+    """
+    registro = registro_abas()
+    aba = registro["abas"].get(nome)
+    if aba is not None: return aba
+    with registro["trava"]:
+        if nome not in registro["abas"]:
+            registro["abas"] = {a.title: a for a in planilha_mestre.worksheets()}
+        if nome not in registro["abas"]:
+            raise gspread.exceptions.WorksheetNotFound(nome)
+        return registro["abas"][nome]
+
+def esquecer_aba(*nomes):
+    """Tira as abas do registro (sem nomes, esvazia tudo): a próxima chamada busca a lista de abas de novo."""
+    registro = registro_abas()
+    with registro["trava"]:
+        if not nomes: registro["abas"] = {}
+        for nome in nomes: registro["abas"].pop(nome, None)
+
+def aba_sumiu(erro):
+    """O Google não reconhece mais o ID guardado (aba apagada e recriada): 404 ou 400 'No grid with id'."""
+    codigo = getattr(erro, "code", 0)
+    return codigo == 404 or (codigo == 400 and "grid" in str(erro).lower())
+
+class AbaRenovavel:
+    """
+    Aba do registro que se renova sozinha: se o Google disser que o Worksheet guardado não existe mais,
+    ele sai do registro, a aba é buscada de novo e a chamada é repetida uma vez (o Google recusou, nada foi gravado).
+    """
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __getattr__(self, atributo):
+        valor = getattr(aba_registrada(self.nome), atributo)
+        if not callable(valor): return valor
+        def chamada(*args, **kwargs):
+            try:
+                return valor(*args, **kwargs)
+            except gspread.exceptions.APIError as erro:
+                if not aba_sumiu(erro): raise
+                esquecer_aba(self.nome)
+                return getattr(aba_registrada(self.nome), atributo)(*args, **kwargs)
+        return chamada
+
+def pegar_aba(nome):
+    """
+    Substitui o planilha_mestre.worksheet(nome), que busca os metadados da planilha a cada chamada.
+    Usa o registro do processo (aba_registrada) e devolve a aba já pronta para se renovar se ela for recriada.
+    """
+    aba_registrada(nome) # Aba inexistente continua levantando WorksheetNotFound aqui mesmo
+    return AbaRenovavel(nome)
+
 # ==========================================
 # 🎨 2. MOTOR WHITE-LABEL (LEITURA DINÂMICA BLINDADA)
 # ==========================================
@@ -130,12 +488,135 @@ def limpar_v(v):
     numero = pd.to_numeric(str(v).replace('R$', '').replace('.', '').replace(',', '.').strip(), errors='coerce') or 0.0
     return round(numero, 2)
 
+def limpar_v_serie(serie):
+    """Versão vetorizada do limpar_v: converte a coluna inteira de uma vez ("R$ 1.234,56" -> 1234.56). Texto inválido vira 0."""
+    texto = serie.astype(str).str.replace('R$', '', regex=False).str.replace('.', '', regex=False).str.replace(',', '.', regex=False).str.strip()
+    return pd.to_numeric(texto, errors='coerce').fillna(0.0).round(2)
+
+def valores_num(df, coluna_num, coluna_texto):
+    """Usa a coluna numérica que já veio tipada da carga; se ela não existir, converte a coluna de texto na hora."""
+    if coluna_num in df.columns: return df[coluna_num]
+    return limpar_v_serie(coluna_texto)
+
 def limpar_texto(texto):
     if not isinstance(texto, str): return ""
     import unicodedata
     texto_sem_acento = unicodedata.normalize('NFD', texto).encode('ascii', 'ignore').decode("utf-8")
     return texto_sem_acento.lower().strip()
 
+# ==========================================
+# 🔎 ÍNDICE DE BUSCA (sem acento, por pedaços de até 3 letras)
+# ==========================================
+def montar_indice(textos):
+    """
+    Recebe {chave: texto} (ex: índice da linha -> "código nome") e monta um índice invertido:
+    cada pedaço de 1 a 3 letras de cada palavra aponta para as chaves que o contêm.
+    O texto é normalizado (limpar_texto) uma vez só, na montagem.
+    """
+    normalizados, pedacos = {}, {}
+    for posicao, (chave, texto) in enumerate(textos.items()):
+        limpo = limpar_texto(str(texto))
+        normalizados[chave] = (limpo, posicao)
+        for palavra in set(limpo.split()):
+            for tamanho in (1, 2, 3):
+                for i in range(len(palavra) - tamanho + 1):
+                    pedacos.setdefault(palavra[i:i + tamanho], set()).add(chave)
+    return {"textos": normalizados, "pedacos": pedacos}
+
+def buscar_no_indice(indice, consulta, limite=None):
+    """
+    Chaves que contêm todas as palavras da consulta (sem acento, em qualquer ordem), da mais relevante
+    para a menos: texto igual > começa com a consulta > alguma palavra começa com a 1ª palavra > o resto.
+    Os pedaços de 3 letras cortam os candidatos; a conferência final é por substring.
+    """
+    palavras = limpar_texto(str(consulta)).split()
+    if not palavras: return []
+    candidatos = None
+    for palavra in palavras:
+        chaves = None
+        for i in range(max(1, len(palavra) - 2)):
+            postagem = indice["pedacos"].get(palavra[i:i + 3], set())
+            chaves = postagem if chaves is None else chaves & postagem
+            if not chaves: return []
+        candidatos = chaves if candidatos is None else candidatos & chaves
+        if not candidatos: return []
+    termo = " ".join(palavras)
+    def relevancia(chave):
+        texto, posicao = indice["textos"][chave]
+        if texto == termo: return (0, posicao)
+        if texto.startswith(termo): return (1, posicao)
+        if any(p.startswith(palavras[0]) for p in texto.split()): return (2, posicao)
+        return (3, posicao)
+    achados = sorted((c for c in candidatos if all(p in indice["textos"][c][0] for p in palavras)), key=relevancia)
+    return achados[:limite] if limite else achados
+
+# ==========================================
+# 🧬 FAMÍLIAS DE LOTES (101, 101.1, 101.2...)
+# ==========================================
+def montar_familias(codigos):
+    """
+    {código base: {"lotes": [códigos do mais antigo ao mais novo], "topo": lote mais recente, "proxima": nº do próximo lote}}.
+    Sem sufixo conta como versão 0 ("101" -> base "101", versão 0; "101.2" -> versão 2).
+    """
+    familias = {}
+    for cod in codigos:
+        partes = str(cod).strip().split(".")
+        try: versao = int(partes[1]) if len(partes) > 1 else 0
+        except ValueError: versao = 0
+        familia = familias.setdefault(partes[0], {"versoes": []})
+        familia["versoes"].append((versao, cod))
+    for familia in familias.values():
+        familia["versoes"].sort(key=lambda par: par[0])
+        familia["lotes"] = [cod for _, cod in familia["versoes"]]
+        familia["topo"] = familia["lotes"][-1]
+        familia["proxima"] = familia["versoes"][-1][0] + 1
+        del familia["versoes"]
+    return familias
+
+@st.cache_resource(max_entries=3, show_spinner=False)
+def familias_produtos(versao, _codigos):
+    """Famílias do INVENTÁRIO montadas uma vez por versão dos dados."""
+    return montar_familias(_codigos)
+
+def proximo_lote(familias, cod):
+    """Código do próximo lote da família de 'cod' (ex: 101.2 -> 101.3), sem reler a família."""
+    base = str(cod).strip().split(".")[0]
+    familia = familias.get(base)
+    return f"{base}.{familia['proxima'] if familia else 1}"
+
+# ==========================================
+# 🗂️ CATÁLOGO DE OPÇÕES DOS SELECTBOX
+# ==========================================
+@st.cache_resource(max_entries=3, show_spinner=False)
+def catalogo_opcoes(versao, _bancos):
+    """Rótulos 'código - nome' de cada banco (clientes, produtos, fornecedores), montados uma vez por versão dos dados."""
+    return {
+        "rotulos": {tipo: [f"{k} - {v['nome']}" for k, v in banco.items()] for tipo, banco in _bancos.items()},
+        "variantes": {}
+    }
+
+def opcoes_catalogo(catalogo, tipo, primeira=None, ordenada=False):
+    """
+    (lista de opções, {rótulo: posição}) prontos para o selectbox, sem refazer strings nem usar .index() a cada rerun.
+    Cada combinação (primeira opção fixa, ordenada ou não) é montada uma só vez por versão: não altere a lista devolvida.
+    """
+    chave = (tipo, primeira, ordenada)
+    if chave not in catalogo["variantes"]:
+        rotulos = catalogo["rotulos"][tipo]
+        lista = ([primeira] if primeira else []) + (sorted(rotulos) if ordenada else rotulos)
+        posicoes = {}
+        for i, rotulo in enumerate(lista): posicoes.setdefault(rotulo, i) # Rótulo repetido fica com a 1ª posição, como o .index()
+        catalogo["variantes"][chave] = (lista, posicoes)
+    return catalogo["variantes"][chave]
+
+@st.cache_resource(max_entries=12, show_spinner=False)
+def indice_busca(nome, versao, _montar_textos):
+    """
+    Um índice por conjunto ('produtos', 'vendas', 'documentos'...) e por versão dos dados.
+    '_montar_textos' é uma função sem argumentos que devolve {posição: texto}: só roda quando o índice ainda não existe.
+    """
+    return montar_indice(_montar_textos())
+
 def buscar_cep_magico(cep):
     import requests
     cep_limpo = str(cep).replace("-", "").replace(".", "").strip()
@@ -239,7 +720,7 @@ if not st.session_state['autenticado']:
                 if usuario_input and senha_input:
                     with st.spinner("A verificar credenciais..."):
                         try:
-                            aba_cred = planilha_mestre.worksheet("CREDENCIAIS")
+                            aba_cred = pegar_aba("CREDENCIAIS")
                             dados_cred = aba_cred.get_all_values()
                             
                             if len(dados_cred) > 1:
@@ -278,7 +759,7 @@ if not st.session_state['autenticado']:
 # ====================================================
 if st.session_state.get('precisa_registrar_acesso'):
     try:
-        aba_usuario = planilha_mestre.worksheet("USUARIO") 
+        aba_usuario = pegar_aba("USUARIO") 
         import pytz
         from datetime import datetime
         fuso_br = pytz.timezone('America/Sao_Paulo') 
@@ -328,51 +809,735 @@ def upload_para_cloudinary(file_bytes, file_name, pasta_destino):
         st.error(f"Erro no servidor de arquivos: {e}")
         return None, None
 
-@st.cache_data(ttl=60)
-def carregar_dados():
+# ==========================================
+# ➕ LINHA TOTAIS NAS ABAS DE DADOS (OPCIONAL)
+# ==========================================
+# Com 'totais_nas_abas = false' nos secrets, as abas de dados não têm mais a linha TOTAIS no fim
+# (os totais ficam numa aba de resumo, ex: =SOMA(VENDAS!L2:L), ou são calculados no app).
+# Aí toda inclusão vira um append_rows direto (sem procurar a TOTAIS nem empurrar linhas)
+# e a carga não precisa filtrar a TOTAIS dos DataFrames. Padrão: true (planilha como sempre foi).
+def config_totais_nas_abas():
+    try: return bool(st.secrets.get("totais_nas_abas", True))
+    except Exception: return True
+
+TOTAIS_NAS_ABAS = config_totais_nas_abas()
+
+COLUNAS_ROTULO_TOTAIS = "A:F" # Onde o rótulo TOTAIS pode estar (A no INVENTÁRIO, C/D na VENDAS...)
+
+def linha_totais(linhas):
+    """Linha da planilha (1 = cabeçalho) da primeira que tem uma célula 'TOTAIS', como o antigo aba.find("TOTAIS"). None se não houver."""
+    for i, linha in enumerate(linhas):
+        if any(str(celula).strip().upper() == "TOTAIS" for celula in linha): return i + 1
+    return None
+
+def inserir_linhas_antes_totais(planilha, blocos):
+    """
+    Grava várias linhas de uma vez logo acima da linha TOTAIS de cada aba ({nome_aba: [linhas]}).
+    São sempre 3 idas ao Google, não importa quantas linhas ou abas:
+    1) as colunas A:F de todas as abas (para achar a TOTAIS: em VENDAS o rótulo fica na coluna do cliente,
+    não na A), 2) um batch_update abrindo o espaço,
+    3) um values_batch_update com os dados. Aba sem linha TOTAIS recebe as linhas no fim (append_rows).
+    Com TOTAIS_NAS_ABAS desligado, vai direto para o append_rows (uma ida ao Google por aba).
+    """
+    blocos = {nome: linhas for nome, linhas in blocos.items() if linhas}
+    if not blocos: return
+    if not TOTAIS_NAS_ABAS:
+        for nome, linhas in blocos.items():
+            pegar_aba(nome).append_rows(linhas, value_input_option='USER_ENTERED')
+        return
+    nomes = list(blocos)
+    aspas = {nome: "'" + nome.replace("'", "''") + "'" for nome in nomes}
+
+    rotulos = planilha.values_batch_get([f"{aspas[nome]}!{COLUNAS_ROTULO_TOTAIS}" for nome in nomes]).get("valueRanges", [])
+    inserir, anexar = {}, []
+    for nome, bloco in zip(nomes, rotulos):
+        linha = linha_totais(bloco.get("values", []))
+        if linha: inserir[nome] = linha
+        else: anexar.append(nome)
+
+    if inserir:
+        abrir_espaco = lambda: planilha.batch_update({"requests": [
+            {"insertDimension": {
+                "range": {"sheetId": aba_registrada(nome).id, "dimension": "ROWS", "startIndex": linha - 1, "endIndex": linha - 1 + len(blocos[nome])},
+                "inheritFromBefore": False
+            }} for nome, linha in inserir.items()
+        ]})
+        try: abrir_espaco()
+        except gspread.exceptions.APIError as erro:
+            if not aba_sumiu(erro): raise
+            esquecer_aba(*inserir) # ID velho no registro: busca as abas de novo e repete (nada foi inserido)
+            abrir_espaco()
+        planilha.values_batch_update({
+            "valueInputOption": "USER_ENTERED",
+            "data": [{"range": f"{aspas[nome]}!A{linha}", "values": blocos[nome]} for nome, linha in inserir.items()]
+        })
+
+    for nome in anexar:
+        pegar_aba(nome).append_rows(blocos[nome], value_input_option='USER_ENTERED')
+
+# Todas as abas que o carregar_dados() entrega para o sistema
+ABAS_PRINCIPAIS = [
+    "INVENTÁRIO", "VENDAS", "FINANCEIRO", "CARTEIRA DE CLIENTES", "SOCIOS", "APORTES",
+    "FORNECEDORES", "DESPESAS", "DOCUMENTOS", "MARKETING", "CREDENCIAIS", "PAINEL"
+]
+
+@st.cache_resource(show_spinner=False)
+def tempos_de_carga():
+    """Memória do processo com o tempo que cada aba levou na última carga."""
+    return {}
+
+def montar_df_aba(dados, primeira=0):
+    """
+    Transforma a matriz crua da planilha em DataFrame (sem a linha TOTAIS e sem linhas vazias).
+    O índice segue a posição na planilha (índice + 2 = linha real); 'primeira' desloca esse índice
+    quando 'dados' é só um pedaço do fim da aba.
+    """
+    if len(dados) <= 1: return pd.DataFrame()
+    df = pd.DataFrame(dados[1:], columns=dados[0], index=range(primeira, primeira + len(dados) - 1))
+    if not df.empty:
+        if TOTAIS_NAS_ABAS: df = df[~df.iloc[:, 0].astype(str).str.contains("TOTAIS", case=False, na=False)]
+        df = df[df.iloc[:, 1].astype(str).str.strip() != ""]
+    return df
+
+def ler_abas(planilha, nomes):
+    """
+    Lê várias abas de uma só vez e devolve ({nome: DataFrame}, {nome: matriz crua}).
+    1ª tentativa: um único values_batch_get com todas as abas (uma ida ao Google).
+    Se o lote falhar (ex: alguma aba não existe), cai para leituras em paralelo numa thread pool.
+    O tempo de cada aba fica registado em tempos_de_carga().
+    """
+    from gspread.utils import fill_gaps
+    matrizes, tempos = {}, {}
+
+    try:
+        inicio = time.perf_counter()
+        # Aspas simples protegem nomes com espaço/acento (e são duplicadas se o nome tiver uma)
+        intervalos = ["'" + nome.replace("'", "''") + "'" for nome in nomes]
+        resposta = planilha.values_batch_get(intervalos)
+        segundos_lote = time.perf_counter() - inicio
+        for nome, bloco in zip(nomes, resposta.get("valueRanges", [])):
+            matrizes[nome] = fill_gaps(bloco.get("values", []))
+            tempos[nome] = {"modo": "lote", "rede": segundos_lote}
+    except Exception as e:
+        print(f"Leitura em lote falhou ({e}). A ler as abas em paralelo...")
+
+        def ler_uma(nome):
+            inicio_aba = time.perf_counter()
+            try:
+                dados = pegar_aba(nome).get_all_values()
+            except Exception as e_aba:
+                print(f"Erro ao ler {nome}: {e_aba}") # Isso ajuda a avisar se a aba não existir
+                dados = []
+            return nome, dados, time.perf_counter() - inicio_aba
+
+        with ThreadPoolExecutor(max_workers=min(8, len(nomes))) as pool:
+            for nome, dados, segundos in pool.map(ler_uma, nomes):
+                matrizes[nome] = dados
+                tempos[nome] = {"modo": "paralelo", "rede": segundos}
+
+    frames = {}
+    for nome in nomes:
+        inicio = time.perf_counter()
+        try:
+            frames[nome] = montar_df_aba(matrizes.get(nome, []))
+        except Exception as e:
+            print(f"Erro ao montar {nome}: {e}")
+            frames[nome] = pd.DataFrame()
+        info = tempos.setdefault(nome, {"modo": "ausente", "rede": 0.0})
+        info["montagem"] = time.perf_counter() - inicio
+        info["linhas"] = len(frames[nome])
+
+    tempos_de_carga().update(tempos)
+    print("⏱️ Carga das abas: " + " | ".join(f"{n}: {t['rede'] + t['montagem']:.2f}s ({t['modo']})" for n, t in tempos.items()))
+    return frames, matrizes
+
+# Abas que só crescem (as linhas novas entram no fim): a sincronização busca apenas o que chegou depois da última carga
+ABAS_INCREMENTAIS = ["VENDAS", "FINANCEIRO", "LOG_AUDITORIA", "LOG_ESTOQUE", "LOG_COBRANCA"]
+RECARGA_COMPLETA = 600 # A cada 10 min as abas incrementais são relidas inteiras (pega edições feitas direto na planilha)
+JANELA_CONFERENCIA = 50 # Últimas linhas conhecidas relidas e comparadas na sincronização incremental (o resto fica para a recarga completa)
+
+def linha_de_dados(linha):
+    """Mesma regra do montar_df_aba: não é a linha TOTAIS e a 2ª coluna está preenchida."""
+    return len(linha) > 1 and "totais" not in str(linha[0]).lower() and str(linha[1]).strip() != ""
+
+def ler_abas_incremental(planilha, matrizes):
+    """
+    Recebe {nome: matriz já em memória} e busca, num único values_batch_get, só o fim de cada aba:
+    as últimas JANELA_CONFERENCIA linhas já conhecidas (até a âncora = última linha de dados) e tudo o que veio depois.
+    A janela é a conferência barata: se ela não bate com a memória (edição, exclusão ou reordenação perto do fim),
+    a aba fica de fora e segue para a carga completa. O custo não cresce com o histórico da aba.
+    Devolve {nome: (matriz_atualizada, linha_ancora)} apenas para as abas que bateram.
+    """
+    from gspread.utils import fill_gaps, rowcol_to_a1
+    planos, intervalos = {}, []
+    for nome, matriz in matrizes.items():
+        largura = len(matriz[0]) if matriz else 0
+        if largura == 0: continue
+        # Âncora = última linha de dados (a linha TOTAIS, se existir, fica abaixo dela)
+        ancora = max([i for i, linha in enumerate(matriz) if i > 0 and linha_de_dados(linha)], default=0)
+        primeira = max(1, ancora - JANELA_CONFERENCIA + 1) # Posição na matriz (posição i = linha i+1 da planilha)
+        aba = "'" + nome.replace("'", "''") + "'"
+        planos[nome] = (ancora, primeira, largura)
+        intervalos.append(f"{aba}!A{primeira + 1}:{rowcol_to_a1(1, largura)[:-1]}")
+    if not planos: return {}
+
+    try:
+        inicio = time.perf_counter()
+        blocos = planilha.values_batch_get(intervalos).get("valueRanges", [])
+        segundos = time.perf_counter() - inicio
+    except Exception as e:
+        print(f"Sincronização incremental falhou ({e}). A recarregar as abas inteiras...")
+        return {}
+
+    def completas(linhas, largura):
+        return [(list(linha) + [""] * largura)[:largura] for linha in linhas]
+
+    resultado = {}
+    for n, (nome, (ancora, primeira, largura)) in enumerate(planos.items()):
+        matriz = matrizes[nome]
+        lidas = fill_gaps(blocos[n].get("values", []), cols=largura)
+        conhecidas = ancora - primeira + 1
+        # Conferência: a janela (da 'primeira' até a âncora) continua igual à memória
+        if len(lidas) < conhecidas or completas(lidas[:conhecidas], largura) != completas(matriz[primeira:ancora + 1], largura): continue
+        nova = matriz[:primeira] + lidas
+        resultado[nome] = (nova, ancora)
+        tempos_de_carga()[nome] = {"modo": "incremental", "rede": segundos, "montagem": 0.0, "linhas": len(nova) - 1}
+    if resultado: print("⏱️ Sincronização incremental: " + ", ".join(f"{n} (+{sum(map(linha_de_dados, m[a + 1:]))})" for n, (m, a) in resultado.items()))
+    return resultado
+
+TTL_ABA = 60 # Segundos que cada aba fica em memória antes de voltar ao Google
+
+@st.cache_resource(show_spinner=False)
+def memoria_abas():
+    """
+    Memória do processo: DataFrame, hora da carga e versão de cada aba (sobrevive aos reruns).
+    'carregado_em' controla o TTL; 'dados_de' é a idade real do conteúdo (a da réplica, se veio do disco).
+    """
+    return {"frames": {}, "matrizes": {}, "carregado_em": {}, "dados_de": {}, "completa_em": {}, "versoes": {}, "da_replica": set(), "geracao": {}, "caudas": {}, "em_voo": {}, "coalescidas": 0, "trava": threading.Lock()}
+
+def invalidar(*nomes, completo=False):
+    """
+    Marca só as abas que foram escritas como desatualizadas.
+    Ex: invalidar("VENDAS", "INVENTÁRIO") depois de uma venda — as outras abas e a conexão continuam em memória.
+    Use completo=True quando linhas foram editadas ou apagadas: a próxima carga relê a aba inteira
+    em vez de buscar só as linhas novas.
+    """
+    memoria = memoria_abas()
+    with memoria["trava"]:
+        for nome in nomes:
+            memoria["carregado_em"].pop(nome, None)
+            if completo: memoria["matrizes"].pop(nome, None)
+            memoria["versoes"][nome] = memoria["versoes"].get(nome, 0) + 1
+
+def versao_abas():
+    """Assinatura das versões atuais. Muda quando alguma aba é invalidada ou quando chega dado novo do Google."""
+    memoria = memoria_abas()
+    return tuple((memoria["versoes"].get(nome, 0), memoria["geracao"].get(nome, 0)) for nome in ABAS_PRINCIPAIS)
+
+# ==========================================
+# 💾 RÉPLICA LOCAL (SQLite) - OPCIONAL
+# ==========================================
+# Liga com 'replica_sqlite = "caminho/arquivo.db"' nos secrets (ou a variável de ambiente SWEET_REPLICA_SQLITE).
+# Toda aba que chega do Google é espelhada no arquivo; quando o servidor reinicia, as telas abrem
+# na hora com a réplica e o Google só é consultado depois do TTL. As gravações continuam indo
+# para a planilha e voltam para a réplica na recarga seguinte (invalidar + obter_abas).
+def caminho_replica():
+    try: return str(st.secrets.get("replica_sqlite", os.environ.get("SWEET_REPLICA_SQLITE", "")))
+    except Exception: return os.environ.get("SWEET_REPLICA_SQLITE", "")
+
+@st.cache_resource(show_spinner=False)
+def replica_local():
+    """Conexão única com a réplica SQLite do processo (None quando a réplica está desligada)."""
+    caminho = caminho_replica()
+    if not caminho: return None
+    try:
+        conexao = sqlite3.connect(caminho, check_same_thread=False)
+        conexao.execute("CREATE TABLE IF NOT EXISTS abas (nome TEXT PRIMARY KEY, matriz TEXT NOT NULL, atualizado_em REAL NOT NULL)")
+        conexao.commit()
+        return {"conexao": conexao, "trava": threading.Lock()}
+    except Exception as e:
+        print(f"Réplica local indisponível ({e}). Seguindo só com o Google.")
+        return None
+
+def gravar_replica(matrizes):
+    """Espelha as matrizes cruas recém-lidas ({nome: matriz}) no arquivo local."""
+    replica = replica_local()
+    if replica is None or not matrizes: return
+    agora = time.time()
+    try:
+        with replica["trava"], replica["conexao"]:
+            replica["conexao"].executemany(
+                "INSERT OR REPLACE INTO abas (nome, matriz, atualizado_em) VALUES (?, ?, ?)",
+                [(nome, json.dumps(matriz, ensure_ascii=False), agora) for nome, matriz in matrizes.items() if matriz]
+            )
+    except Exception as e:
+        print(f"Erro ao gravar a réplica local: {e}")
+
+def ler_replica(nomes):
+    """Devolve {nome: (matriz, atualizado_em)} das abas que existem na réplica."""
+    replica = replica_local()
+    if replica is None or not nomes: return {}
+    try:
+        with replica["trava"]:
+            linhas = replica["conexao"].execute(
+                f"SELECT nome, matriz, atualizado_em FROM abas WHERE nome IN ({','.join('?' * len(nomes))})", list(nomes)
+            ).fetchall()
+        return {nome: (json.loads(matriz), atualizado_em) for nome, matriz, atualizado_em in linhas}
+    except Exception as e:
+        print(f"Erro ao ler a réplica local: {e}")
+        return {}
+
+def atualizar_abas(vencidas):
+    """Busca no Google as abas pedidas (só as linhas novas quando possível) e guarda na memória do processo."""
+    memoria = memoria_abas()
+    agora = time.time()
+    versoes_antes = {n: memoria["versoes"].get(n, 0) for n in vencidas}
+    novas, matrizes = {}, {}
+
+    # 📈 Abas que só crescem e já estão em memória: busca apenas as linhas novas
+    candidatas = {
+        n: memoria["matrizes"][n] for n in vencidas
+        if n in ABAS_INCREMENTAIS and n in memoria["matrizes"] and agora - memoria["completa_em"].get(n, 0) < RECARGA_COMPLETA
+    }
+    for nome, (matriz, ancora) in ler_abas_incremental(planilha_mestre, candidatas).items():
+        antiga = memoria["frames"].get(nome, pd.DataFrame())
+        linhas_novas = montar_df_aba([matriz[0]] + matriz[ancora + 1:], primeira=ancora)
+        if antiga.empty: novas[nome] = linhas_novas
+        elif linhas_novas.empty: novas[nome] = antiga
+        else: novas[nome] = pd.concat([antiga, linhas_novas])
+        matrizes[nome] = matriz
+
+    completas = [n for n in vencidas if n not in novas]
+    if completas:
+        frames, brutos = ler_abas(planilha_mestre, completas)
+        novas.update(frames)
+        matrizes.update(brutos)
+
+    with memoria["trava"]:
+        for nome, df in novas.items():
+            # A 'geração' só avança quando chegou dado novo: é ela que renova o carregar_dados()
+            if matrizes.get(nome, []) != memoria["matrizes"].get(nome):
+                memoria["geracao"][nome] = memoria["geracao"].get(nome, 0) + 1
+            memoria["frames"][nome] = df
+            memoria["matrizes"][nome] = matrizes.get(nome, [])
+            memoria["dados_de"][nome] = time.time()
+            if nome in completas: memoria["completa_em"][nome] = time.time()
+            # Se alguém escreveu na aba durante a leitura, ela continua marcada como vencida
+            if memoria["versoes"].get(nome, 0) == versoes_antes[nome]:
+                memoria["carregado_em"][nome] = time.time()
+    gravar_replica(matrizes)
+
+def atualizar_abas_unico(vencidas):
+    """
+    Single-flight do atualizar_abas: se outra sessão (ou o sincronizador) já está buscando alguma dessas
+    abas, espera essa busca terminar em vez de ir ao Google de novo; só as abas que ninguém está buscando
+    saem daqui. Cada pedido que pegou carona numa busca alheia soma 1 em memoria["coalescidas"].
+    """
+    memoria = memoria_abas()
+    sinal = threading.Event()
+    with memoria["trava"]:
+        minhas = [n for n in vencidas if n not in memoria["em_voo"]]
+        alheias = {memoria["em_voo"][n] for n in vencidas if n in memoria["em_voo"]}
+        for nome in minhas: memoria["em_voo"][nome] = sinal
+        if alheias: memoria["coalescidas"] += 1
+    try:
+        if minhas: atualizar_abas(minhas)
+    finally:
+        with memoria["trava"]:
+            for nome in minhas: memoria["em_voo"].pop(nome, None)
+        sinal.set()
+    for outra_busca in alheias: outra_busca.wait(timeout=60)
+
+def aba_vencida(memoria, nome, agora):
+    """Com o sincronizador rodando só conta a invalidação; sem ele, vale o TTL_ABA."""
+    if sincronizador_ativo(): return nome not in memoria["carregado_em"]
+    return agora - memoria["carregado_em"].get(nome, 0) > TTL_ABA
+
+def obter_abas(nomes):
+    """Devolve {nome: DataFrame} indo ao Google apenas pelas abas vencidas ou invalidadas."""
+    memoria = memoria_abas()
+    agora = time.time()
+
+    # 💾 Processo recém-iniciado: as abas que ainda não estão em memória vêm da réplica local, sem esperar o Google
+    virgens = [n for n in nomes if n not in memoria["matrizes"] and n not in memoria["da_replica"]]
+    if virgens and replica_local() is not None:
+        copias = ler_replica(virgens)
+        with memoria["trava"]:
+            memoria["da_replica"].update(virgens)
+            for nome, (matriz, atualizado_em) in copias.items():
+                if nome in memoria["matrizes"]: continue
+                memoria["frames"][nome] = montar_df_aba(matriz)
+                memoria["matrizes"][nome] = matriz
+                memoria["carregado_em"][nome] = agora # Servida já, como se fosse fresca (o Google só depois do TTL)...
+                memoria["dados_de"][nome] = atualizado_em # ...mas a idade mostrada na tela é a da réplica
+                memoria["completa_em"][nome] = atualizado_em
+        if copias: print(f"💾 Réplica local: {', '.join(copias)} carregadas do disco.")
+
+    # 🔄 Com o sincronizador rodando, aba só vencida pelo tempo é servida como está (ele renova em segundo plano).
+    # Aba invalidada por uma gravação ou que nunca foi lida vai ao Google na hora.
+    vencidas = [n for n in nomes if aba_vencida(memoria, n, agora)]
+    if vencidas: atualizar_abas_unico(vencidas)
+    return {n: memoria["frames"].get(n, pd.DataFrame()) for n in nomes}
+
+def matriz_aba(nome):
+    """Matriz crua da aba (cabeçalho + linhas, posição i = linha i+1 da planilha), servida da mesma memória do obter_abas."""
+    obter_abas([nome])
+    return memoria_abas()["matrizes"].get(nome, [])
+
+def fim_conhecido(memoria, nome):
+    """Última linha com dados que a memória já conhece (cauda anterior, matriz ou DataFrame), ou None."""
+    if nome in memoria["caudas"]: return memoria["caudas"][nome]["total"]
+    if nome in memoria["matrizes"]: return len(memoria["matrizes"][nome])
+    df = memoria["frames"].get(nome)
+    if df is not None and not df.empty: return int(df.index.max()) + 2
+    return None
+
+def inicio_da_cauda(nome, n, folga):
+    """Mede numa leitura estreita (colunas A:C — em VENDAS a A vem vazia) onde começam as últimas 'n' linhas preenchidas."""
+    aba = "'" + nome.replace("'", "''") + "'"
+    colunas = planilha_mestre.values_get(f"{aba}!A:C").get("values", [])
+    cheias = [i + 1 for i, linha in enumerate(colunas) if i > 0 and any(str(v).strip() for v in linha)]
+    return cheias[-(n + folga)] if len(cheias) > n + folga else 2
+
+def cauda_aba(nome, n):
+    """
+    Últimas 'n' linhas de dados da aba (DataFrame com índice + 2 = linha real) para os painéis de "Últimas N".
+    Se a aba inteira já está fresca na memória, corta dela. Senão faz um único values_batch_get com o
+    cabeçalho + um intervalo aberto a partir da última linha que a memória conhece (ex: 'LOG_AUDITORIA'!A4981:ZZ),
+    então o custo não cresce com o tamanho da planilha. Sem nada na memória (ou se a janela vier curta porque
+    linhas foram apagadas), mede o fim numa leitura só das colunas A:C antes.
+    """
+    from gspread.utils import fill_gaps
+    memoria = memoria_abas()
+    agora = time.time()
+    if nome in memoria["frames"] and not aba_vencida(memoria, nome, agora):
+        return memoria["frames"][nome].tail(n)
+
+    caudas = memoria["caudas"]
+    versao = memoria["versoes"].get(nome, 0)
+    guardada = caudas.get(nome)
+    if guardada and guardada["versao"] == versao and guardada["n"] >= n and agora - guardada["lida_em"] <= TTL_ABA:
+        return guardada["df"].tail(n)
+
+    aba = "'" + nome.replace("'", "''") + "'"
+    folga = 10
+    fim = fim_conhecido(memoria, nome)
+    inicio = max(2, fim - n - folga) if fim else inicio_da_cauda(nome, n, folga)
+    for medida in (bool(fim), False):
+        blocos = planilha_mestre.values_batch_get([f"{aba}!1:1", f"{aba}!A{inicio}:ZZ"]).get("valueRanges", [])
+        cabecalho = blocos[0].get("values", [[]])[0]
+        linhas = fill_gaps(blocos[1].get("values", []), cols=len(cabecalho)) if cabecalho else []
+        linhas = [linha[:len(cabecalho)] for linha in linhas]
+        df = montar_df_aba([cabecalho] + linhas, primeira=inicio - 2)
+        # Janela curta com a estimativa da memória (linhas apagadas): mede o fim de verdade e lê uma vez mais
+        if len(df) >= n or inicio == 2 or not medida: break
+        inicio = inicio_da_cauda(nome, n, folga)
+    caudas[nome] = {"df": df, "n": n, "versao": versao, "lida_em": agora, "total": inicio + len(linhas) - 1}
+    return df.tail(n)
+
+def linha_confere(aba, linha_real, esperada, colunas=6):
+    """
+    Antes de editar/apagar uma linha escolhida na memória, confere no Google se ela ainda é a mesma
+    (as primeiras colunas batem). Se a aba mudou desde a leitura, a gravação não acontece.
+    """
+    atual = aba.row_values(linha_real)[:colunas]
+    atual += [""] * (colunas - len(atual))
+    alvo = list(esperada[:colunas]) + [""] * (colunas - len(esperada[:colunas]))
+    return [str(v).strip() for v in atual] == [str(v).strip() for v in alvo]
+
+# ==========================================
+# 🔄 SINCRONIZADOR EM SEGUNDO PLANO (stale-while-revalidate)
+# ==========================================
+INTERVALO_SINCRONIA = 30 # Segundos entre uma volta e outra do sincronizador
+
+@st.cache_resource(show_spinner=False)
+def sincronizador():
+    """
+    Thread única por processo que renova em segundo plano as abas já lidas cujo TTL venceu.
+    Assim nenhum usuário paga a recarga: as telas sempre recebem o último retrato bom na hora.
+    """
+    estado = {"ultima_volta": 0.0, "erro": "", "thread": None}
+
+    def trabalhar():
+        while True:
+            time.sleep(INTERVALO_SINCRONIA)
+            try:
+                memoria = memoria_abas()
+                agora = time.time()
+                vencidas = [n for n in list(memoria["frames"]) if agora - memoria["carregado_em"].get(n, 0) > TTL_ABA]
+                if vencidas: atualizar_abas_unico(vencidas)
+                estado["ultima_volta"], estado["erro"] = time.time(), ""
+            except Exception as e:
+                estado["erro"] = str(e)
+                print(f"Sincronizador: erro ao renovar as abas ({e}). Nova tentativa na próxima volta.")
+
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    thread = threading.Thread(target=trabalhar, name="sincronizador_sweet", daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx()) # Permite usar os cache_resource de dentro da thread
+    thread.start()
+    estado["thread"] = thread
+    return estado
+
+def sincronizador_ativo():
+    """True quando a thread de sincronização deste processo está viva."""
+    if not planilha_mestre: return False
+    thread = sincronizador()["thread"]
+    return thread is not None and thread.is_alive()
+
+def idade_dos_dados():
+    """Segundos desde o dado mais antigo entre as abas principais em memória (None se nada carregado). Aba vinda da réplica conta a idade dela."""
+    dados_de = memoria_abas()["dados_de"]
+    momentos = [dados_de[n] for n in ABAS_PRINCIPAIS if n in dados_de]
+    return time.time() - min(momentos) if momentos else None
+
+# ==========================================
+# 🧮 VENDAS CALCULADAS NO APP (OPCIONAL)
+# ==========================================
+# Com 'vendas_calculadas = true' nos secrets, as linhas novas da VENDAS não levam mais as fórmulas
+# INDIRETO/HOJE nas colunas K, L, M, N, R, U e X (voláteis: a planilha recalcula todas a cada edição).
+# O app grava os valores prontos (venda, abatimento, estorno e correção) e refaz as contas na carga,
+# o que mantém os dias de atraso sempre do dia. Padrão: false (fórmulas na planilha, como sempre foi).
+def config_vendas_calculadas():
+    try: return bool(st.secrets.get("vendas_calculadas", False))
+    except Exception: return False
+
+VENDAS_CALCULADAS = config_vendas_calculadas()
+
+def dias_de_atraso(vencimento, status):
+    """Coluna X: vazio sem vencimento, 0 se 'Pago'/'Em dia', senão os dias corridos desde o vencimento."""
+    if str(vencimento).strip() in ["", "-"]: return ""
+    if str(status).strip() in ["Pago", "Em dia"]: return 0
+    try: return max(0, (datetime.now().date() - datetime.strptime(str(vencimento).strip(), "%d/%m/%Y").date()).days)
+    except ValueError: return ""
+
+def calcular_venda(custo, qtd, preco, desc_perc, parcelado, pago, vencimento="", status=""):
+    """As mesmas contas das fórmulas da VENDAS, para gravar valores: {coluna: valor} de K, L, M, N, R, U e X."""
+    k = round(preco * (1 - desc_perc), 2)
+    l = round(qtd * k, 2)
+    m = round(l - qtd * custo, 2)
+    return {
+        "K": k, "L": l, "M": m, "N": m / l if l else "",
+        "R": l if parcelado == "Não" else 0,
+        "U": 0 if str(parcelado).strip().lower() == "não" else round(max(0, l - pago), 2),
+        "X": dias_de_atraso(vencimento, status),
+    }
+
+def formatar_brl_serie(serie):
+    return serie.map(lambda v: f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+
+def calcular_colunas_vendas(df):
+    """
+    Versão vetorizada do calcular_venda para a carga: refaz K, L, M, N, R, U e X (por posição) a partir
+    de G (custo), H (qtd), I (preço), J (desconto %), P (parcelado), T (pago), V (vencimento) e W (status).
+    Os resultados voltam como texto no formato da planilha ("R$ 1.234,56"), igual ao que o resto do app lê.
+    """
+    if df.empty or df.shape[1] < 23: return df
+    df = df.copy()
+    col = df.columns
+    texto_desc = df[col[9]].astype(str)
+    desc = limpar_v_serie(texto_desc.str.replace('%', '', regex=False))
+    desc = desc.where(~texto_desc.str.contains('%', regex=False), desc / 100)
+    qtd = pd.to_numeric(df[col[7]].astype(str).str.replace(',', '.', regex=False), errors='coerce').fillna(0.0)
+    custo, preco, pago = limpar_v_serie(df[col[6]]), limpar_v_serie(df[col[8]]), limpar_v_serie(df[col[19]])
+    parcelado = df[col[15]].astype(str).str.strip()
+
+    k = (preco * (1 - desc)).round(2)
+    l = (qtd * k).round(2)
+    m = (l - qtd * custo).round(2)
+    com_valor = df[col[7]].astype(str).str.strip() != ""
+    df.loc[com_valor, col[10]] = formatar_brl_serie(k[com_valor])
+    df.loc[com_valor, col[11]] = formatar_brl_serie(l[com_valor])
+    df.loc[com_valor, col[12]] = formatar_brl_serie(m[com_valor])
+    margem = (m / l.where(l != 0)).map(lambda v: "" if pd.isna(v) else f"{v * 100:.2f}%".replace(".", ","))
+    df.loc[com_valor, col[13]] = margem[com_valor]
+    df.loc[com_valor, col[17]] = formatar_brl_serie(l.where(parcelado == "Não", 0.0)[com_valor])
+    saldo = (l - pago).clip(lower=0).round(2).where(parcelado.str.lower() != "não", 0.0)
+    df.loc[com_valor, col[20]] = formatar_brl_serie(saldo[com_valor])
+    if df.shape[1] > 23:
+        texto_venc = df[col[21]].astype(str).str.strip()
+        vencimento = pd.to_datetime(texto_venc, format="%d/%m/%Y", errors="coerce")
+        atraso = (pd.Timestamp(datetime.now().date()) - vencimento).dt.days.clip(lower=0)
+        # Igual ao dias_de_atraso: sem vencimento fica vazio mesmo se 'Pago'/'Em dia'
+        quitada = df[col[22]].astype(str).str.strip().isin(["Pago", "Em dia"]) & ~texto_venc.isin(["", "-"])
+        atraso = atraso.where(~quitada, 0)
+        df[col[23]] = atraso.map(lambda v: "" if pd.isna(v) else str(int(v)))
+    return df
+
+# ==========================================
+# 📦 VENDIDOS POR PRODUTO CONTADOS NO APP (OPCIONAL)
+# ==========================================
+# Com 'vendidos_calculados = true' nos secrets, a Coluna G (Vendidos) do INVENTÁRIO deixa de ter o
+# SOMASE(VENDAS!E:E; ...) por linha (a planilha recalculava produtos x vendas a cada edição).
+# A contagem sai de um único groupby da VENDAS: na carga ela corrige o DataFrame do estoque, e a cada
+# venda/correção só as células que mudaram são gravadas, num único batch_update. Padrão: false.
+def config_vendidos_calculados():
+    try: return bool(st.secrets.get("vendidos_calculados", False))
+    except Exception: return False
+
+VENDIDOS_CALCULADOS = config_vendidos_calculados()
+
+def numero_serie(serie):
+    """Quantidades da planilha ("2", "1,5") em float; vazio/inválido vira 0."""
+    return pd.to_numeric(serie.astype(str).str.strip().str.replace(',', '.', regex=False), errors='coerce').fillna(0.0)
+
+def vendidos_por_sku(df_vendas):
+    """{código do produto: quantidade vendida} = SOMASE(VENDAS!E:E; código; VENDAS!H:H), de uma vez só."""
+    if df_vendas.empty or df_vendas.shape[1] < 8: return {}
+    codigos = df_vendas.iloc[:, 4].astype(str).str.strip()
+    return numero_serie(df_vendas.iloc[:, 7]).groupby(codigos).sum().to_dict()
+
+def aplicar_vendidos(df_inv, vendidos):
+    """Cópia do INVENTÁRIO com G (vendidos) e H (estoque = C - G) refeitos a partir da contagem."""
+    if df_inv.empty or df_inv.shape[1] < 8: return df_inv
+    df_inv = df_inv.copy()
+    col = df_inv.columns
+    vendidos_linha = df_inv[col[0]].astype(str).str.strip().map(vendidos).fillna(0.0)
+    estoque = numero_serie(df_inv[col[2]]) - vendidos_linha
+    como_texto = lambda v: str(int(v)) if float(v).is_integer() else str(v).replace('.', ',')
+    df_inv[col[6]] = vendidos_linha.map(como_texto)
+    df_inv[col[7]] = estoque.map(como_texto)
+    return df_inv
+
+def recontar_vendidos(skus=None):
+    """
+    Grava na Coluna G do INVENTÁRIO a contagem atual das VENDAS. 'skus' limita a conta a esses códigos.
+    ⚠️ Quem acabou de gravar em VENDAS chama invalidar("VENDAS") antes: a conta sai sempre de uma leitura
+    fresca, nunca de 'memória + carrinho' (a aba pode já ter sido recarregada e o carrinho contaria 2x).
+    Só as células diferentes do que a planilha mostra são enviadas, num único batch_update.
+    """
+    try:
+        abas = obter_abas(["VENDAS", "INVENTÁRIO"])
+        df_inv = abas["INVENTÁRIO"]
+        if df_inv.empty or df_inv.shape[1] < 8: return
+        vendidos = vendidos_por_sku(abas["VENDAS"])
+        codigos = df_inv.iloc[:, 0].astype(str).str.strip()
+        alvo = codigos.map(vendidos).fillna(0.0)
+        muda = alvo != numero_serie(df_inv.iloc[:, 6])
+        if skus is not None: muda &= codigos.isin([str(c).strip() for c in skus])
+        atualizacoes = [{"range": f"G{idx + 2}", "values": [[float(v)]]} for idx, v in alvo[muda].items()]
+        if atualizacoes: pegar_aba("INVENTÁRIO").batch_update(atualizacoes, value_input_option='USER_ENTERED')
+    except Exception as e:
+        print(f"Falha ao atualizar os vendidos do INVENTÁRIO: {e}")
+
+# 💰 Colunas em R$ convertidas em número uma única vez, na carga.
+# {aba: [(coluna numérica criada, nomes possíveis da coluna de texto, posição reserva)]}
+COLUNAS_MONETARIAS = {
+    "VENDAS": [("VALOR_NUM", ["TOTAL R$"], 11), ("LUCRO_NUM", ["LUCRO", "LUCRO R$"], 12), ("PAGO_NUM", ["VALOR PAGO"], 19), ("SALDO_NUM", ["SALDO DEVEDOR"], 20)],
+    "INVENTÁRIO": [("CUSTO_NUM", ["CUSTO UNITÁRIO R$"], 3), ("VENDA_NUM", ["VALOR DE VENDA"], 8)],
+    "DESPESAS": [("VALOR_NUM", ["VALOR R$"], 4)],
+    "APORTES": [("VALOR_NUM", ["VALOR_R$"], None)],
+}
+COLUNAS_TIPADAS = {coluna for regras in COLUNAS_MONETARIAS.values() for coluna, _, _ in regras}
+
+def tipar_colunas_monetarias(df, regras):
+    """Devolve uma cópia do DataFrame com as colunas *_NUM (float) acrescentadas no fim (as posições originais não mudam)."""
+    if df.empty or not regras: return df
+    df = df.copy()
+    largura = len(df.columns)
+    nomes = {str(c).strip().upper(): c for c in df.columns}
+    for coluna_num, candidatas, posicao in regras:
+        origem = next((nomes[n] for n in candidatas if n in nomes), None)
+        if origem is not None: df[coluna_num] = limpar_v_serie(df[origem])
+        elif posicao is not None and posicao < largura: df[coluna_num] = limpar_v_serie(df.iloc[:, posicao])
+    return df
+
+def colunas_em_listas(df, *posicoes):
+    """Colunas (pela posição) como listas Python, para montar dicionários com zip em vez de iterrows."""
+    return [df.iloc[:, p].tolist() for p in posicoes]
+
+def sem_colunas_tipadas(df):
+    """Tira as colunas *_NUM da carga (para exibir a aba como está na planilha ou exportar backup)."""
+    return df.drop(columns=[c for c in df.columns if c in COLUNAS_TIPADAS])
+
+# ==========================================
+# 🛡️ BACKUP EM ZIP (SOB DEMANDA, EM SEGUNDO PLANO)
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def fabrica_backup():
+    """Memória do processo com o último ZIP de backup montado (vale para uma versão dos dados)."""
+    return {"versao": None, "arquivo": None, "erro": "", "thread": None, "trava": threading.Lock()}
+
+def montar_zip_backup(fabrica, versao, abas):
+    """Corpo da thread: um CSV por aba dentro de um único ZIP comprimido."""
+    try:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+            for nome, df in abas.items():
+                if not df.empty: arquivo_zip.writestr(f"Backup_{nome}.csv", sem_colunas_tipadas(df).to_csv(index=False))
+        with fabrica["trava"]:
+            fabrica["versao"], fabrica["arquivo"], fabrica["erro"] = versao, buffer.getvalue(), ""
+    except Exception as e:
+        print(f"🛡️ Falha ao montar o backup: {e}")
+        with fabrica["trava"]: fabrica["erro"] = str(e)
+
+def pedir_backup(versao, abas):
+    """Começa a montar o ZIP da versão pedida numa thread (se ele já não estiver pronto ou sendo montado)."""
+    fabrica = fabrica_backup()
+    with fabrica["trava"]:
+        if fabrica["versao"] == versao and fabrica["arquivo"]: return
+        if fabrica["thread"] is not None and fabrica["thread"].is_alive(): return
+        thread = threading.Thread(target=montar_zip_backup, args=(fabrica, versao, abas), name="backup_zip", daemon=True)
+        fabrica["thread"] = thread
+        thread.start()
+
+def backup_montando():
+    thread = fabrica_backup()["thread"]
+    return thread is not None and thread.is_alive()
+
+@st.cache_resource(ttl=60, max_entries=3, show_spinner=False)
+def carregar_dados(versao):
+    """
+    Foto única e compartilhada dos dados (todas as sessões recebem os MESMOS objetos, sem cópia por rerun).
+    A 'versao' muda a cada gravação/dado novo e gera uma foto nova; as antigas saem pelo max_entries.
+    ⚠️ Os DataFrames e dicionários devolvidos são só de leitura: quem precisar alterar, faz .copy() antes.
+    """
     # 💡 CORREÇÃO 1: Agora ele retorna 15 variáveis certinhas (adicionado mais um pd.DataFrame vazio para df_cred)
     if not planilha_mestre: 
         return {}, {}, pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}, pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
     
-    def ler_aba_seguro(nome):
-        try:
-            aba = planilha_mestre.worksheet(nome)
-            dados = aba.get_all_values()
-            if len(dados) <= 1: return pd.DataFrame()
-            df = pd.DataFrame(dados[1:], columns=dados[0])
-            if not df.empty:
-                df = df[~df.iloc[:, 0].astype(str).str.contains("TOTAIS", case=False, na=False)]
-                df = df[df.iloc[:, 1].astype(str).str.strip() != ""]
-            return df
-        except Exception as e: 
-            print(f"Erro ao ler {nome}: {e}") # Isso ajuda a avisar se a aba não existir
-            return pd.DataFrame()
-
-    df_inv = ler_aba_seguro("INVENTÁRIO")
-    df_cli = ler_aba_seguro("CARTEIRA DE CLIENTES")
-    df_fin = ler_aba_seguro("FINANCEIRO")
-    df_vendas = ler_aba_seguro("VENDAS")
-    df_painel = ler_aba_seguro("PAINEL")
+    # 🚀 UMA ÚNICA IDA AO GOOGLE, SÓ PARA AS ABAS QUE MUDARAM (a 'versao' só serve de chave do cache)
+    abas = obter_abas(ABAS_PRINCIPAIS)
+    if VENDAS_CALCULADAS: abas["VENDAS"] = calcular_colunas_vendas(abas["VENDAS"])
+    if VENDIDOS_CALCULADOS: abas["INVENTÁRIO"] = aplicar_vendidos(abas["INVENTÁRIO"], vendidos_por_sku(abas["VENDAS"]))
+    abas = {nome: tipar_colunas_monetarias(df, COLUNAS_MONETARIAS.get(nome)) for nome, df in abas.items()}
+
+    df_inv = abas["INVENTÁRIO"]
+    df_cli = abas["CARTEIRA DE CLIENTES"]
+    df_fin = abas["FINANCEIRO"]
+    df_vendas = abas["VENDAS"]
+    df_painel = abas["PAINEL"]
     
     # NOVAS ABAS CORPORATIVAS
-    df_socios = ler_aba_seguro("SOCIOS")
-    df_aportes = ler_aba_seguro("APORTES")
-    df_fornecedores = ler_aba_seguro("FORNECEDORES")
-    df_despesas = ler_aba_seguro("DESPESAS")
-    df_docs = ler_aba_seguro("DOCUMENTOS")
-    df_marketing = ler_aba_seguro("MARKETING")
+    df_socios = abas["SOCIOS"]
+    df_aportes = abas["APORTES"]
+    df_fornecedores = abas["FORNECEDORES"]
+    df_despesas = abas["DESPESAS"]
+    df_docs = abas["DOCUMENTOS"]
+    df_marketing = abas["MARKETING"]
     
     # 💡 ABA ADICIONADA PARA O VENDEDOR DINÂMICO
-    df_cred = ler_aba_seguro("CREDENCIAIS")
-
-    banco_prod = {str(r.iloc[0]): {"nome": r.iloc[1], "custo": float(limpar_v(r.iloc[3])), "estoque": r.iloc[7], "venda": r.iloc[8]} for _, r in df_inv.iterrows()} if not df_inv.empty else {}
-    banco_cli = {str(r.iloc[0]): {"nome": str(r.iloc[1]), "fone": str(r.iloc[2])} for _, r in df_cli.iterrows()} if not df_cli.empty else {}
-    banco_forn = {str(r.iloc[0]): {"nome": str(r.iloc[1])} for _, r in df_fornecedores.iterrows()} if not df_fornecedores.empty else {}
+    df_cred = abas["CREDENCIAIS"]
+
+    # ⚡ Dicionários montados coluna a coluna (zip de listas), sem iterrows: o custo já vem em número da tipagem da carga
+    banco_prod, banco_cli, banco_forn = {}, {}, {}
+    if not df_inv.empty:
+        custos = valores_num(df_inv, "CUSTO_NUM", df_inv.iloc[:, 3]).tolist()
+        cods, nomes, estoques, vendas = colunas_em_listas(df_inv, 0, 1, 7, 8)
+        banco_prod = {str(c): {"nome": n, "custo": float(cu), "estoque": e, "venda": v} for c, n, cu, e, v in zip(cods, nomes, custos, estoques, vendas)}
+    if not df_cli.empty:
+        cods, nomes, fones = colunas_em_listas(df_cli, 0, 1, 2)
+        banco_cli = {str(c): {"nome": str(n), "fone": str(f)} for c, n, f in zip(cods, nomes, fones)}
+    if not df_fornecedores.empty:
+        cods, nomes = colunas_em_listas(df_fornecedores, 0, 1)
+        banco_forn = {str(c): {"nome": str(n)} for c, n in zip(cods, nomes)}
 
     # Retornando TUDO (15 itens agora)
     return banco_prod, banco_cli, df_inv, df_fin, df_vendas, df_painel, df_cli, df_socios, df_aportes, df_docs, banco_forn, df_fornecedores, df_despesas, df_marketing, df_cred
 
-banco_de_produtos, banco_de_clientes, df_full_inv, df_financeiro, df_vendas_hist, df_painel_resumo, df_clientes_full, df_socios, df_aportes, df_docs, banco_de_fornecedores, df_fornecedores, df_despesas, df_marketing, df_cred = carregar_dados()
+banco_de_produtos, banco_de_clientes, df_full_inv, df_financeiro, df_vendas_hist, df_painel_resumo, df_clientes_full, df_socios, df_aportes, df_docs, banco_de_fornecedores, df_fornecedores, df_despesas, df_marketing, df_cred = carregar_dados(versao_abas())
+catalogo = catalogo_opcoes(versao_abas(), {"clientes": banco_de_clientes, "produtos": banco_de_produtos, "fornecedores": banco_de_fornecedores})
+
+if planilha_mestre: gerente_varredura() # Retoma a varredura Odoo interrompida por um reinício do servidor
 
 with st.sidebar:
     try: st.image(LOGO_URL, use_container_width=True)
@@ -389,7 +1554,7 @@ with st.sidebar:
             if st.form_submit_button("Atualizar 🔒", type="primary"):
                 if nova_senha_user:
                     try:
-                        aba_cred_senha = planilha_mestre.worksheet("CREDENCIAIS")
+                        aba_cred_senha = pegar_aba("CREDENCIAIS")
                         # Procura a linha do usuário logado na Coluna A (1)
                         celula_eu = aba_cred_senha.find(st.session_state.get('usuario_logado'), in_column=1)
                         # Atualiza a senha na Coluna C (3)
@@ -435,14 +1600,39 @@ with st.sidebar:
     st.divider()
     modo_teste = st.toggle("🔬 Modo de Teste", value=False, key="toggle_teste")
     
+    # 🕒 Idade do retrato que está na tela (o sincronizador renova em segundo plano)
+    segundos_dados = idade_dos_dados()
+    if segundos_dados is not None:
+        texto_idade = f"{int(segundos_dados)}s" if segundos_dados < 120 else f"{int(segundos_dados // 60)} min"
+        st.caption(f"🕒 Dados atualizados há {texto_idade}" + ("" if sincronizador_ativo() else " · sincronizador parado"))
+
     if st.button("🔄 Sincronizar Planilha", key="btn_sincronizar"):
-        st.cache_data.clear()
-        st.cache_resource.clear() # Deixe os dois para garantir uma limpeza profunda!
+        invalidar(*ABAS_PRINCIPAIS, *ABAS_INCREMENTAIS, *memoria_abas()["frames"], completo=True)
+        esquecer_aba() # Abas apagadas/recriadas na planilha são buscadas de novo
+        st.cache_data.clear(); carregar_dados.clear() # A conexão com o Google é mantida
         st.rerun()
 
+    # ⏱️ DIAGNÓSTICO: quanto tempo cada aba levou para chegar do Google (só para o Admin)
+    if nivel_atual in ['Admin', 'Admin (Acesso Total)'] and tempos_de_carga():
+        with st.expander("⏱️ Desempenho da Última Carga"):
+            df_tempos = pd.DataFrame([
+                {"ABA": nome, "MODO": t["modo"], "REDE (s)": round(t["rede"], 2), "MONTAGEM (s)": round(t["montagem"], 3), "LINHAS": t["linhas"]}
+                for nome, t in tempos_de_carga().items()
+            ])
+            st.dataframe(df_tempos, hide_index=True, use_container_width=True)
+            st.caption(f"🤝 Leituras que esperaram uma busca já em andamento (em vez de repetir): {memoria_abas()['coalescidas']}")
+            cota = pressao_cota()
+            st.caption(
+                f"🚦 Cota do Sheets no último minuto: {cota['leituras']}/{cota['limites']['leituras']} leituras · "
+                f"{cota['escritas']}/{cota['limites']['escritas']} escritas · {cota['esperas']} chamadas em fila · "
+                f"{cota['retentativas']} novas tentativas ({cota['erros_429']} por 429)"
+            )
+            if cota["ultimo_429"] and time.time() - cota["ultimo_429"] < 300:
+                st.warning("⚠️ O Google limitou as chamadas (429) nos últimos 5 minutos.")
+
     st.divider()
     with st.expander("🛡️ Backup do Sistema (SaaS Safe)"):
-        st.markdown("<small>Extração completa da base de dados em formato CSV.</small>", unsafe_allow_html=True)
+        st.markdown("<small>Extração completa da base de dados (um CSV por aba, num único ZIP).</small>", unsafe_allow_html=True)
         try:
             abas_backup = {
                 "Vendas": df_vendas_hist,
@@ -453,15 +1643,28 @@ with st.sidebar:
                 "Marketing": df_marketing,
                 "Documentos": df_docs
             }
-            for nome, df in abas_backup.items():
-                if not df.empty:
-                    st.download_button(
-                        f"📥 Baixar {nome}", 
-                        df.to_csv(index=False).encode('utf-8'), 
-                        f"Backup_{nome}_{datetime.now().strftime('%Y%m%d')}.csv", 
-                        "text/csv", 
-                        use_container_width=True
-                    )
+            # 💡 O ZIP só é montado quando alguém pede, numa thread, e fica guardado para esta versão dos dados
+            versao_backup = versao_abas()
+            fabrica = fabrica_backup()
+            if fabrica["versao"] == versao_backup and fabrica["arquivo"]:
+                st.download_button(
+                    "📥 Baixar Backup Completo (.zip)",
+                    fabrica["arquivo"],
+                    f"Backup_{datetime.now().strftime('%Y%m%d')}.zip",
+                    "application/zip",
+                    use_container_width=True
+                )
+            elif backup_montando():
+                @st.fragment(run_every=2)
+                def aguardando_backup():
+                    if backup_montando(): st.caption("⏳ Compactando as abas...")
+                    else: st.rerun()
+                aguardando_backup()
+            else:
+                if fabrica["erro"]: st.caption(f"⚠️ Último backup falhou: {fabrica['erro']}")
+                if st.button("📦 Gerar Backup Completo", use_container_width=True, key="btn_gerar_backup"):
+                    pedir_backup(versao_backup, abas_backup)
+                    st.rerun()
         except Exception as e:
             st.error("Sincronize a planilha para habilitar os backups.")
 
@@ -473,7 +1676,7 @@ with st.sidebar:
             # Carrega a aba USUARIO fresca da planilha
             @st.cache_data(ttl=60)
             def ler_usuarios_com_cache():
-                return planilha_mestre.worksheet("USUARIO").get_all_values()
+                return pegar_aba("USUARIO").get_all_values()
             
             dados_usuarios = ler_usuarios_com_cache()
 
@@ -519,25 +1722,11 @@ with st.sidebar:
 # ==========================================
 if menu_selecionado == "🛒 Vendas":
     # --- FILTRO INTELIGENTE DE VERSÕES (LATEST VERSION) ---
-    produtos_filtrados_venda = {}
-    for cod_completo, info in banco_de_produtos.items():
-        # Separa o código da versão (ex: "101.2" vira base="101" e versao=2)
-        if "." in str(cod_completo):
-            base, versao = str(cod_completo).split(".")
-            versao = int(versao)
-        else:
-            base, versao = str(cod_completo), 0
-        
-        # Se o produto base ainda não está no filtro OU se esta versão é mais recente
-        if base not in produtos_filtrados_venda or versao > produtos_filtrados_venda[base]['v']:
-            produtos_filtrados_venda[base] = {
-                'v': versao, 
-                'full_cod': cod_completo, 
-                'nome': info['nome']
-            }
+    # 🧬 Só o lote mais recente de cada família aparece para venda (famílias montadas uma vez por versão dos dados)
+    familias_venda = familias_produtos(versao_abas(), list(banco_de_produtos))
     
     # Criamos a lista final apenas com os códigos mais recentes
-    lista_selecao_limpa = [f"{v['full_cod']} - {v['nome']}" for v in produtos_filtrados_venda.values()]
+    lista_selecao_limpa = [f"{f['topo']} - {banco_de_produtos[f['topo']]['nome']}" for f in familias_venda.values()]
     # -----------------------------------------------------
     
     # ==========================================
@@ -554,7 +1743,7 @@ if menu_selecionado == "🛒 Vendas":
         
         with col_v1:
             metodo = st.selectbox("Forma de Pagamento", ["Pix", "Dinheiro", "Cartão", "Sweet Flex"], key="venda_metodo_pg")
-            c_sel = st.selectbox("Selecionar Cliente", ["*** NOVO CLIENTE ***"] + [f"{k} - {v['nome']}" for k, v in banco_de_clientes.items()], key="venda_cliente_sel")
+            c_sel = st.selectbox("Selecionar Cliente", opcoes_catalogo(catalogo, "clientes", "*** NOVO CLIENTE ***")[0], key="venda_cliente_sel")
             
             telefone_sugerido = ""
             if c_sel != "*** NOVO CLIENTE ***":
@@ -695,7 +1884,6 @@ if menu_selecionado == "🛒 Vendas":
 
                 if btn_limpar:
                     st.session_state['carrinho'] = []
-                    st.cache_data.clear()
                     st.rerun()
 
                 if btn_finalizar:
@@ -710,11 +1898,13 @@ if menu_selecionado == "🛒 Vendas":
                     # 👇 TUDO AQUI PARA BAIXO FOI MANTIDO INTACTO CONFORME O SEU CÓDIGO ORIGINAL 👇
                     with st.spinner("Salvando venda e gerando recibo..."):
                         try:
+                            linhas_para_gravar = {} # {aba: [linhas]} -> tudo vai para a planilha numa única gravação em lote
+
                             # 1. Identificação/Cadastro do Cliente
                             if c_sel == "*** NOVO CLIENTE ***":
                                 nome_cli = c_nome_novo.strip()
                                 if not modo_teste:
-                                    aba_cli = planilha_mestre.worksheet("CARTEIRA DE CLIENTES")
+                                    aba_cli = pegar_aba("CARTEIRA DE CLIENTES")
                                     dados_c = aba_cli.get_all_values()
                                     nomes_up = [l[1].strip().upper() for l in dados_c[1:] if len(l) > 1]
                                     
@@ -732,27 +1922,18 @@ if menu_selecionado == "🛒 Vendas":
                                         
                                         cod_cli = f"CLI-{prox_num_cli:03d}"
                                         
-                                        # 💡 MONTAGEM DA LINHA
+                                        # 💡 MONTAGEM DA LINHA (gravada junto com os itens da venda, no mesmo lote)
                                         linha_novo_cli = [cod_cli, nome_cli, c_zap.strip(), "", datetime.now().strftime("%d/%m/%Y"), 0.0, "", "Incompleto"]
-                                        
-                                        # 💡 TÉCNICA DAS LINHAS
-                                        try:
-                                            cel_tot_cli = aba_cli.find("TOTAIS")
-                                            aba_cli.insert_row(linha_novo_cli, index=cel_tot_cli.row, value_input_option='USER_ENTERED')
-                                        except:
-                                            valores_colA = aba_cli.col_values(1)
-                                            linhas_reais = [v for v in valores_colA if str(v).strip() != ""]
-                                            prox_linha = len(linhas_reais) + 1
-                                            aba_cli.insert_row(linha_novo_cli, index=prox_linha, value_input_option='USER_ENTERED')
+                                        linhas_para_gravar["CARTEIRA DE CLIENTES"] = [linha_novo_cli]
                                 else: 
                                     cod_cli = "CLI-TESTE"
                             else:
                                 cod_cli = c_sel.split(" - ")[0]
                                 nome_cli = banco_de_clientes[cod_cli]['nome']
 
-                            # 2. Gravação de Itens (Loop na Planilha - BLINDADO SAAS)
+                            # 2. Montagem dos Itens (todas as linhas do carrinho entram de uma vez - BLINDADO SAAS)
                             if not modo_teste:
-                                aba_v = planilha_mestre.worksheet("VENDAS")
+                                linhas_para_gravar["VENDAS"] = []
                                 for item in st.session_state['carrinho']:
                                     # Distribuição proporcional do desconto por item para manter lucro exato
                                     proporcao_desc = (item['subtotal'] / subtotal_venda) if subtotal_venda > 0 else 0
@@ -773,6 +1954,13 @@ if menu_selecionado == "🛒 Vendas":
                                     f_u = '=SE(INDIRETO("L"&LIN())=""; ""; SE(ARRUMAR(MINÚSCULA(INDIRETO("P"&LIN())))="não"; 0; MÁXIMO(0; INDIRETO("L"&LIN()) - INDIRETO("T"&LIN()))))'
                                     f_atraso = '=SE(INDIRETO("V"&LIN())=""; ""; SE(OU(INDIRETO("W"&LIN())="Pago"; INDIRETO("W"&LIN())="Em dia"); 0; MÁXIMO(0; HOJE() - INDIRETO("V"&LIN()))))'
                                     
+                                    # 🧮 Modo VENDAS_CALCULADAS: valores prontos no lugar das fórmulas voláteis
+                                    if VENDAS_CALCULADAS:
+                                        pago_item = t_liq_item if eh_parc == "Não" else 0
+                                        venc_item = detalhes_p[0] if (eh_parc == "Sim" and detalhes_p) else ""
+                                        contas = calcular_venda(item['custo'], item['qtd'], item['preco'], desc_percentual, eh_parc, pago_item, venc_item, "Pendente" if eh_parc == "Sim" else "Pago")
+                                        f_k, f_l, f_m, f_n, f_r, f_u, f_atraso = (contas[c] for c in ["K", "L", "M", "N", "R", "U", "X"])
+                                    
                                     linha = [
                                         "", datetime.now().strftime("%d/%m/%Y"), cod_cli, nome_cli, 
                                         item['cod'], item['nome'], item['custo'], item['qtd'], item['preco'], 
@@ -783,12 +1971,15 @@ if menu_selecionado == "🛒 Vendas":
                                         detalhes_p[0] if (eh_parc=="Sim" and detalhes_p) else "", 
                                         "Pendente" if eh_parc=="Sim" else "Pago", f_atraso
                                     ]
-                                    
-                                    try:
-                                        idx_ins = aba_v.find("TOTAIS").row
-                                        aba_v.insert_row(linha, index=idx_ins, value_input_option='USER_ENTERED')
-                                    except:
-                                        aba_v.append_row(linha, value_input_option='USER_ENTERED')
+                                    linhas_para_gravar["VENDAS"].append(linha)
+
+                                # 🚀 Cliente novo + todos os itens: uma única gravação, acima da linha TOTAIS
+                                inserir_linhas_antes_totais(planilha_mestre, linhas_para_gravar)
+
+                                # 📦 Vendidos por produto: relê as VENDAS (já com esta venda) e reconta só os itens do carrinho
+                                if VENDIDOS_CALCULADOS:
+                                    invalidar("VENDAS")
+                                    recontar_vendidos(skus={item['cod'] for item in st.session_state['carrinho']})
 
                             # 3. Geração do Recibo Único e Elegante
                             primeiro_nome_vendedor = vendedor.split(' ')[0]
@@ -852,233 +2043,248 @@ if menu_selecionado == "🛒 Vendas":
 
                             # Limpeza Final
                             st.session_state['carrinho'] = []
-                            st.cache_data.clear()
-                            st.cache_resource.clear()
+                            invalidar("VENDAS", "INVENTÁRIO", "CARTEIRA DE CLIENTES", "PAINEL")
                             
                         except Exception as e:
                             st.error(f"Erro ao processar venda: {e}")
                             
     # --- MANTENDO HISTÓRICO E BORRACHA MÁGICA ---
     st.divider()
-    with st.expander("📝 Ver Histórico de Vendas Recentes (Últimas 10)", expanded=False):
-        try:
-            dados_v = planilha_mestre.worksheet("VENDAS").get_all_values()
-            if len(dados_v) > 1:
-                df_v_real = pd.DataFrame(dados_v[1:], columns=dados_v[0])
-                df_v_real = df_v_real[~df_v_real['CLIENTE'].astype(str).str.contains("TOTAIS", case=False, na=False)]
-                df_v_real = df_v_real[df_v_real['CLIENTE'] != ""]
-                historico_display = df_v_real[['DATA DA VENDA', 'CLIENTE', 'PRODUTO', 'TOTAL R$', 'STATUS']].tail(10).iloc[::-1]
-                st.dataframe(historico_display, use_container_width=True, hide_index=True)
-            else: st.info("Nenhuma venda registrada ainda.")
-        except Exception as e: st.warning("Sincronize a planilha para ver o histórico.")
+    with st.expander("📝 Ver Histórico de Vendas Recentes (Últimas 10)", expanded=False, key="exp_hist_vendas", on_change="rerun") as painel:
+        if painel.open: # 💡 Só lê e monta o conteúdo quando o expander está aberto
+            try:
+                df_v_real = cauda_aba("VENDAS", 20)
+                if not df_v_real.empty:
+                    df_v_real = df_v_real[~df_v_real['CLIENTE'].astype(str).str.contains("TOTAIS", case=False, na=False)]
+                    df_v_real = df_v_real[df_v_real['CLIENTE'] != ""]
+                    historico_display = df_v_real[['DATA DA VENDA', 'CLIENTE', 'PRODUTO', 'TOTAL R$', 'STATUS']].tail(10).iloc[::-1]
+                    st.dataframe(historico_display, use_container_width=True, hide_index=True)
+                else: st.info("Nenhuma venda registrada ainda.")
+            except Exception as e: st.warning("Sincronize a planilha para ver o histórico.")
 
     # [O código da Borracha Mágica (Edição de Vendas) continua exatamente como você já tinha abaixo deste ponto]
 
 # ==========================================
 # ✏️ BORRACHA MÁGICA: EDIÇÃO E EXCLUSÃO (COM RADAR E AUDITORIA)
 # ==========================================
-    with st.expander("✏️ Corrigir ou Excluir Venda (Radar de Vendas)", expanded=False):
-        st.write("Pesquise por uma venda antiga ou escolha uma recente para corrigir cliente, produto, valores ou método de pagamento.")
+    with st.expander("✏️ Corrigir ou Excluir Venda (Radar de Vendas)", expanded=False, key="exp_radar_vendas", on_change="rerun") as painel:
+        if painel.open: # 💡 Só lê e monta o conteúdo quando o expander está aberto
+            st.write("Pesquise por uma venda antiga ou escolha uma recente para corrigir cliente, produto, valores ou método de pagamento.")
         
-        try:
-            aba_vendas = planilha_mestre.worksheet("VENDAS")
-            dados_v = aba_vendas.get_all_values()
+            try:
+                aba_vendas = pegar_aba("VENDAS")
+                dados_v = matriz_aba("VENDAS") # Mesma memória das outras telas (sem baixar a aba de novo)
             
-            if len(dados_v) > 1:
-                # 🔍 O RADAR DE BUSCA DE VENDAS
-                busca_venda = st.text_input("🔍 Buscar venda (Digite a data, o cliente ou o produto)", placeholder="Ex: 22/02, Maria, Lençol...")
+                if len(dados_v) > 1:
+                    # 🔍 O RADAR DE BUSCA DE VENDAS
+                    busca_venda = st.text_input("🔍 Buscar venda (Digite a data, o cliente ou o produto)", placeholder="Ex: 22/02, Maria, Lençol...")
                 
-                vendas_filtradas = []
-                for i in range(1, len(dados_v)): # Pula o cabeçalho
-                    linha = dados_v[i]
-                    if len(linha) > 5 and "TOTAIS" not in str(linha[3]).upper() and str(linha[3]).strip() != "":
-                        pagto_info = linha[14] if len(linha) > 14 else "Indefinido"
+                    vendas_filtradas = []
+                    # 💡 Sem busca só interessam as 20 últimas: percorre de baixo para cima e para cedo.
+                    # Com busca, o índice (sem acento) diz direto quais linhas servem
+                    if busca_venda:
+                        textos_vendas = lambda: {i: " ".join(str(v) for v in linha[1:6] + linha[14:15]) for i, linha in enumerate(dados_v) if i > 0}
+                        ordem = sorted(buscar_no_indice(indice_busca("vendas", versao_abas(), textos_vendas), busca_venda))
+                    else:
+                        ordem = range(len(dados_v) - 1, 0, -1)
+                    for i in ordem: # Pula o cabeçalho
+                        if not busca_venda and len(vendas_filtradas) == 20: break
+                        linha = dados_v[i]
+                        if len(linha) > 5 and "TOTAIS" not in str(linha[3]).upper() and str(linha[3]).strip() != "":
+                            pagto_info = linha[14] if len(linha) > 14 else "Indefinido"
                         
-                        cod_cliente = linha[2]
-                        nome_cliente = linha[3]
-                        cod_produto = linha[4]
-                        nome_produto = linha[5]
+                            cod_cliente = linha[2]
+                            nome_cliente = linha[3]
+                            cod_produto = linha[4]
+                            nome_produto = linha[5]
                         
-                        texto_item = f"Linha {i+1} | Data: {linha[1]} | Cliente: {cod_cliente} - {nome_cliente} | Item: {cod_produto} - {nome_produto} | Pgto: {pagto_info}"
+                            texto_item = f"Linha {i+1} | Data: {linha[1]} | Cliente: {cod_cliente} - {nome_cliente} | Item: {cod_produto} - {nome_produto} | Pgto: {pagto_info}"
                         
-                        if busca_venda:
-                            if busca_venda.lower() in texto_item.lower():
-                                vendas_filtradas.append(texto_item)
-                        else:
                             vendas_filtradas.append(texto_item)
                 
-                if not busca_venda:
-                    vendas_filtradas = vendas_filtradas[-20:]
+                    if not busca_venda:
+                        vendas_filtradas = vendas_filtradas[::-1]
                 
-                vendas_filtradas.reverse()
+                    vendas_filtradas.reverse()
                 
-                if vendas_filtradas:
-                    venda_selecionada = st.selectbox("Selecione a venda com erro:", ["---"] + vendas_filtradas)
+                    if vendas_filtradas:
+                        venda_selecionada = st.selectbox("Selecione a venda com erro:", ["---"] + vendas_filtradas)
                     
-                    if venda_selecionada != "---":
-                        linha_real = int(venda_selecionada.split(" | ")[0].replace("Linha ", ""))
-                        linha_dados = dados_v[linha_real - 1]
+                        if venda_selecionada != "---":
+                            linha_real = int(venda_selecionada.split(" | ")[0].replace("Linha ", ""))
+                            linha_dados = dados_v[linha_real - 1]
                         
-                        # 💡 LEITURA DOS DADOS (Com proteção contra erros de índice)
-                        cod_cli_atual = linha_dados[2]
-                        nome_cli_atual = linha_dados[3]
-                        cod_prod_atual = linha_dados[4]
-                        nome_prod_atual = linha_dados[5]
+                            # 💡 LEITURA DOS DADOS (Com proteção contra erros de índice)
+                            cod_cli_atual = linha_dados[2]
+                            nome_cli_atual = linha_dados[3]
+                            cod_prod_atual = linha_dados[4]
+                            nome_prod_atual = linha_dados[5]
 
-                        def limpar_para_editar(val_str, is_perc=False):
-                            try:
-                                v = str(val_str).replace("R$", "").replace(" ", "").replace(".", "").replace(",", ".")
-                                if is_perc and "%" in str(val_str):
-                                    return float(v.replace("%", "")) / 100.0
-                                return float(v)
-                            except: return 0.0
-
-                        qtd_atual = limpar_para_editar(linha_dados[7])
-                        val_atual = limpar_para_editar(linha_dados[8])
-                        desc_perc_raw = limpar_para_editar(linha_dados[9], is_perc=True)
-                        desc_reais_atual = round((qtd_atual * val_atual) * desc_perc_raw, 2) if 0 <= desc_perc_raw <= 1 else 0.0
-
-                        metodo_atual = linha_dados[14] if len(linha_dados) > 14 else "Pix"
+                            def limpar_para_editar(val_str, is_perc=False):
+                                try:
+                                    v = str(val_str).replace("R$", "").replace(" ", "").replace(".", "").replace(",", ".")
+                                    if is_perc and "%" in str(val_str):
+                                        return float(v.replace("%", "")) / 100.0
+                                    return float(v)
+                                except: return 0.0
+
+                            qtd_atual = limpar_para_editar(linha_dados[7])
+                            val_atual = limpar_para_editar(linha_dados[8])
+                            desc_perc_raw = limpar_para_editar(linha_dados[9], is_perc=True)
+                            desc_reais_atual = round((qtd_atual * val_atual) * desc_perc_raw, 2) if 0 <= desc_perc_raw <= 1 else 0.0
+
+                            metodo_atual = linha_dados[14] if len(linha_dados) > 14 else "Pix"
                         
-                        try: parc_atual = int(linha_dados[16]) if len(linha_dados) > 16 and str(linha_dados[16]).strip() else 1
-                        except: parc_atual = 1
+                            try: parc_atual = int(linha_dados[16]) if len(linha_dados) > 16 and str(linha_dados[16]).strip() else 1
+                            except: parc_atual = 1
                         
-                        venc_atual_str = str(linha_dados[21]) if len(linha_dados) > 21 and str(linha_dados[21]).strip() != "-" else ""
-                        import datetime as dt
-                        import pytz
-                        try: venc_atual_dt = dt.datetime.strptime(venc_atual_str, "%d/%m/%Y").date()
-                        except: venc_atual_dt = dt.datetime.now(pytz.timezone('America/Sao_Paulo')).date()
+                            venc_atual_str = str(linha_dados[21]) if len(linha_dados) > 21 and str(linha_dados[21]).strip() != "-" else ""
+                            import datetime as dt
+                            import pytz
+                            try: venc_atual_dt = dt.datetime.strptime(venc_atual_str, "%d/%m/%Y").date()
+                            except: venc_atual_dt = dt.datetime.now(pytz.timezone('America/Sao_Paulo')).date()
                         
-                        status_atual = str(linha_dados[22]).strip() if len(linha_dados) > 22 and str(linha_dados[22]).strip() != "" else "Pago"
+                            status_atual = str(linha_dados[22]).strip() if len(linha_dados) > 22 and str(linha_dados[22]).strip() != "" else "Pago"
 
-                        lista_clientes = [f"{k} - {v['nome']}" for k, v in banco_de_clientes.items()]
-                        cliente_str_atual = f"{cod_cli_atual} - {nome_cli_atual}"
-                        idx_cliente = lista_clientes.index(cliente_str_atual) if cliente_str_atual in lista_clientes else 0
+                            lista_clientes, pos_clientes = opcoes_catalogo(catalogo, "clientes")
+                            cliente_str_atual = f"{cod_cli_atual} - {nome_cli_atual}"
+                            idx_cliente = pos_clientes.get(cliente_str_atual, 0)
 
-                        lista_produtos = [f"{k} - {v['nome']}" for k, v in banco_de_produtos.items()]
-                        produto_str_atual = f"{cod_prod_atual} - {nome_prod_atual}"
-                        idx_produto = lista_produtos.index(produto_str_atual) if produto_str_atual in lista_produtos else 0
+                            lista_produtos, pos_produtos = opcoes_catalogo(catalogo, "produtos")
+                            produto_str_atual = f"{cod_prod_atual} - {nome_prod_atual}"
+                            idx_produto = pos_produtos.get(produto_str_atual, 0)
 
-                        lista_metodos = ["Pix", "Dinheiro", "Cartão", "Sweet Flex"]
-                        idx_metodo = lista_metodos.index(metodo_atual) if metodo_atual in lista_metodos else 0
+                            lista_metodos = ["Pix", "Dinheiro", "Cartão", "Sweet Flex"]
+                            idx_metodo = lista_metodos.index(metodo_atual) if metodo_atual in lista_metodos else 0
                         
-                        lista_status_opcoes = ["Pago", "Em dia", "Atrasado", "Pendente"]
-                        idx_status = lista_status_opcoes.index(status_atual) if status_atual in lista_status_opcoes else 0
-
-                        with st.form(f"form_edicao_{linha_real}"):
-                            st.markdown(f"#### 🔄 Atualizar Dados (Linha {linha_real})")
-                            e_c1, e_c2 = st.columns(2)
-                            novo_cliente = e_c1.selectbox("Cliente Oficial", lista_clientes, index=idx_cliente)
-                            novo_produto = e_c2.selectbox("Produto Correto", lista_produtos, index=idx_produto)
+                            lista_status_opcoes = ["Pago", "Em dia", "Atrasado", "Pendente"]
+                            idx_status = lista_status_opcoes.index(status_atual) if status_atual in lista_status_opcoes else 0
+
+                            with st.form(f"form_edicao_{linha_real}"):
+                                st.markdown(f"#### 🔄 Atualizar Dados (Linha {linha_real})")
+                                e_c1, e_c2 = st.columns(2)
+                                novo_cliente = e_c1.selectbox("Cliente Oficial", lista_clientes, index=idx_cliente)
+                                novo_produto = e_c2.selectbox("Produto Correto", lista_produtos, index=idx_produto)
                             
-                            e_c3, e_c4, e_c5 = st.columns(3)
-                            nova_qtd = e_c3.number_input("Quantidade", value=float(qtd_atual), min_value=0.1)
-                            novo_val = e_c4.number_input("Preço Un. (R$)", value=float(val_atual))
-                            novo_desc = e_c5.number_input("Desconto (R$)", value=float(desc_reais_atual))
+                                e_c3, e_c4, e_c5 = st.columns(3)
+                                nova_qtd = e_c3.number_input("Quantidade", value=float(qtd_atual), min_value=0.1)
+                                novo_val = e_c4.number_input("Preço Un. (R$)", value=float(val_atual))
+                                novo_desc = e_c5.number_input("Desconto (R$)", value=float(desc_reais_atual))
                             
-                            c_m1, c_m2 = st.columns(2)
-                            novo_metodo = c_m1.selectbox("Forma de Pagto", lista_metodos, index=idx_metodo)
-                            novo_status = c_m2.selectbox("Status da Venda", lista_status_opcoes, index=idx_status)
+                                c_m1, c_m2 = st.columns(2)
+                                novo_metodo = c_m1.selectbox("Forma de Pagto", lista_metodos, index=idx_metodo)
+                                novo_status = c_m2.selectbox("Status da Venda", lista_status_opcoes, index=idx_status)
                             
-                            st.markdown("---")
-                            st.write("💳 **Detalhes de Parcelamento (Sweet Flex)**")
-                            c_flex1, c_flex2 = st.columns(2)
-                            novo_num_parc = c_flex1.number_input("Qtd Parcelas", value=parc_atual, min_value=1)
-                            novo_venc = c_flex2.date_input("Data do 1º Vencimento", value=venc_atual_dt)
+                                st.markdown("---")
+                                st.write("💳 **Detalhes de Parcelamento (Sweet Flex)**")
+                                c_flex1, c_flex2 = st.columns(2)
+                                novo_num_parc = c_flex1.number_input("Qtd Parcelas", value=parc_atual, min_value=1)
+                                novo_venc = c_flex2.date_input("Data do 1º Vencimento", value=venc_atual_dt)
                             
-                            st.divider()
-                            col_btn1, col_btn2 = st.columns([2, 1])
+                                st.divider()
+                                col_btn1, col_btn2 = st.columns([2, 1])
                             
-                            salvar = col_btn1.form_submit_button("💾 Salvar Alteração", type="primary", use_container_width=True)
+                                salvar = col_btn1.form_submit_button("💾 Salvar Alteração", type="primary", use_container_width=True)
                             
-                            st.write("---")
-                            confirma_exclusao = st.checkbox("Confirmar que desejo EXCLUIR esta venda permanentemente")
-                            excluir = col_btn2.form_submit_button("🗑️ Excluir", type="secondary", use_container_width=True)
+                                st.write("---")
+                                confirma_exclusao = st.checkbox("Confirmar que desejo EXCLUIR esta venda permanentemente")
+                                excluir = col_btn2.form_submit_button("🗑️ Excluir", type="secondary", use_container_width=True)
 
-                            if salvar:
-                                try:
-                                    n_cod_cli = novo_cliente.split(" - ")[0]
-                                    n_nome_cli = " - ".join(novo_cliente.split(" - ")[1:])
-                                    n_cod_prod = novo_produto.split(" - ")[0]
-                                    n_nome_prod = " - ".join(novo_produto.split(" - ")[1:])
-                                    n_custo = float(banco_de_produtos.get(n_cod_prod, {}).get('custo', 0.0))
-                                    n_v_bruto = nova_qtd * novo_val
-                                    n_desc_perc = novo_desc / n_v_bruto if n_v_bruto > 0 else 0
-                                    n_t_liq = n_v_bruto - novo_desc
+                                if salvar:
+                                    try:
+                                        n_cod_cli = novo_cliente.split(" - ")[0]
+                                        n_nome_cli = " - ".join(novo_cliente.split(" - ")[1:])
+                                        n_cod_prod = novo_produto.split(" - ")[0]
+                                        n_nome_prod = " - ".join(novo_produto.split(" - ")[1:])
+                                        n_custo = float(banco_de_produtos.get(n_cod_prod, {}).get('custo', 0.0))
+                                        n_v_bruto = nova_qtd * novo_val
+                                        n_desc_perc = novo_desc / n_v_bruto if n_v_bruto > 0 else 0
+                                        n_t_liq = n_v_bruto - novo_desc
                                     
-                                    eh_parc = "Sim" if novo_metodo == "Sweet Flex" else "Não"
-                                    num_parc_final = novo_num_parc if eh_parc == "Sim" else 1
-                                    venc_final = novo_venc.strftime("%d/%m/%Y") if eh_parc == "Sim" else "-"
+                                        eh_parc = "Sim" if novo_metodo == "Sweet Flex" else "Não"
+                                        num_parc_final = novo_num_parc if eh_parc == "Sim" else 1
+                                        venc_final = novo_venc.strftime("%d/%m/%Y") if eh_parc == "Sim" else "-"
                                     
-                                    # MÁGICA MANTIDA: Reenvio de Fórmulas e Status (W)
-                                    atualizacoes = [
-                                        {'range': f'C{linha_real}', 'values': [[n_cod_cli]]},
-                                        {'range': f'D{linha_real}', 'values': [[n_nome_cli]]},
-                                        {'range': f'E{linha_real}', 'values': [[n_cod_prod]]},
-                                        {'range': f'F{linha_real}', 'values': [[n_nome_prod]]},
-                                        {'range': f'G{linha_real}', 'values': [[n_custo]]},
-                                        {'range': f'H{linha_real}', 'values': [[nova_qtd]]},
-                                        {'range': f'I{linha_real}', 'values': [[novo_val]]},
-                                        {'range': f'J{linha_real}', 'values': [[n_desc_perc]]},
-                                        {'range': f'O{linha_real}', 'values': [[novo_metodo]]},
-                                        {'range': f'P{linha_real}', 'values': [[eh_parc]]},
-                                        {'range': f'Q{linha_real}', 'values': [[num_parc_final]]},
-                                        {'range': f'S{linha_real}', 'values': [[n_t_liq / num_parc_final if eh_parc == "Sim" else 0]]},
-                                        {'range': f'T{linha_real}', 'values': [[n_t_liq if eh_parc == "Não" else 0]]},
-                                        {'range': f'U{linha_real}', 'values': [[n_t_liq if eh_parc == "Sim" else 0]]},
-                                        {'range': f'V{linha_real}', 'values': [[venc_final]]},
-                                        {'range': f'W{linha_real}', 'values': [[novo_status]]} 
-                                    ]
+                                        # MÁGICA MANTIDA: Reenvio de Fórmulas e Status (W)
+                                        atualizacoes = [
+                                            {'range': f'C{linha_real}', 'values': [[n_cod_cli]]},
+                                            {'range': f'D{linha_real}', 'values': [[n_nome_cli]]},
+                                            {'range': f'E{linha_real}', 'values': [[n_cod_prod]]},
+                                            {'range': f'F{linha_real}', 'values': [[n_nome_prod]]},
+                                            {'range': f'G{linha_real}', 'values': [[n_custo]]},
+                                            {'range': f'H{linha_real}', 'values': [[nova_qtd]]},
+                                            {'range': f'I{linha_real}', 'values': [[novo_val]]},
+                                            {'range': f'J{linha_real}', 'values': [[n_desc_perc]]},
+                                            {'range': f'O{linha_real}', 'values': [[novo_metodo]]},
+                                            {'range': f'P{linha_real}', 'values': [[eh_parc]]},
+                                            {'range': f'Q{linha_real}', 'values': [[num_parc_final]]},
+                                            {'range': f'S{linha_real}', 'values': [[n_t_liq / num_parc_final if eh_parc == "Sim" else 0]]},
+                                            {'range': f'T{linha_real}', 'values': [[n_t_liq if eh_parc == "Não" else 0]]},
+                                            {'range': f'U{linha_real}', 'values': [[n_t_liq if eh_parc == "Sim" else 0]]},
+                                            {'range': f'V{linha_real}', 'values': [[venc_final]]},
+                                            {'range': f'W{linha_real}', 'values': [[novo_status]]} 
+                                        ]
+                                        if VENDAS_CALCULADAS:
+                                            contas = calcular_venda(n_custo, nova_qtd, novo_val, n_desc_perc, eh_parc, n_t_liq if eh_parc == "Não" else 0, venc_final, novo_status)
+                                            atualizacoes += [{'range': f'{c}{linha_real}', 'values': [[contas[c]]]} for c in ["K", "L", "M", "N", "R", "U", "X"]]
                                     
-                                    aba_vendas.batch_update(atualizacoes, value_input_option='USER_ENTERED')
+                                        if not linha_confere(aba_vendas, linha_real, linha_dados):
+                                            invalidar("VENDAS", completo=True)
+                                            st.warning("⚠️ A planilha mudou desde a última leitura. A lista foi atualizada, selecione a venda de novo.")
+                                            st.stop()
+                                        aba_vendas.batch_update(atualizacoes, value_input_option='USER_ENTERED')
                                     
-                                    # 🛡️ LANÇAMENTO NO LOG DE AUDITORIA (NOVO)
-                                    try:
-                                        aba_log = planilha_mestre.worksheet("LOG_AUDITORIA")
-                                        data_agora = dt.datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y %H:%M")
-                                        usuario = st.session_state.get('usuario_logado', 'Sistema/Bia')
-                                        detalhes_log = f"Alterou para: {nova_qtd}x {n_nome_prod}. Total: R$ {n_t_liq:.2f}. Pgt: {novo_metodo}."
-                                        aba_log.append_row([data_agora, usuario, "EDIÇÃO", f"Linha {linha_real}", n_nome_cli, detalhes_log], value_input_option='USER_ENTERED')
-                                    except: pass
-
-                                    st.session_state['recibo_correcao'] = {
-                                        "tipo": "editado",
-                                        "cliente": n_nome_cli,
-                                        "produto": f"{nova_qtd}x {n_nome_prod}",
-                                        "total": n_t_liq,
-                                        "metodo": novo_metodo
-                                    }
-                                    st.cache_data.clear()
-                                    st.cache_resource.clear()
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"Erro ao salvar: {e}")
-
-                            if excluir:
-                                if confirma_exclusao:
-                                    try:
-                                        # 🛡️ LANÇAMENTO NO LOG DE AUDITORIA ANTES DE APAGAR (NOVO)
+                                        # 🛡️ LANÇAMENTO NO LOG DE AUDITORIA (NOVO)
                                         try:
-                                            aba_log = planilha_mestre.worksheet("LOG_AUDITORIA")
+                                            aba_log = pegar_aba("LOG_AUDITORIA")
                                             data_agora = dt.datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y %H:%M")
                                             usuario = st.session_state.get('usuario_logado', 'Sistema/Bia')
-                                            detalhes_log = f"Apagou a venda de {qtd_atual}x {nome_prod_atual} (R$ {val_atual})"
-                                            aba_log.append_row([data_agora, usuario, "EXCLUSÃO", f"Linha {linha_real}", nome_cli_atual, detalhes_log], value_input_option='USER_ENTERED')
-                                        except: pass 
-
-                                        aba_vendas.delete_rows(linha_real)
-                                        st.session_state['recibo_correcao'] = {"tipo": "excluido", "linha": linha_real}
-                                        st.cache_data.clear()
-                                        st.cache_resource.clear()
+                                            detalhes_log = f"Alterou para: {nova_qtd}x {n_nome_prod}. Total: R$ {n_t_liq:.2f}. Pgt: {novo_metodo}."
+                                            aba_log.append_row([data_agora, usuario, "EDIÇÃO", f"Linha {linha_real}", n_nome_cli, detalhes_log], value_input_option='USER_ENTERED')
+                                        except: pass
+
+                                        st.session_state['recibo_correcao'] = {
+                                            "tipo": "editado",
+                                            "cliente": n_nome_cli,
+                                            "produto": f"{nova_qtd}x {n_nome_prod}",
+                                            "total": n_t_liq,
+                                            "metodo": novo_metodo
+                                        }
+                                        invalidar("VENDAS", "INVENTÁRIO", "PAINEL", completo=True); invalidar("LOG_AUDITORIA")
+                                        if VENDIDOS_CALCULADOS: recontar_vendidos(); invalidar("INVENTÁRIO")
                                         st.rerun()
                                     except Exception as e:
-                                        st.error(f"Erro ao excluir: {e}")
-                                else:
-                                    st.warning("⚠️ Você precisa marcar a caixa de confirmação para excluir.")
-                else:
-                    st.info("Nenhuma venda encontrada com esse termo de busca.")
-        except Exception as e:
-            st.error(f"Erro ao carregar dados: {e}")
+                                        st.error(f"Erro ao salvar: {e}")
+
+                                if excluir:
+                                    if confirma_exclusao:
+                                        if not linha_confere(aba_vendas, linha_real, linha_dados):
+                                            invalidar("VENDAS", completo=True)
+                                            st.warning("⚠️ A planilha mudou desde a última leitura. A lista foi atualizada, selecione a venda de novo.")
+                                            st.stop()
+                                        try:
+                                            # 🛡️ LANÇAMENTO NO LOG DE AUDITORIA ANTES DE APAGAR (NOVO)
+                                            try:
+                                                aba_log = pegar_aba("LOG_AUDITORIA")
+                                                data_agora = dt.datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y %H:%M")
+                                                usuario = st.session_state.get('usuario_logado', 'Sistema/Bia')
+                                                detalhes_log = f"Apagou a venda de {qtd_atual}x {nome_prod_atual} (R$ {val_atual})"
+                                                aba_log.append_row([data_agora, usuario, "EXCLUSÃO", f"Linha {linha_real}", nome_cli_atual, detalhes_log], value_input_option='USER_ENTERED')
+                                            except: pass 
+
+                                            aba_vendas.delete_rows(linha_real)
+                                            st.session_state['recibo_correcao'] = {"tipo": "excluido", "linha": linha_real}
+                                            invalidar("VENDAS", "INVENTÁRIO", "PAINEL", completo=True); invalidar("LOG_AUDITORIA")
+                                            if VENDIDOS_CALCULADOS: recontar_vendidos(); invalidar("INVENTÁRIO")
+                                            st.rerun()
+                                        except Exception as e:
+                                            st.error(f"Erro ao excluir: {e}")
+                                    else:
+                                        st.warning("⚠️ Você precisa marcar a caixa de confirmação para excluir.")
+                    else:
+                        st.info("Nenhuma venda encontrada com esse termo de busca.")
+            except Exception as e:
+                st.error(f"Erro ao carregar dados: {e}")
 
     # ==========================================
     # 🧾 RECIBO DE ATUALIZAÇÃO / EXCLUSÃO
@@ -1111,18 +2317,17 @@ if menu_selecionado == "🛒 Vendas":
     # 🛡️ VISOR DE AUDITORIA (Histórico de Alterações)
     # ==========================================
     st.markdown("---")
-    with st.expander("🛡️ Histórico de Auditoria (Últimas Modificações)", expanded=False):
-        try:
-            aba_log_view = planilha_mestre.worksheet("LOG_AUDITORIA")
-            dados_log_view = aba_log_view.get_all_values()
-            if len(dados_log_view) > 1:
-                import pandas as pd
-                df_log_view = pd.DataFrame(dados_log_view[1:], columns=dados_log_view[0])
-                st.dataframe(df_log_view.iloc[::-1].head(10), use_container_width=True, hide_index=True)
-            else:
-                st.info("Nenhuma modificação ou exclusão foi registrada até o momento.")
-        except:
-            st.warning("Crie a aba 'LOG_AUDITORIA' na planilha Mestre para habilitar o painel de histórico.")
+    with st.expander("🛡️ Histórico de Auditoria (Últimas Modificações)", expanded=False, key="exp_auditoria", on_change="rerun") as painel:
+        if painel.open: # 💡 Só lê e monta o conteúdo quando o expander está aberto
+            try:
+                # Só as últimas linhas do log vêm do Google (leitura por intervalo)
+                df_log_view = cauda_aba("LOG_AUDITORIA", 10)
+                if not df_log_view.empty:
+                    st.dataframe(df_log_view.iloc[::-1].head(10), use_container_width=True, hide_index=True)
+                else:
+                    st.info("Nenhuma modificação ou exclusão foi registrada até o momento.")
+            except:
+                st.warning("Crie a aba 'LOG_AUDITORIA' na planilha Mestre para habilitar o painel de histórico.")
             
 # ==========================================
 # --- SEÇÃO 2: FINANCEIRO (INTELIGÊNCIA 360) ---
@@ -1154,7 +2359,7 @@ elif menu_selecionado == "💰 Financeiro":
                             clientes_unicos = df_vendas_limpo[col_cliente].nunique()
                             
                             col_total = 'TOTAL R$' if 'TOTAL R$' in df_vendas_limpo.columns else df_vendas_limpo.columns[11]
-                            faturamento_bruto = sum(limpar_v(val) for val in df_vendas_limpo[col_total])
+                            faturamento_bruto = float(valores_num(df_vendas_limpo, 'VALOR_NUM', df_vendas_limpo[col_total]).sum())
                             ticket_medio = (faturamento_bruto / total_vendas_qtd) if total_vendas_qtd > 0 else 0.0
                             
                             # Produto Campeão
@@ -1186,7 +2391,7 @@ elif menu_selecionado == "💰 Financeiro":
                             mask_mkt = df_despesas[col_cat_d].astype(str).str.upper().str.contains("MARKETING|ANÚNCIO|ADS|FACEBOOK|INSTAGRAM", na=False)
                             mask_pago = df_despesas[col_status_d].astype(str).str.upper() == "PAGO"
                             df_mkt_pago = df_despesas[mask_mkt & mask_pago].copy()
-                            custo_marketing = sum(limpar_v(v) for v in df_mkt_pago[col_val_d]) if not df_mkt_pago.empty else 0.0
+                            custo_marketing = float(valores_num(df_mkt_pago, 'VALOR_NUM', df_mkt_pago[col_val_d]).sum()) if not df_mkt_pago.empty else 0.0
 
                         cac_atual = custo_marketing / clientes_unicos if clientes_unicos > 0 else 0.0
                         ltv_atual = faturamento_bruto / clientes_unicos if clientes_unicos > 0 else 0.0
@@ -1332,17 +2537,19 @@ elif menu_selecionado == "💰 Financeiro":
             
             if not df_fin.empty:
                 # 💡 A MÁGICA DOS VALORES: Busca a coluna com get() para não errar a posição e perder o cálculo
-                df_fin['VALOR_NUM'] = df_fin.get('TOTAL R$', df_fin.iloc[:, 11]).apply(limpar_v)
+                df_fin['VALOR_NUM'] = valores_num(df_fin, 'VALOR_NUM', df_fin.get('TOTAL R$', df_fin.iloc[:, 11]))
                 df_fin['FORMA_PG'] = df_fin.get('FORMA DE PAGAMENTO', df_fin.iloc[:, 14])
-                df_fin['SALDO_NUM'] = df_fin.get('SALDO DEVEDOR', df_fin.iloc[:, 20]).apply(limpar_v)
+                df_fin['SALDO_NUM'] = valores_num(df_fin, 'SALDO_NUM', df_fin.get('SALDO DEVEDOR', df_fin.iloc[:, 20]))
                 
                 # Para o lucro, vamos garantir que ele ache a coluna certa também
-                if 'LUCRO' in df_fin.columns:
-                    df_fin['LUCRO_NUM'] = df_fin['LUCRO'].apply(limpar_v)
+                if 'LUCRO_NUM' in df_fin.columns:
+                    pass # Já veio tipada da carga
+                elif 'LUCRO' in df_fin.columns:
+                    df_fin['LUCRO_NUM'] = limpar_v_serie(df_fin['LUCRO'])
                 elif 'LUCRO R$' in df_fin.columns:
-                    df_fin['LUCRO_NUM'] = df_fin['LUCRO R$'].apply(limpar_v)
+                    df_fin['LUCRO_NUM'] = limpar_v_serie(df_fin['LUCRO R$'])
                 else:
-                    df_fin['LUCRO_NUM'] = df_fin.iloc[:, 12].apply(limpar_v) # Fallback
+                    df_fin['LUCRO_NUM'] = limpar_v_serie(df_fin.iloc[:, 12]) # Fallback
                 
                 vendas_brutas = df_fin['VALOR_NUM'].sum()
                 lucro_bruto = df_fin['LUCRO_NUM'].sum()
@@ -1363,7 +2570,7 @@ elif menu_selecionado == "💰 Financeiro":
                     
                     # Filtra apenas o que já saiu do caixa de verdade (PAGO)
                     df_desp_pagas = df_despesas[df_despesas[col_status_d].astype(str).str.strip().str.upper() == 'PAGO'].copy()
-                    total_despesas_pagas = df_desp_pagas[col_valor_d].apply(limpar_v).sum() if not df_desp_pagas.empty else 0.0
+                    total_despesas_pagas = valores_num(df_desp_pagas, 'VALOR_NUM', df_desp_pagas[col_valor_d]).sum() if not df_desp_pagas.empty else 0.0
                 else:
                     total_despesas_pagas = 0.0
                 
@@ -1434,7 +2641,7 @@ elif menu_selecionado == "💰 Financeiro":
                         mask_pago = df_despesas[col_status_d].astype(str).str.upper() == "PAGO"
                         
                         df_mkt_pago = df_despesas[mask_mkt & mask_pago].copy()
-                        custo_marketing = df_mkt_pago[col_val_d].apply(limpar_v).sum() if not df_mkt_pago.empty else 0.0
+                        custo_marketing = valores_num(df_mkt_pago, 'VALOR_NUM', df_mkt_pago[col_val_d]).sum() if not df_mkt_pago.empty else 0.0
 
                     # 2. As Fórmulas Sagradas do Vale do Silício
                     cac_atual = custo_marketing / clientes_unicos if clientes_unicos > 0 else 0.0
@@ -1549,8 +2756,7 @@ elif menu_selecionado == "💰 Financeiro":
 
     with st.expander("➕ Lançar Novo Abatimento (Sistema FIFO)", expanded=False):
         with st.form("f_fifo_novo", clear_on_submit=True):
-            lista_todas_clientes = sorted([f"{k} - {v['nome']}" for k, v in banco_de_clientes.items()])
-            c_pg = st.selectbox("Quem está pagando?", ["Selecione..."] + lista_todas_clientes, key="fifo_cliente")
+            c_pg = st.selectbox("Quem está pagando?", opcoes_catalogo(catalogo, "clientes", "Selecione...", ordenada=True)[0], key="fifo_cliente")
             f1, f2, f3 = st.columns(3)
             v_pg = f1.number_input("Valor Pago (R$)", min_value=0.0, key="fifo_valor", help="Digite o valor exato que a cliente pagou agora.")
             meio = f2.selectbox("Meio", ["Pix", "Dinheiro", "Cartão", "Sweet Flex"], key="fifo_meio")
@@ -1559,50 +2765,47 @@ elif menu_selecionado == "💰 Financeiro":
             if st.form_submit_button("Confirmar Pagamento ✅"):
                 if v_pg > 0 and c_pg != "Selecione...":
                     try:
-                        aba_v = planilha_mestre.worksheet("VENDAS")
+                        aba_v = pegar_aba("VENDAS")
                         df_v_viva = pd.DataFrame(aba_v.get_all_records())
                         
                         # 💡 Trabalhamos com a Coluna T (Pago) e a U (Saldo) de forma inteligente
                         nome_col_pago = df_v_viva.columns[19] # Coluna T
                         nome_col_saldo = df_v_viva.columns[20] # Coluna U
                         
-                        df_v_viva['S_NUM'] = df_v_viva[nome_col_saldo].apply(limpar_v)
-                        df_v_viva['P_NUM'] = df_v_viva[nome_col_pago].apply(limpar_v)
+                        df_v_viva['S_NUM'] = limpar_v_serie(df_v_viva[nome_col_saldo])
+                        df_v_viva['P_NUM'] = limpar_v_serie(df_v_viva[nome_col_pago])
                         
                         nome_c_alvo = " - ".join(c_pg.split(" - ")[1:])
                         pendentes = df_v_viva[(df_v_viva['CLIENTE'] == nome_c_alvo) & (df_v_viva['S_NUM'] > 0)].copy()
-                        sobra = v_pg
                         
-                        linhas_afetadas = []
+                        # 💡 FIFO VETORIZADO: a soma acumulada das dívidas diz quanto do pagamento sobra para cada linha
+                        # 🪙 Tudo arredondado em centavos antes de comparar (sem isso 0,1 + 0,2 ≠ 0,3 erra a última parcela)
+                        divida_anterior = (pendentes['S_NUM'].cumsum() - pendentes['S_NUM']).round(2)
+                        pendentes['ABATIDO'] = (round(v_pg, 2) - divida_anterior).round(2).clip(lower=0).clip(upper=pendentes['S_NUM'])
+                        pendentes = pendentes[pendentes['ABATIDO'] > 0].copy()
+                        pendentes['LINHA'] = pendentes.index + 2
+                        pendentes['NOVO_T'] = (pendentes['P_NUM'] + pendentes['ABATIDO']).round(2)
+                        quitadas = pendentes[pendentes['ABATIDO'] >= pendentes['S_NUM']]
                         
-                        for idx, row in pendentes.iterrows():
-                            if sobra <= 0: break
-                            lin_planilha = idx + 2
-                            div_linha = row['S_NUM']
-                            pago_anterior = row['P_NUM']
-                            
-                            if sobra >= div_linha:
-                                # Paga a linha toda: Soma o que faltava na Coluna T
-                                novo_t = pago_anterior + div_linha
-                                aba_v.update_acell(f"T{lin_planilha}", novo_t) 
-                                aba_v.update_acell(f"W{lin_planilha}", "Pago") 
-                                linhas_afetadas.append(f"{lin_planilha}:{div_linha}")
-                                sobra -= div_linha
-                            else:
-                                # Paga só um pedaço: Soma a sobra na Coluna T
-                                novo_t = pago_anterior + sobra
-                                aba_v.update_acell(f"T{lin_planilha}", novo_t) 
-                                linhas_afetadas.append(f"{lin_planilha}:{sobra}")
-                                sobra = 0
+                        # Linha toda paga: soma na Coluna T e marca "Pago" na W. Só um pedaço: soma na T. Tudo num único envio.
+                        atualizacoes = [{"range": f"T{lin}", "values": [[float(novo_t)]]} for lin, novo_t in zip(pendentes['LINHA'], pendentes['NOVO_T'])]
+                        atualizacoes += [{"range": f"W{lin}", "values": [["Pago"]]} for lin in quitadas['LINHA']]
+                        if VENDAS_CALCULADAS:
+                            # Sem fórmula na Coluna U: o saldo novo vai junto no mesmo envio
+                            atualizacoes += [{"range": f"U{lin}", "values": [[round(float(saldo - abatido), 2)]]} for lin, saldo, abatido in zip(pendentes['LINHA'], pendentes['S_NUM'], pendentes['ABATIDO'])]
+                            atualizacoes += [{"range": f"X{lin}", "values": [[0]]} for lin in quitadas['LINHA']]
+                        if atualizacoes:
+                            aba_v.batch_update(atualizacoes, value_input_option='USER_ENTERED')
                         
+                        linhas_afetadas = [f"{lin}:{abatido:.2f}" for lin, abatido in zip(pendentes['LINHA'], pendentes['ABATIDO'])]
                         registro_afetadas = "|".join(linhas_afetadas) # Ex: 10:50.00|11:20.00
                         
-                        aba_f = planilha_mestre.worksheet("FINANCEIRO")
+                        aba_f = pegar_aba("FINANCEIRO")
                         obs_final = f"{meio}: {obs} [LOG_FIFO:{registro_afetadas}]"
                         aba_f.append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), c_pg.split(" - ")[0], nome_c_alvo, 0, v_pg, "PAGO", obs_final], value_input_option='RAW')
                         
                         st.success(f"✅ Recebido de {nome_c_alvo} processado! As fórmulas de saldo atualizaram sozinhas.")
-                        st.cache_data.clear(); st.cache_resource.clear(); st.rerun()
+                        invalidar("VENDAS", "PAINEL", completo=True); invalidar("FINANCEIRO"); st.rerun()
                     except Exception as e: st.error(f"Erro no FIFO: {e}")
 
         # --- 🕒 HISTÓRICO DE ABATIMENTOS E BORRACHA MÁGICA ---
@@ -1610,11 +2813,9 @@ elif menu_selecionado == "💰 Financeiro":
         st.subheader("🕒 Últimos Abatimentos Registrados")
         
         try:
-            aba_f_hist = planilha_mestre.worksheet("FINANCEIRO")
-            dados_f = aba_f_hist.get_all_values()
+            df_f_hist = obter_abas(["FINANCEIRO"])["FINANCEIRO"].copy()
 
-            if len(dados_f) > 1:
-                df_f_hist = pd.DataFrame(dados_f[1:], columns=dados_f[0])
+            if not df_f_hist.empty:
                 df_f_hist.columns = [c.strip() for c in df_f_hist.columns]
                 
                 if 'STATUS' in df_f_hist.columns:
@@ -1667,27 +2868,34 @@ elif menu_selecionado == "💰 Financeiro":
                                         if "[LOG_FIFO:" in obs_text:
                                             mapa_fifo = obs_text.split("[LOG_FIFO:")[1].replace("]", "")
                                             if mapa_fifo.strip():
-                                                aba_vendas_estorno = planilha_mestre.worksheet("VENDAS")
-                                                pedacos = mapa_fifo.split("|")
-                                                
-                                                for pedaco in pedacos:
+                                                aba_vendas_estorno = pegar_aba("VENDAS")
+                                                estornos = {}
+                                                for pedaco in mapa_fifo.split("|"):
                                                     if ":" in pedaco:
                                                         linha_v, valor_abatido = pedaco.split(":")
-                                                        linha_v, valor_abatido = int(linha_v), float(valor_abatido)
-                                                        
-                                                        # Busca o valor PAGO atual e subtrai o que foi estornado
-                                                        pago_atual_cell = aba_vendas_estorno.acell(f"T{linha_v}").value
-                                                        pago_atual_num = limpar_v(pago_atual_cell)
-                                                        novo_pago = max(0, pago_atual_num - valor_abatido)
-                                                        
-                                                        aba_vendas_estorno.update_acell(f"T{linha_v}", novo_pago)
-                                                        aba_vendas_estorno.update_acell(f"W{linha_v}", "Pendente")
+                                                        estornos[int(linha_v)] = estornos.get(int(linha_v), 0.0) + float(valor_abatido)
+                                                
+                                                if estornos:
+                                                    # Busca o valor PAGO atual de todas as linhas numa só leitura e subtrai o que foi estornado
+                                                    # 🧮 Modo VENDAS_CALCULADAS: o total (L) vem na mesma leitura para refazer o saldo (U)
+                                                    leituras = aba_vendas_estorno.batch_get([f"T{linha_v}" for linha_v in estornos] + ([f"L{linha_v}" for linha_v in estornos] if VENDAS_CALCULADAS else []))
+                                                    pagos_atuais = leituras[:len(estornos)]
+                                                    totais_atuais = leituras[len(estornos):] or [None] * len(estornos)
+                                                    atualizacoes = []
+                                                    for (linha_v, valor_abatido), pago_atual_cell, total_cell in zip(estornos.items(), pagos_atuais, totais_atuais):
+                                                        novo_pago = max(0, limpar_v(pago_atual_cell.first()) - valor_abatido)
+                                                        atualizacoes.append({"range": f"T{linha_v}", "values": [[novo_pago]]})
+                                                        atualizacoes.append({"range": f"W{linha_v}", "values": [["Pendente"]]})
+                                                        if total_cell is not None:
+                                                            atualizacoes.append({"range": f"U{linha_v}", "values": [[round(max(0, limpar_v(total_cell.first()) - novo_pago), 2)]]})
+                                                    # Devolve tudo de uma vez (Coluna T) e reabre as parcelas (Coluna W)
+                                                    aba_vendas_estorno.batch_update(atualizacoes, value_input_option='USER_ENTERED')
                                         
                                         # 2. DESTRÓI O RECIBO NO FINANCEIRO
-                                        planilha_mestre.worksheet("FINANCEIRO").delete_rows(dados_alvo["linha_fin"])
+                                        pegar_aba("FINANCEIRO").delete_rows(dados_alvo["linha_fin"])
                                         
                                         st.success("✅ Pagamento estornado e dívida restaurada com autonomia!")
-                                        st.cache_data.clear(); st.cache_resource.clear()
+                                        invalidar("VENDAS", "FINANCEIRO", "PAINEL", completo=True)
                                         import time; time.sleep(1); st.rerun()
                                         
                                     except Exception as e_estorno:
@@ -1712,7 +2920,7 @@ elif menu_selecionado == "💰 Financeiro":
         col_tit, col_ref = st.columns([3, 1])
         col_tit.write("Análise de carteira, cálculo de juros (CDC), histórico de contatos e IA.")
         if col_ref.button("🔄 Recarregar Dados", use_container_width=True, key="btn_ref_cob"):
-            st.cache_data.clear() 
+            invalidar("VENDAS", "FINANCEIRO", "LOG_COBRANCA", completo=True)
             st.rerun() 
             
         # 💡 MEMÓRIA DO SISTEMA PARA RECIBOS DA COBRANÇA
@@ -1746,7 +2954,7 @@ elif menu_selecionado == "💰 Financeiro":
                 
                 # --- 1. HIGIENIZAÇÃO DE DADOS ---
                 df_cobranca = df_fin.copy()
-                df_cobranca['SALDO_NUM'] = df_cobranca['SALDO DEVEDOR'].apply(limpar_v)
+                df_cobranca['SALDO_NUM'] = valores_num(df_cobranca, 'SALDO_NUM', df_cobranca['SALDO DEVEDOR'])
                 
                 if 'STATUS' in df_cobranca.columns:
                     df_cobranca['STATUS_LIMPO'] = df_cobranca['STATUS'].astype(str).str.strip().str.lower()
@@ -1775,58 +2983,56 @@ elif menu_selecionado == "💰 Financeiro":
                 df_dev_real = df_dev_real.dropna(subset=['VENCIMENTO'])
                 df_dev_real['DIAS_ATRASO'] = (hoje_pd - df_dev_real['VENCIMENTO']).dt.days
 
-                # --- 2. MOTOR FINANCEIRO (LINHA POR LINHA) ---
-                def calc_compliance(row):
-                    multa = 0
-                    juros = 0
-                    
-                    if pd.notnull(row['DATA_COMPRA']):
-                        is_legado = row['DATA_COMPRA'] < DATA_CORTE_LEGADO
-                    else:
-                        is_legado = row['VENCIMENTO'] < DATA_CORTE_LEGADO
-                    
-                    if row['DIAS_ATRASO'] > 0:
-                        if not is_legado:
-                            multa = row['SALDO_NUM'] * 0.02 # 2% de multa na linha recente
-                            juros = row['SALDO_NUM'] * (0.01 / 30) * row['DIAS_ATRASO'] # Juros na linha recente
-                        status = "🕰️ Legado" if is_legado else ("🔴 Crítico" if row['DIAS_ATRASO'] > 30 else "🟡 Recente")
-                    elif row['DIAS_ATRASO'] == 0:
-                        status = "🟢 Vence Hoje"
-                    else:
-                        status = f"📅 Vence em {abs(row['DIAS_ATRASO'])}d"
-                    
-                    valor_total = row['SALDO_NUM'] + multa + juros
-                    return pd.Series([multa, juros, valor_total, status, is_legado])
-
-                df_dev_real[['MULTA', 'JUROS', 'VALOR_ATUALIZADO', 'FASE', 'IS_LEGADO']] = df_dev_real.apply(calc_compliance, axis=1)
+                # --- 2. MOTOR FINANCEIRO (VETORIZADO: todas as parcelas de uma vez) ---
+                dias = df_dev_real['DIAS_ATRASO']
+                # Legado pela data da compra; sem ela, pela data do vencimento
+                df_dev_real['IS_LEGADO'] = df_dev_real['DATA_COMPRA'].fillna(df_dev_real['VENCIMENTO']) < DATA_CORTE_LEGADO
+                em_atraso = dias > 0
+                com_encargos = em_atraso & ~df_dev_real['IS_LEGADO']
+                df_dev_real['MULTA'] = (df_dev_real['SALDO_NUM'] * 0.02).where(com_encargos, 0.0) # 2% de multa na linha recente
+                df_dev_real['JUROS'] = (df_dev_real['SALDO_NUM'] * (0.01 / 30) * dias).where(com_encargos, 0.0) # Juros na linha recente
+                df_dev_real['VALOR_ATUALIZADO'] = df_dev_real['SALDO_NUM'] + df_dev_real['MULTA'] + df_dev_real['JUROS']
+                df_dev_real['ENCARGOS'] = df_dev_real['MULTA'] + df_dev_real['JUROS']
+
+                # Fase: a regra de maior prioridade é aplicada por último
+                df_dev_real['FASE'] = ("📅 Vence em " + dias.abs().astype(str) + "d") \
+                    .mask(dias == 0, "🟢 Vence Hoje") \
+                    .mask(em_atraso, "🟡 Recente") \
+                    .mask(em_atraso & (dias > 30), "🔴 Crítico") \
+                    .mask(em_atraso & df_dev_real['IS_LEGADO'], "🕰️ Legado")
+                df_dev_real['TEM_LEGADO'] = df_dev_real['FASE'] == "🕰️ Legado"
+                df_dev_real['TEM_CRITICO'] = df_dev_real['FASE'] == "🔴 Crítico"
+                df_dev_real['TEM_RECENTE'] = df_dev_real['FASE'] == "🟡 Recente"
 
                 # --- 3. CONSOLIDAÇÃO POR CLIENTE (STATUS MISTO) ---
-                def status_misto(fases):
-                    fases_lista = list(fases)
-                    tem_legado = any("Legado" in f for f in fases_lista)
-                    tem_critico = any("Crítico" in f for f in fases_lista)
-                    tem_recente = any("Recente" in f for f in fases_lista)
-                    
-                    if tem_legado and tem_critico: return "🔴 Crítico + 🕰️ Legado"
-                    if tem_legado and tem_recente: return "🟡 Recente + 🕰️ Legado"
-                    if tem_critico: return "🔴 Crítico"
-                    if tem_recente: return "🟡 Recente"
-                    if tem_legado: return "🕰️ Legado"
-                    return fases_lista[0]
-
                 df_agrupado = df_dev_real.groupby(['CÓD. CLIENTE', 'CLIENTE']).agg(
                     TOTAL_ORIGINAL=pd.NamedAgg(column='SALDO_NUM', aggfunc='sum'),
                     TOTAL_ATUALIZADO=pd.NamedAgg(column='VALOR_ATUALIZADO', aggfunc='sum'),
-                    TOTAL_ENCARGOS=pd.NamedAgg(column='MULTA', aggfunc=lambda x: x.sum() + df_dev_real.loc[x.index, 'JUROS'].sum()),
+                    TOTAL_ENCARGOS=pd.NamedAgg(column='ENCARGOS', aggfunc='sum'),
                     MAIOR_ATRASO=pd.NamedAgg(column='DIAS_ATRASO', aggfunc='max'),
-                    STATUS_PREDOMINANTE=pd.NamedAgg(column='FASE', aggfunc=status_misto)
+                    PRIMEIRA_FASE=pd.NamedAgg(column='FASE', aggfunc='first'),
+                    TEM_LEGADO=pd.NamedAgg(column='TEM_LEGADO', aggfunc='any'),
+                    TEM_CRITICO=pd.NamedAgg(column='TEM_CRITICO', aggfunc='any'),
+                    TEM_RECENTE=pd.NamedAgg(column='TEM_RECENTE', aggfunc='any')
                 ).reset_index()
+                legado, critico, recente = df_agrupado['TEM_LEGADO'], df_agrupado['TEM_CRITICO'], df_agrupado['TEM_RECENTE']
+                df_agrupado['STATUS_PREDOMINANTE'] = df_agrupado['PRIMEIRA_FASE'] \
+                    .mask(legado, "🕰️ Legado") \
+                    .mask(recente, "🟡 Recente") \
+                    .mask(critico, "🔴 Crítico") \
+                    .mask(legado & recente, "🟡 Recente + 🕰️ Legado") \
+                    .mask(legado & critico, "🔴 Crítico + 🕰️ Legado")
+                df_agrupado = df_agrupado.drop(columns=['PRIMEIRA_FASE', 'TEM_LEGADO', 'TEM_CRITICO', 'TEM_RECENTE'])
 
                 df_agrupado['CLIENTE_EXIBICAO'] = df_agrupado['CÓD. CLIENTE'].astype(str) + " - " + df_agrupado['CLIENTE']
 
                 LIMITE_DIAS_FLEX = 15
-                df_agrupado['SWEET_FLEX'] = df_agrupado['MAIOR_ATRASO'].apply(lambda dias: "🔒 Suspenso" if dias > LIMITE_DIAS_FLEX else "🔑 Liberado")
-                df_agrupado['SWEET_SCORE'] = df_agrupado['MAIOR_ATRASO'].apply(lambda dias: "⭐ 10/10" if dias <= 0 else ("🟢 8/10" if dias <= 7 else ("🟡 5/10" if dias <= 20 else "🔴 3/10")))
+                maior_atraso = df_agrupado['MAIOR_ATRASO']
+                df_agrupado['SWEET_FLEX'] = pd.Series("🔑 Liberado", index=df_agrupado.index).mask(maior_atraso > LIMITE_DIAS_FLEX, "🔒 Suspenso")
+                df_agrupado['SWEET_SCORE'] = pd.Series("🔴 3/10", index=df_agrupado.index) \
+                    .mask(maior_atraso <= 20, "🟡 5/10") \
+                    .mask(maior_atraso <= 7, "🟢 8/10") \
+                    .mask(maior_atraso <= 0, "⭐ 10/10")
 
                 # Lógica do Vale Desconto
                 try:
@@ -1850,32 +3056,24 @@ elif menu_selecionado == "💰 Financeiro":
 
                 # --- 4. O CÉREBRO DO CRM (LEITURA DO LOG_COBRANCA) ---
                 try:
-                    aba_log = planilha_mestre.worksheet("LOG_COBRANCA")
-                    dados_log = aba_log.get_all_values()
-                    if len(dados_log) > 1:
-                        df_log = pd.DataFrame(dados_log[1:], columns=dados_log[0])
+                    df_log = obter_abas(["LOG_COBRANCA"])["LOG_COBRANCA"].copy()
+                    if not df_log.empty:
                         df_log['DATA_HORA_DT'] = pd.to_datetime(df_log['DATA_HORA'], format='%d/%m/%Y %H:%M', errors='coerce')
                     else:
                         df_log = pd.DataFrame(columns=['DATA_HORA', 'COD_CLIENTE', 'NOME_CLIENTE', 'STATUS_CONTATO', 'DATA_PROMESSA', 'OBSERVACOES', 'ATENDENTE', 'DATA_HORA_DT'])
                 except:
                     df_log = pd.DataFrame(columns=['DATA_HORA', 'COD_CLIENTE', 'NOME_CLIENTE', 'STATUS_CONTATO', 'DATA_PROMESSA', 'OBSERVACOES', 'ATENDENTE', 'DATA_HORA_DT'])
 
-                df_agrupado['ULTIMO_CONTATO'] = "Nunca Cobrado"
-                df_agrupado['STATUS_CRM'] = "Sem Ação"
-                df_agrupado['COOLDOWN'] = "Livre"
-                
-                if not df_log.empty:
-                    for idx, row in df_agrupado.iterrows():
-                        historico_cli = df_log[df_log['COD_CLIENTE'] == row['CÓD. CLIENTE']].sort_values('DATA_HORA_DT', ascending=False)
-                        if not historico_cli.empty:
-                            ultimo = historico_cli.iloc[0]
-                            df_agrupado.at[idx, 'ULTIMO_CONTATO'] = ultimo['DATA_HORA'].split(" ")[0]
-                            df_agrupado.at[idx, 'STATUS_CRM'] = ultimo['STATUS_CONTATO']
-                            
-                            if pd.notnull(ultimo['DATA_HORA_DT']):
-                                horas_desde_contato = (hoje_dt.replace(tzinfo=None) - ultimo['DATA_HORA_DT']).total_seconds() / 3600
-                                if horas_desde_contato < 24:
-                                    df_agrupado.at[idx, 'COOLDOWN'] = "🛡️ Protegido (24h)"
+                # 💡 Último contato de cada cliente: ordena o log uma vez, fica com o mais recente por código e junta (merge)
+                ultimos = df_log.sort_values('DATA_HORA_DT', ascending=False, kind='stable').drop_duplicates('COD_CLIENTE')
+                ultimos = ultimos[['COD_CLIENTE', 'DATA_HORA', 'STATUS_CONTATO', 'DATA_HORA_DT']].rename(columns={'COD_CLIENTE': 'CÓD. CLIENTE'})
+                ultimos['DATA_HORA_DT'] = pd.to_datetime(ultimos['DATA_HORA_DT']) # Log vazio chega sem tipo de data
+                df_agrupado = df_agrupado.merge(ultimos, on='CÓD. CLIENTE', how='left')
+                df_agrupado['ULTIMO_CONTATO'] = df_agrupado['DATA_HORA'].fillna("").astype(str).str.split(" ").str[0].where(df_agrupado['DATA_HORA'].notna(), "Nunca Cobrado")
+                df_agrupado['STATUS_CRM'] = df_agrupado['STATUS_CONTATO'].where(df_agrupado['DATA_HORA'].notna(), "Sem Ação")
+                horas_desde_contato = (hoje_dt.replace(tzinfo=None) - df_agrupado['DATA_HORA_DT']).dt.total_seconds() / 3600
+                df_agrupado['COOLDOWN'] = pd.Series("Livre", index=df_agrupado.index).mask(horas_desde_contato < 24, "🛡️ Protegido (24h)")
+                df_agrupado = df_agrupado.drop(columns=['DATA_HORA', 'STATUS_CONTATO', 'DATA_HORA_DT'])
 
                 atrasados = df_agrupado[df_agrupado['MAIOR_ATRASO'] > 0].sort_values('MAIOR_ATRASO', ascending=False)
                 prevencao = df_agrupado[(df_agrupado['MAIOR_ATRASO'] <= 0) & (df_agrupado['MAIOR_ATRASO'] >= -5)].sort_values('MAIOR_ATRASO', ascending=False)
@@ -2073,7 +3271,7 @@ elif menu_selecionado == "💰 Financeiro":
                                 if st.form_submit_button("Salvar no Dossiê 📥", type="primary"):
                                     with st.spinner("Arquivando..."):
                                         try:
-                                            aba_log_add = planilha_mestre.worksheet("LOG_COBRANCA")
+                                            aba_log_add = pegar_aba("LOG_COBRANCA")
                                             data_agora = datetime.now(fuso_br).strftime("%d/%m/%Y %H:%M")
                                             data_prom_str = f_data_promessa.strftime("%d/%m/%Y") if f_status in ["Promessa de Pagamento", "Acordo Fechado"] else "-"
                                             
@@ -2084,7 +3282,7 @@ elif menu_selecionado == "💰 Financeiro":
                                             aba_log_add.append_row(nova_linha_log, value_input_option='USER_ENTERED')
                                             
                                             st.session_state['recibo_cobranca'] = {"cliente": dados_cli['CLIENTE'], "status": f_status, "promessa": data_prom_str}
-                                            st.cache_data.clear(); st.rerun()
+                                            invalidar("LOG_COBRANCA"); st.rerun()
                                         except Exception as e: st.error(f"Erro ao salvar: {e}")
 
             else:
@@ -2104,15 +3302,14 @@ elif menu_selecionado == "💰 Financeiro":
         try:
             # Processa Aportes (Entradas)
             if not df_aportes.empty:
-                df_aportes['VALOR_NUM'] = df_aportes['VALOR_R$'].apply(limpar_v)
-                aporte_total_empresa = df_aportes['VALOR_NUM'].sum()
+                aporte_total_empresa = valores_num(df_aportes, 'VALOR_NUM', df_aportes['VALOR_R$']).sum()
             else:
                 aporte_total_empresa = 0.0
 
             # Processa Retiradas (Saídas) focando na Coluna L = TOTAL R$ e Coluna H = QUANTIDADE
             if not df_retiradas.empty:
                 # Puxa a Coluna L (Índice 11) para somar os valores financeiros
-                df_retiradas['RETIRADA_NUM'] = df_retiradas.iloc[:, 11].apply(limpar_v)
+                df_retiradas['RETIRADA_NUM'] = valores_num(df_retiradas, 'VALOR_NUM', df_retiradas.iloc[:, 11])
                 
                 # Puxa a Coluna H (Índice 7) para somar as peças físicas reais
                 df_retiradas['QTD_PECAS'] = pd.to_numeric(df_retiradas.iloc[:, 7], errors='coerce').fillna(0)
@@ -2153,7 +3350,7 @@ elif menu_selecionado == "💰 Financeiro":
             if st.form_submit_button("Adicionar ao Quadro Societário", type="secondary"):
                 if nome_s:
                     try:
-                        aba_soc = planilha_mestre.worksheet("SOCIOS")
+                        aba_soc = pegar_aba("SOCIOS")
                         dados_soc = aba_soc.get_all_values()
                         
                         # 💡 Geração Inteligente de Código (À prova de falhas/exclusões)
@@ -2177,8 +3374,7 @@ elif menu_selecionado == "💰 Financeiro":
                         ], value_input_option='RAW')
                         
                         st.success(f"✅ {nome_s} cadastrado com sucesso! Código gerado: **{novo_cod}**")
-                        st.cache_data.clear()
-                        st.cache_resource.clear()
+                        invalidar("SOCIOS")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao cadastrar na aba SOCIOS: {e}")
@@ -2213,14 +3409,14 @@ elif menu_selecionado == "💰 Financeiro":
                         st.warning("⚠️ O valor do aporte deve ser maior que zero.")
                     else:
                         try:
-                            aba_ap = planilha_mestre.worksheet("APORTES")
+                            aba_ap = pegar_aba("APORTES")
                             cod_soc, nome_soc = socio_aporte.split(" - ")[0], socio_aporte.split(" - ")[1]
                             aba_ap.append_row([
                                 datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y %H:%M"),
                                 cod_soc, nome_soc, valor_aporte, tipo_aporte, obs_aporte
                             ], value_input_option='RAW')
                             st.success("✅ Capital injetado com sucesso!")
-                            st.cache_data.clear()
+                            invalidar("APORTES")
                             st.rerun()
                         except Exception as e:
                             st.error(f"Erro ao salvar na aba APORTES: {e}")
@@ -2302,8 +3498,7 @@ elif menu_selecionado == "💰 Financeiro":
             st.error(f"Erro ao calcular Cap Table. Certifique-se que as abas SOCIOS e APORTES existem. {e}")
             
     st.markdown("### 🔍 Ficha de Cliente (Extrato Dinâmico)")
-    opcoes_ficha = sorted([f"{k} - {v['nome']}" for k, v in banco_de_clientes.items()])
-    sel_ficha = st.selectbox("Selecione para ver o que ela deve:", ["---"] + opcoes_ficha, key="ficha_sel_cliente")
+    sel_ficha = st.selectbox("Selecione para ver o que ela deve:", opcoes_catalogo(catalogo, "clientes", "---", ordenada=True)[0], key="ficha_sel_cliente")
     
     if sel_ficha != "---":
         id_c = sel_ficha.split(" - ")[0]
@@ -2313,7 +3508,7 @@ elif menu_selecionado == "💰 Financeiro":
         v_hist = df_vendas_hist[df_vendas_hist['CÓD. CLIENTE'].astype(str).str.strip() == str(id_c).strip()].copy()
         
         # Cria uma coluna numérica temporária para facilitar a soma e o filtro
-        v_hist['SALDO_NUM'] = v_hist['SALDO DEVEDOR'].apply(limpar_v)
+        v_hist['SALDO_NUM'] = valores_num(v_hist, 'SALDO_NUM', v_hist['SALDO DEVEDOR'])
         saldo_devedor_real = v_hist['SALDO_NUM'].sum()
         
         c_f1, c_f2 = st.columns(2)
@@ -2498,7 +3693,7 @@ elif menu_selecionado == "📦 Estoque":
         # 📊 Processamento de Métricas
         df_estoque['EST_NUM'] = pd.to_numeric(df_estoque['ESTOQUE ATUAL'], errors='coerce').fillna(0)
         df_estoque['VENDAS_NUM'] = pd.to_numeric(df_estoque['QTD VENDIDA'], errors='coerce').fillna(0)
-        df_estoque['CUSTO_NUM'] = df_estoque['CUSTO UNITÁRIO R$'].apply(limpar_v)
+        df_estoque['CUSTO_NUM'] = valores_num(df_estoque, 'CUSTO_NUM', df_estoque['CUSTO UNITÁRIO R$'])
         
         total_skus = len(df_estoque)
         capital_parado = (df_estoque['EST_NUM'] * df_estoque['CUSTO_NUM']).sum()
@@ -2608,10 +3803,9 @@ elif menu_selecionado == "📦 Estoque":
     busca_radar = st.text_input("Pesquisar produto para atualizar", placeholder="Ex: lencol casal ou 800", key="txt_busca_radar")
     
     if busca_radar and not df_estoque.empty:
-        t_limpo = limpar_texto(busca_radar)
-        df_estoque['Nome_L'] = df_estoque['NOME DO PRODUTO'].apply(limpar_texto)
-        df_estoque['Cod_L'] = df_estoque['CÓD. PRÓDUTO'].astype(str).str.lower().str.strip()
-        res = df_estoque[df_estoque['Nome_L'].str.contains(t_limpo, na=False) | df_estoque['Cod_L'].str.contains(t_limpo, na=False)]
+        # 🔎 Índice montado uma vez por versão dos dados (código + nome, sem acento)
+        indice_produtos = indice_busca("produtos", versao_abas(), lambda: (df_full_inv['CÓD. PRÓDUTO'].astype(str) + " " + df_full_inv['NOME DO PRODUTO'].astype(str)).to_dict())
+        res = df_estoque.loc[[i for i in buscar_no_indice(indice_produtos, busca_radar) if i in df_estoque.index]]
         
         if not res.empty:
             opcs = ["Nenhum. É um produto 100% NOVO."] + [f"{r['CÓD. PRÓDUTO']} - {r['NOME DO PRODUTO']}" for _, r in res.iterrows()]
@@ -2639,11 +3833,11 @@ elif menu_selecionado == "📦 Estoque":
                             q_nova = st.number_input("Quantidade recebida", 1)
                             if st.form_submit_button("Confirmar Entrada"):
                                 with st.spinner("Atualizando..."):
-                                    aba = planilha_mestre.worksheet("INVENTÁRIO")
+                                    aba = pegar_aba("INVENTÁRIO")
                                     aba.update_acell(f"C{lin_p}", comp_c + q_nova)
                                     aba.update_acell(f"J{lin_p}", datetime.now().strftime("%d/%m/%Y"))
-                                    planilha_mestre.worksheet("LOG_ESTOQUE").append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), "REPOSIÇÃO", nome_e, f"+{q_nova} un.", st.session_state.get('usuario_logado', 'Bia')], value_input_option='RAW')
-                                    st.success("Estoque Atualizado!"); st.cache_data.clear(); st.rerun()
+                                    pegar_aba("LOG_ESTOQUE").append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), "REPOSIÇÃO", nome_e, f"+{q_nova} un.", st.session_state.get('usuario_logado', 'Bia')], value_input_option='RAW')
+                                    st.success("Estoque Atualizado!"); invalidar("INVENTÁRIO", "LOG_ESTOQUE"); st.rerun()
 
                     elif acao == "2. Novo Lote (Preço Novo)":
                         with st.form("f_lote"):
@@ -2655,41 +3849,36 @@ elif menu_selecionado == "📦 Estoque":
                             
                             if st.form_submit_button("Gerar Lote"):
                                 with st.spinner("Criando lote..."):
-                                    aba = planilha_mestre.worksheet("INVENTÁRIO")
-                                    
                                     # 🛡️ Fórmulas Blindadas do Estoque
                                     f_total_e = '=SE(INDIRETO("C"&LIN())=""; ""; ARRED(INDIRETO("C"&LIN()) * INDIRETO("D"&LIN()); 2))'
                                     
                                     # 💡 A NOVA FÓRMULA: O SOMASE que busca na aba VENDAS
                                     f_vend_g = '=SE(INDIRETO("A"&LIN())=""; 0; SOMASE(VENDAS!E:E; INDIRETO("A"&LIN()); VENDAS!H:H))'
+                                    if VENDIDOS_CALCULADOS: f_vend_g = 0 # Código novo ainda sem vendas: a contagem do app assume daqui
                                     
                                     f_estoque_h = '=SE(INDIRETO("C"&LIN())=""; ""; INDIRETO("C"&LIN()) - INDIRETO("G"&LIN()))'
                                     
-                                    base = str(cod_e).split(".")[0]
-                                    ext = str(cod_e).split(".")[1] if "." in str(cod_e) else "0"
-                                    n_cod = f"{base}.{int(ext)+1}"
+                                    # 🧬 Próximo lote da família inteira (não só do lote selecionado, que pode ser antigo)
+                                    n_cod = proximo_lote(familias_produtos(versao_abas(), list(banco_de_produtos)), cod_e)
+                                    ext = n_cod.split(".")[1]
                                     
                                     # Atualiza o antigo se pediu para puxar
                                     if puxar: 
-                                        try: aba.update_acell(f"C{lin_p}", vend_g)
+                                        try: pegar_aba("INVENTÁRIO").update_acell(f"C{lin_p}", vend_g)
                                         except: pass
 
                                     # Nova linha com as 3 fórmulas injetadas
                                     nova_linha = [
-                                        n_cod, f"{nome_e} (Lote {int(ext)+1})", 
+                                        n_cod, f"{nome_e} (Lote {ext})", 
                                         q_l + (est_h if puxar else 0), cu_l, 
                                         f_total_e, 3, f_vend_g, f_estoque_h, 
                                         pr_l, datetime.now().strftime("%d/%m/%Y"), ""
                                     ]
                                     
-                                    try:
-                                        cel_tot = aba.find("TOTAIS")
-                                        aba.insert_row(nova_linha, index=cel_tot.row, value_input_option='USER_ENTERED')
-                                    except: 
-                                        aba.append_row(nova_linha, value_input_option='USER_ENTERED')
+                                    inserir_linhas_antes_totais(planilha_mestre, {"INVENTÁRIO": [nova_linha]})
                                         
-                                    planilha_mestre.worksheet("LOG_ESTOQUE").append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), "NOVO LOTE", nome_e, f"Lote {n_cod}", st.session_state.get('usuario_logado', 'Bia')], value_input_option='RAW')
-                                    st.success(f"Lote {n_cod} criado!"); st.cache_data.clear(); st.rerun()
+                                    pegar_aba("LOG_ESTOQUE").append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), "NOVO LOTE", nome_e, f"Lote {n_cod}", st.session_state.get('usuario_logado', 'Bia')], value_input_option='RAW')
+                                    st.success(f"Lote {n_cod} criado!"); invalidar("INVENTÁRIO", "LOG_ESTOQUE"); st.rerun()
 
                     elif acao == "3. Correção":
                         with st.form("f_cor"):
@@ -2706,7 +3895,7 @@ elif menu_selecionado == "📦 Estoque":
                             
                             if st.form_submit_button("💾 Salvar Correções"):
                                 with st.spinner("Sincronizando..."):
-                                    aba = planilha_mestre.worksheet("INVENTÁRIO")
+                                    aba = pegar_aba("INVENTÁRIO")
                                     
                                     atualizacoes = [
                                         {'range': f'A{lin_p}', 'values': [[novo_cod.strip()]]},
@@ -2717,7 +3906,7 @@ elif menu_selecionado == "📦 Estoque":
                                     ]
                                     aba.batch_update(atualizacoes, value_input_option='USER_ENTERED')
                                     
-                                    planilha_mestre.worksheet("LOG_ESTOQUE").append_row([
+                                    pegar_aba("LOG_ESTOQUE").append_row([
                                         datetime.now().strftime("%d/%m/%Y"), 
                                         datetime.now().strftime("%H:%M"), 
                                         "CORREÇÃO GERAL", 
@@ -2735,7 +3924,7 @@ elif menu_selecionado == "📦 Estoque":
                                         "custo": novo_custo,
                                         "preco": novo_preco
                                     }
-                                    st.cache_data.clear(); st.rerun()
+                                    invalidar("INVENTÁRIO", "LOG_ESTOQUE"); st.rerun()
 
     # ==========================================
     # 🧾 RECIBO DE CORREÇÃO DO RADAR
@@ -2768,11 +3957,10 @@ elif menu_selecionado == "📦 Estoque":
             
             if st.form_submit_button("Salvar Novo Produto") and n_c and n_n:
                 with st.spinner("Cadastrando..."):
-                    aba = planilha_mestre.worksheet("INVENTÁRIO")
-                    
                     # 🛡️ Fórmulas Blindadas do Estoque
                     f_total_e = '=SE(INDIRETO("C"&LIN())=""; ""; ARRED(INDIRETO("C"&LIN()) * INDIRETO("D"&LIN()); 2))'
                     f_vend_g = '=SE(INDIRETO("A"&LIN())=""; 0; SOMASE(VENDAS!E:E; INDIRETO("A"&LIN()); VENDAS!H:H))'
+                    if VENDIDOS_CALCULADOS: f_vend_g = 0 # Código novo ainda sem vendas: a contagem do app assume daqui
                     f_estoque_h = '=SE(INDIRETO("C"&LIN())=""; ""; INDIRETO("C"&LIN()) - INDIRETO("G"&LIN()))'
                     
                     # Injeta o f_vend_g na coluna G
@@ -2780,21 +3968,17 @@ elif menu_selecionado == "📦 Estoque":
                         n_c, n_n, n_q, n_custo, f_total_e, 3, f_vend_g, f_estoque_h, n_v, datetime.now().strftime("%d/%m/%Y"), ""
                     ]
                     
-                    try:
-                        cel_tot = aba.find("TOTAIS")
-                        aba.insert_row(linha_manual, index=cel_tot.row, value_input_option='USER_ENTERED')
-                    except: 
-                        aba.append_row(linha_manual, value_input_option='USER_ENTERED')
+                    inserir_linhas_antes_totais(planilha_mestre, {"INVENTÁRIO": [linha_manual]})
                     
                     # 💡 Ajuste de Vendedor (Sai a "Bia", entra o nome do usuário real)
-                    planilha_mestre.worksheet("LOG_ESTOQUE").append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), "CADASTRO", n_n, f"Cód: {n_c}", st.session_state.get('usuario_logado', 'Sistema')], value_input_option='RAW')
-                    st.success("✅ Cadastrado!"); st.cache_data.clear(); st.rerun()
+                    pegar_aba("LOG_ESTOQUE").append_row([datetime.now().strftime("%d/%m/%Y"), datetime.now().strftime("%H:%M"), "CADASTRO", n_n, f"Cód: {n_c}", st.session_state.get('usuario_logado', 'Sistema')], value_input_option='RAW')
+                    st.success("✅ Cadastrado!"); invalidar("INVENTÁRIO", "LOG_ESTOQUE"); st.rerun()
 
     # 📜 HISTÓRICO E BUSCA FINAL (DENTRO DA ABA ESTOQUE)
     st.divider()
     st.write("### 📜 Histórico de Movimentações (Banco de Dados)")
     try:
-        df_log_db = pd.DataFrame(planilha_mestre.worksheet("LOG_ESTOQUE").get_all_records())
+        df_log_db = obter_abas(["LOG_ESTOQUE"])["LOG_ESTOQUE"]
         if not df_log_db.empty:
             st.dataframe(df_log_db.sort_index(ascending=False).head(20), use_container_width=True, hide_index=True)
         else: st.info("Nenhuma movimentação registrada.")
@@ -2804,8 +3988,9 @@ elif menu_selecionado == "📦 Estoque":
     busca_lista = st.text_input("🔍 Buscar na Lista Abaixo", key="txt_busca_lista_estoque")
     df_ver = df_full_inv.copy()
     if busca_lista: 
-        df_ver = df_ver[df_ver.apply(lambda r: busca_lista.lower() in str(r).lower(), axis=1)]
-    st.dataframe(df_ver, use_container_width=True, hide_index=True)
+        indice_lista = indice_busca("inventario_completo", versao_abas(), lambda: sem_colunas_tipadas(df_full_inv).astype(str).agg(" ".join, axis=1).to_dict())
+        df_ver = df_ver.loc[buscar_no_indice(indice_lista, busca_lista)]
+    st.dataframe(sem_colunas_tipadas(df_ver), use_container_width=True, hide_index=True)
     
 # ==========================================
 # --- SEÇÃO 4: CLIENTES E CRM ---
@@ -2908,7 +4093,7 @@ elif menu_selecionado == "👥 Clientes":
                             from datetime import datetime
                             agora = datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y")
                             
-                            aba_cli_sheet = planilha_mestre.worksheet("CARTEIRA DE CLIENTES")
+                            aba_cli_sheet = pegar_aba("CARTEIRA DE CLIENTES")
                             dados_c = aba_cli_sheet.get_all_values()
                             
                             if len(dados_c) > 1:
@@ -2923,14 +4108,7 @@ elif menu_selecionado == "👥 Clientes":
                             
                             linha_cliente = [codigo, n_nome.strip(), n_zap.strip(), n_end.strip(), agora, n_vale, "", status_cad]
                             
-                            try:
-                                cel_tot_cli = aba_cli_sheet.find("TOTAIS")
-                                aba_cli_sheet.insert_row(linha_cliente, index=cel_tot_cli.row, value_input_option='USER_ENTERED')
-                            except:
-                                valores_colA = aba_cli_sheet.col_values(1)
-                                linhas_reais = [v for v in valores_colA if str(v).strip() != ""]
-                                prox_linha = len(linhas_reais) + 1
-                                aba_cli_sheet.insert_row(linha_cliente, index=prox_linha, value_input_option='USER_ENTERED')
+                            inserir_linhas_antes_totais(planilha_mestre, {"CARTEIRA DE CLIENTES": [linha_cliente]})
                             
                             st.session_state['recibo_novo_cliente'] = {
                                 "codigo": codigo,
@@ -2941,8 +4119,7 @@ elif menu_selecionado == "👥 Clientes":
                             # Limpa a memória do CEP para o próximo cliente
                             st.session_state['form_endereco_magico'] = "" 
                             
-                            st.cache_data.clear()
-                            st.cache_resource.clear()
+                            invalidar("CARTEIRA DE CLIENTES")
                             st.rerun() 
                         except Exception as e:
                             st.error(f"Erro: {e}")
@@ -3023,7 +4200,7 @@ elif menu_selecionado == "👥 Clientes":
 
                 if botao_salvar:
                     try:
-                        aba_cli_sheet = planilha_mestre.worksheet("CARTEIRA DE CLIENTES")
+                        aba_cli_sheet = pegar_aba("CARTEIRA DE CLIENTES")
                         celula = aba_cli_sheet.find(id_edit)
                         num_linha = celula.row
 
@@ -3036,8 +4213,7 @@ elif menu_selecionado == "👥 Clientes":
                         aba_cli_sheet.update_cell(num_linha, 8, novo_status)
 
                         st.success(f"✅ Dados de {novo_nome} atualizados!")
-                        st.cache_data.clear()
-                        st.cache_resource.clear()
+                        invalidar("CARTEIRA DE CLIENTES")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao salvar na planilha: {e}")
@@ -3049,8 +4225,7 @@ elif menu_selecionado == "📂 Documentos":
     st.subheader("📂 Cofre Digital & Fila Odoo")
 
     try:
-        dados_doc = planilha_mestre.worksheet("DOCUMENTOS").get_all_values()
-        df_docs = pd.DataFrame(dados_doc[1:], columns=dados_doc[0]) if len(dados_doc) > 1 else pd.DataFrame()
+        df_docs = obter_abas(["DOCUMENTOS"])["DOCUMENTOS"]
     except: 
         df_docs = pd.DataFrame()
 
@@ -3102,12 +4277,11 @@ elif menu_selecionado == "📂 Documentos":
                         # Botão manual (caso você não queira usar o robô e queira dar baixa na mão)
                         if c3.button("✅ Publicado", key=f"btn_odoo_{idx}"):
                             try:
-                                aba_doc = planilha_mestre.worksheet("DOCUMENTOS")
+                                aba_doc = pegar_aba("DOCUMENTOS")
                                 cell = aba_doc.find(r['ID_ARQUIVO'])
                                 aba_doc.update_cell(cell.row, 7, "Publicado no Odoo")
                                 st.success("Atualizado!")
-                                st.cache_data.clear()
-                                st.cache_resource.clear()
+                                invalidar("DOCUMENTOS")
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"Erro ao atualizar: {e}")
@@ -3124,85 +4298,58 @@ elif menu_selecionado == "📂 Documentos":
             st.session_state.relatorio_fixo = None
 
         # Botão de ação principal
-        if st.button("🚀 Iniciar Nova Varredura Completa", use_container_width=True):
+        if st.button("🚀 Iniciar Nova Varredura Completa", use_container_width=True, disabled=varredura_rodando()):
             try:
                 # --- CARREGAMENTO E FILTRO DE TOTAIS ---
-                aba_inv = planilha_mestre.worksheet("INVENTÁRIO")
-                dados_inv = aba_inv.get_all_values()
-                df_inv = pd.DataFrame(dados_inv[1:], columns=dados_inv[0])
+                # 💡 Da memória do INVENTÁRIO (sem baixar a aba de novo): a gravação no fim relê as linhas de qualquer jeito
+                codigos_inv = [str(linha[0]).strip() if linha else "" for linha in matriz_aba("INVENTÁRIO")[1:]]
                 
                 # Localiza a linha de TOTAIS para o robô parar
-                idx_limite = df_inv[df_inv['CÓD. PRÓDUTO'].str.upper().str.contains("TOTAIS", na=False)].index.min()
-                df_proc = df_inv.iloc[:idx_limite].copy() if not pd.isna(idx_limite) else df_inv.copy()
-                df_proc = df_proc[df_proc['CÓD. PRÓDUTO'].str.strip() != ""]
-
-                if not df_proc.empty:
-                    # Mapeamento de versões (famílias .1, .2, etc)
-                    df_proc['BASE'] = df_proc['CÓD. PRÓDUTO'].apply(lambda x: str(x).split('.')[0].strip())
-                    mapa_mais_recente = df_proc.groupby('BASE')['CÓD. PRÓDUTO'].last().to_dict()
-
-                    st.info(f"🔍 Varrendo {len(df_proc)} linhas do inventário...")
-                    barra = st.progress(0)
-                    status_txt = st.empty()
-                    dados_acumulados = []
-                    
-                    # Acessa a aba DOCUMENTOS para a integração
-                    aba_doc = planilha_mestre.worksheet("DOCUMENTOS")
-
-                    for i, (idx, row) in enumerate(df_proc.iterrows()):
-                        cod_atual = str(row['CÓD. PRÓDUTO']).strip()
-                        base_cod = row['BASE']
-                        versao_topo = mapa_mais_recente[base_cod]
-                        linha_p = idx + 2
-                        
-                        status_txt.markdown(f"⏳ **Analisando:** `{cod_atual}`")
-                        
-                        # Chamada ao robô de busca
-                        achou, link_ref = verificar_status_odoo(cod_atual)
-                        time.sleep(1.3) # Respeito ao limite do Google
-
-                        if achou:
-                            # Lógica de diagnóstico de versão
-                            if cod_atual == versao_topo:
-                                status_inv, res_obs = "Publicado", "✅ Publicado (Atualizado)"
-                            else:
-                                status_inv, res_obs = "Publicado (Site Desatualizado)", "⚠️ Site com Versão Antiga"
-                            
-                            # Atualiza ABA INVENTÁRIO
-                            aba_inv.update_cell(linha_p, 11, link_ref) # Link
-                            aba_inv.update_cell(linha_p, 12, status_inv) # Status
-                            
-                            # 🔗 INTEGRAÇÃO COM DOCUMENTOS (Limpeza da Linha de Montagem)
-                            if not df_docs.empty:
-                                # Busca se o código atual está no vínculo das fotos
-                                matches = df_docs[df_docs['VINCULO'].str.contains(cod_atual, na=False)].index
-                                for m_idx in matches:
-                                    aba_doc.update_cell(int(m_idx) + 2, 7, "Publicado no Odoo")
-                        else:
-                            # Caso não encontre no site
-                            aba_inv.update_cell(linha_p, 12, "Não Publicado")
-                            res_obs = "❌ Não Encontrado"
-
-                        dados_acumulados.append({
-                            "Linha": linha_p,
-                            "Cód. SKU": cod_atual,
-                            "Status Site": res_obs,
-                            "Ação": "OK" if "✅" in res_obs else ("⚠️ Atualizar Odoo" if "⚠️" in res_obs else "❌ Publicar")
-                        })
-                        barra.progress((i + 1) / len(df_proc))
-
-                    # 💾 SALVANDO RESULTADO NO COFRE
-                    st.session_state.relatorio_fixo = pd.DataFrame(dados_acumulados)
-                    status_txt.empty()
-                    st.success("Varredura Finalizada!")
-                    
-                    # Limpa o cache e força o app a ler as planilhas novas
-                    st.cache_data.clear()
-                    st.rerun()
+                idx_limite = next((i for i, cod in enumerate(codigos_inv) if "TOTAIS" in cod.upper()), len(codigos_inv))
+                codigos_proc = list(dict.fromkeys(cod for cod in codigos_inv[:idx_limite] if cod))
+
+                if codigos_proc:
+                    # 📝 O plano vai para o disco: se o servidor reiniciar, a varredura continua de onde parou.
+                    # Só os códigos (sem número de linha): versões, linhas e vínculos das fotos são achados na hora de gravar
+                    plano = [{"cod": cod} for cod in codigos_proc]
+
+                    if iniciar_varredura(plano):
+                        st.info(f"🔍 Varredura de {len(plano)} linhas iniciada em segundo plano. Pode navegar à vontade!")
+                    else:
+                        st.warning("⏳ Já existe uma varredura em andamento.")
 
             except Exception as e:
                 st.error(f"Erro na varredura: {e}")
 
+        # ⏳ Painel de acompanhamento: só este bloco se atualiza sozinho a cada 2s, e só enquanto há varredura rodando
+        @st.fragment(run_every=2 if varredura_rodando() else None)
+        def painel_varredura():
+            estado = gerente_varredura()["estado"]
+            if not estado: return
+            if estado.get("status") in ("rodando", "gravando"):
+                total = len(estado["plano"]) or 1
+                st.progress(min(estado["proximo"] / total, 1.0))
+                if estado["status"] == "gravando":
+                    st.caption("💾 Gravando resultados na planilha...")
+                else:
+                    st.caption(f"⏳ Analisando: {estado['proximo']} de {total} linhas (iniciada em {estado['iniciada_em']})")
+            elif st.session_state.get("varredura_exibida") != estado.get("iniciada_em"):
+                # A varredura acabou: recarrega a página inteira uma vez para mostrar o relatório
+                st.session_state["varredura_exibida"] = estado.get("iniciada_em")
+                st.rerun()
+
+        painel_varredura()
+
+        estado_varredura = gerente_varredura()["estado"]
+        if estado_varredura and estado_varredura.get("status") == "concluida" and estado_varredura.get("relatorio"):
+            st.success(f"Varredura Finalizada! ({estado_varredura.get('concluida_em', '')})")
+            # 💾 SALVANDO RESULTADO NO COFRE (uma vez por varredura, não a cada rerun)
+            if st.session_state.get("relatorio_fixo_de") != estado_varredura.get("iniciada_em"):
+                st.session_state["relatorio_fixo_de"] = estado_varredura.get("iniciada_em")
+                st.session_state.relatorio_fixo = pd.DataFrame(estado_varredura["relatorio"])
+        elif estado_varredura and estado_varredura.get("status") == "erro":
+            st.error(f"Erro na varredura: {estado_varredura.get('erro', '')}")
+
         # --- 📋 EXIBIÇÃO DO RELATÓRIO FIXO ---
         # Esta parte fica fora do botão para não sumir após o rerun
         if st.session_state.relatorio_fixo is not None:
@@ -3225,7 +4372,7 @@ elif menu_selecionado == "📂 Documentos":
                 st.caption("ℹ️ Este relatório é mantido até você iniciar uma nova varredura.")
                 
                 if st.button("🔄 Atualizar Vitrine Odoo Agora", key="btn_manual_refresh"):
-                    st.cache_data.clear()
+                    invalidar("INVENTÁRIO", "DOCUMENTOS")
                     st.rerun()
 
     st.divider()
@@ -3244,18 +4391,18 @@ elif menu_selecionado == "📂 Documentos":
         
         if cat_escolhida == "Foto de Produto":
             st.info("📦 O sistema dará o nome do arquivo automaticamente com base no produto.")
-            opcoes_prod = ["Nenhum"] + [f"{k} - {v['nome']}" for k, v in banco_de_produtos.items()]
+            opcoes_prod = opcoes_catalogo(catalogo, "produtos", "Nenhum")[0]
             vinc_prod = st.selectbox("Selecione o Produto:", opcoes_prod)
         
         elif cat_escolhida in ["Comprovante Cliente", "Recibo / Pgto Cliente"]:
             st.info("👤 O sistema vinculará este documento à cliente correspondente.")
-            opcoes_cli = ["Nenhum"] + [f"{k} - {v['nome']}" for k, v in banco_de_clientes.items()]
+            opcoes_cli = opcoes_catalogo(catalogo, "clientes", "Nenhum")[0]
             vinc_cli = st.selectbox("Selecione a Cliente:", opcoes_cli)
             
         # 🆕 A GRANDE MÁGICA: Conectando com a base contábil
         elif cat_escolhida in ["Nota Fiscal (Fornecedor)", "Boleto / Despesa"]:
             st.info("🏭 O sistema vinculará este documento ao Fornecedor correspondente.")
-            opcoes_forn = ["Nenhum"] + [f"{k} - {v['nome']}" for k, v in banco_de_fornecedores.items()]
+            opcoes_forn = opcoes_catalogo(catalogo, "fornecedores", "Nenhum")[0]
             vinc_forn = st.selectbox("Selecione o Fornecedor:", opcoes_forn)
         
         else:
@@ -3308,7 +4455,7 @@ elif menu_selecionado == "📂 Documentos":
                             import pytz
                             from datetime import datetime
                             
-                            aba_doc = planilha_mestre.worksheet("DOCUMENTOS")
+                            aba_doc = pegar_aba("DOCUMENTOS")
                             
                             # Se a aba estiver totalmente limpa (sem cabeçalho), ele cria na hora
                             if len(aba_doc.get_all_values()) == 0:
@@ -3338,8 +4485,7 @@ elif menu_selecionado == "📂 Documentos":
                             aba_doc.insert_row(linha_nova, index=proxima_linha_vazia, value_input_option='RAW')
                             
                             st.success(f"✅ Arquivado com sucesso no Cofre e na Planilha!")
-                            st.cache_data.clear()
-                            st.cache_resource.clear()
+                            invalidar("DOCUMENTOS")
                             st.rerun()
                             
                         except Exception as e: 
@@ -3353,8 +4499,8 @@ elif menu_selecionado == "📂 Documentos":
     
     if not df_docs.empty:
         # 💡 CORREÇÃO 1: Limpeza profunda (Extermina a "categoria fantasma" em branco)
-        df_docs['TIPO'] = df_docs['TIPO'].astype(str).str.strip() # Remove espaços acidentais
-        df_docs_limpo = df_docs[(df_docs['TIPO'] != "") & (df_docs['TIPO'].str.lower() != "nan")].copy()
+        df_docs_limpo = df_docs.assign(TIPO=df_docs['TIPO'].astype(str).str.strip()) # Remove espaços acidentais (sem mexer na foto compartilhada)
+        df_docs_limpo = df_docs_limpo[(df_docs_limpo['TIPO'] != "") & (df_docs_limpo['TIPO'].str.lower() != "nan")].copy()
 
         if not df_docs_limpo.empty:
             categorias_existentes = ["Tudo"] + sorted(df_docs_limpo['TIPO'].unique().tolist())
@@ -3366,7 +4512,8 @@ elif menu_selecionado == "📂 Documentos":
                 
             busca_doc = st.text_input("🔍 Pesquisar por Nome ou Código...")
             if busca_doc:
-                df_filtrado = df_filtrado[df_filtrado.apply(lambda r: busca_doc.lower() in str(r).lower(), axis=1)]
+                indice_docs = indice_busca("documentos", versao_abas(), lambda: df_docs_limpo.astype(str).agg(" ".join, axis=1).to_dict())
+                df_filtrado = df_filtrado.loc[[i for i in buscar_no_indice(indice_docs, busca_doc) if i in df_filtrado.index]]
 
             # 💡 CORREÇÃO 2: Removendo o gargalo! Aumentei de 10 para 50 arquivos (ou o número que quiser)
             docs_para_mostrar = df_filtrado.sort_index(ascending=False).head(50)
@@ -3435,12 +4582,11 @@ elif menu_selecionado == "📂 Documentos":
                                 st.warning(f"O arquivo já não estava no Cloudinary ou houve falha na nuvem: {cloud_err}")
 
                         # 2️⃣ SEGUNDO: Apaga a linha do Google Sheets
-                        aba_doc_ex = planilha_mestre.worksheet("DOCUMENTOS")
+                        aba_doc_ex = pegar_aba("DOCUMENTOS")
                         aba_doc_ex.delete_rows(linha_alvo_ex)
                         
                         st.success("🗑️ Documento apagado com sucesso do Cloudinary E da base de dados!")
-                        st.cache_data.clear()
-                        st.cache_resource.clear()
+                        invalidar("DOCUMENTOS")
                         st.rerun()
                         
                     except Exception as e:
@@ -3459,7 +4605,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
         df_desp.columns = [c.strip().upper() for c in df_desp.columns]
         # Garante que vai achar a coluna de valor
         col_valor = 'VALOR R$' if 'VALOR R$' in df_desp.columns else df_desp.columns[4]
-        df_desp['VALOR_NUM'] = df_desp[col_valor].apply(limpar_v)
+        df_desp['VALOR_NUM'] = valores_num(df_desp, 'VALOR_NUM', df_desp[col_valor])
         df_desp['STATUS_LIMPO'] = df_desp.get('STATUS', pd.Series(dtype=str)).astype(str).str.strip().str.upper()
     else:
         df_desp['VALOR_NUM'] = 0.0
@@ -3527,7 +4673,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
             st.write("#### ➕ Nova Despesa / Compra")
             with st.form("form_nova_despesa", clear_on_submit=True):
                 # Puxa os fornecedores ou permite avulso
-                opcoes_forn = ["Avulso (Sem Fornecedor)"] + [f"{k} - {v['nome']}" for k,v in banco_de_fornecedores.items()]
+                opcoes_forn = opcoes_catalogo(catalogo, "fornecedores", "Avulso (Sem Fornecedor)")[0]
                 f_forn = st.selectbox("Quem estamos pagando?", opcoes_forn)
                 
                 f_desc = st.text_input("Descrição da Compra", placeholder="Ex: Fatura Tecidos, Conta de Luz...")
@@ -3548,7 +4694,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                     if f_val_total > 0 and f_desc:
                         try:
                             import datetime as dt
-                            aba_d = planilha_mestre.worksheet("DESPESAS")
+                            aba_d = pegar_aba("DESPESAS")
                             
                             valor_parcela_base = round(f_val_total / f_parcelas, 2)
                             novas_linhas = []
@@ -3582,7 +4728,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                                 aba_d.append_row(linha, value_input_option='RAW')
                                 
                             st.success(f"✅ {f_parcelas} parcela(s) registrada(s) no cofre!")
-                            st.cache_data.clear(); st.rerun()
+                            invalidar("DESPESAS"); st.rerun()
                             
                         except Exception as e:
                             st.error(f"Erro ao salvar parcelamento: {e}")
@@ -3611,11 +4757,11 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                         if st.button("Confirmar Pagamento 💵", type="secondary"):
                             linha_alvo = dict_linhas[conta_selecionada]
                             try:
-                                aba_d_baixa = planilha_mestre.worksheet("DESPESAS")
+                                aba_d_baixa = pegar_aba("DESPESAS")
                                 aba_d_baixa.update_acell(f"F{linha_alvo}", "Pago")
                                 aba_d_baixa.update_acell(f"G{linha_alvo}", datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y"))
                                 st.success("🎉 Baixa realizada com sucesso!")
-                                st.cache_data.clear(); st.rerun()
+                                invalidar("DESPESAS"); st.rerun()
                             except Exception as e:
                                 st.error(f"Erro ao dar baixa: {e}")
                 else:
@@ -3682,10 +4828,10 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                 if st.button("🗑️ Excluir Registro Permanentemente"):
                     linha_alvo_ex = dict_linhas_ex[conta_excluir]
                     try:
-                        aba_d_ex = planilha_mestre.worksheet("DESPESAS")
+                        aba_d_ex = pegar_aba("DESPESAS")
                         aba_d_ex.delete_rows(linha_alvo_ex)
                         st.success("🗑️ Lançamento apagado com sucesso! Os gráficos já foram atualizados.")
-                        st.cache_data.clear(); st.rerun()
+                        invalidar("DESPESAS"); st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao excluir: {e}")
 
@@ -3754,7 +4900,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
             if st.form_submit_button("Criar Fornecedor 💾", type="primary"):
                 if nome_f:
                     try:
-                        aba_forn = planilha_mestre.worksheet("FORNECEDORES")
+                        aba_forn = pegar_aba("FORNECEDORES")
                         dados_forn = aba_forn.get_all_values()
                         
                         if len(dados_forn) > 1:
@@ -3773,7 +4919,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                         st.session_state['form_forn_obs'] = ""
                         
                         st.success(f"Fábrica cadastrada! Código: {novo_cod_forn}")
-                        import time; time.sleep(1); st.cache_data.clear(); st.rerun()
+                        import time; time.sleep(1); invalidar("FORNECEDORES"); st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao cadastrar: {e}")
                 else:
@@ -3841,7 +4987,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                         if salvar:
                             with st.spinner("Atualizando na planilha..."):
                                 try:
-                                    aba_forn = planilha_mestre.worksheet("FORNECEDORES")
+                                    aba_forn = pegar_aba("FORNECEDORES")
                                     
                                     # O código (A) fica intacto. Atualizamos da B até a F.
                                     atualizacoes = [
@@ -3854,7 +5000,7 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                                     aba_forn.batch_update(atualizacoes, value_input_option='USER_ENTERED')
                                     
                                     st.success("✅ Dados do fornecedor atualizados com sucesso!")
-                                    st.cache_data.clear(); st.cache_resource.clear(); st.rerun()
+                                    invalidar("FORNECEDORES"); st.rerun()
                                 except Exception as e:
                                     st.error(f"Erro ao salvar: {e}")
                                     
@@ -3862,11 +5008,11 @@ elif menu_selecionado == "🏭 Compras e Despesas":
                             if confirma_exclusao:
                                 with st.spinner("Apagando registro..."):
                                     try:
-                                        aba_forn = planilha_mestre.worksheet("FORNECEDORES")
+                                        aba_forn = pegar_aba("FORNECEDORES")
                                         aba_forn.delete_rows(linha_alvo)
                                         
                                         st.success("🗑️ Fornecedor excluído do banco de dados!")
-                                        st.cache_data.clear(); st.cache_resource.clear(); st.rerun()
+                                        invalidar("FORNECEDORES"); st.rerun()
                                     except Exception as e:
                                         st.error(f"Erro ao excluir: {e}")
                             else:
@@ -3974,7 +5120,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
         with st.form("form_novo_marketing", clear_on_submit=True):
             c1, c2 = st.columns([2, 1])
             
-            opcoes_produtos = ["Nenhum / Post Institucional"] + [f"{k} - {v['nome']}" for k, v in banco_de_produtos.items()]
+            opcoes_produtos = opcoes_catalogo(catalogo, "produtos", "Nenhum / Post Institucional")[0]
             f_produto = c1.selectbox("Sobre qual produto é o post?", opcoes_produtos)
             
             f_formato = c2.selectbox("Formato desejado", ["📸 Foto para o Feed", "🎬 Reels", "📱 Story", "🛒 Atualizar no Site (Odoo)", "🎨 Outro (Banner, Logo...)"])
@@ -3993,7 +5139,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                         try:
                             import datetime as dt
                             import pytz
-                            aba_mkt = planilha_mestre.worksheet("MARKETING")
+                            aba_mkt = pegar_aba("MARKETING")
                             
                             if df_mkt.empty: novo_id = "MKT-001"
                             else:
@@ -4021,7 +5167,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                             
                             # 💡 MOTOR DO RECIBO E REFRESH
                             st.session_state['recibo_mkt'] = {"acao": "criado", "id": novo_id, "produto": f_produto, "formato": f_formato, "prazo": data_prazo_str}
-                            st.cache_data.clear(); st.rerun()
+                            invalidar("MARKETING"); st.rerun()
                         except Exception as e:
                             st.error(f"Erro ao registar: {e}")
                 else:
@@ -4081,7 +5227,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                                 
                                 if st.button(f"Mover ➡️", key=f"btn_{task['ID_TAREFA']}"):
                                     try:
-                                        aba_mkt = planilha_mestre.worksheet("MARKETING")
+                                        aba_mkt = pegar_aba("MARKETING")
                                         linha_planilha = task.name + 2 
                                         
                                         aba_mkt.update_acell(f"G{linha_planilha}", proximo)
@@ -4094,7 +5240,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                                             
                                         # 💡 O SEGREDO ESTÁ AQUI: Atualização rápida e contínua sem quebrar a conexão!
                                         st.session_state['recibo_mkt'] = {"acao": "movido", "id": task['ID_TAREFA'], "novo_status": proximo}
-                                        st.cache_data.clear(); st.rerun() 
+                                        invalidar("MARKETING"); st.rerun()
                                     except Exception as e:
                                         st.error(f"Erro ao mover card: {e}")
         else:
@@ -4212,7 +5358,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                             if link_post and "http" in link_post:
                                 with st.spinner("Registrando o sucesso..."):
                                     try:
-                                        aba_mkt = planilha_mestre.worksheet("MARKETING")
+                                        aba_mkt = pegar_aba("MARKETING")
                                         id_alvo = tarefa_selecionada.split(" - ")[0].replace("📍 ", "")
                                         linha_planilha = df_mkt[df_mkt['ID_TAREFA'] == id_alvo].index[0] + 2
                                         
@@ -4226,7 +5372,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                                         
                                         # 💡 MOTOR DO RECIBO E REFRESH
                                         st.session_state['recibo_mkt'] = {"acao": "validado", "id": id_alvo}
-                                        st.cache_data.clear(); st.rerun()
+                                        invalidar("MARKETING"); st.rerun()
                                     except Exception as e:
                                         st.error(f"Erro ao salvar o link: {e}")
                             else:
@@ -4308,9 +5454,8 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                     st.markdown(f"#### 🔄 Atualizar Demanda ({dados_atuais.get('ID_TAREFA', '')})")
                     
                     e_c1, e_c2 = st.columns(2)
-                    opcoes_produtos_edit = ["Nenhum / Post Institucional"] + [f"{k} - {v['nome']}" for k, v in banco_de_produtos.items()]
-                    try: idx_prod = opcoes_produtos_edit.index(str(dados_atuais.get('PRODUTO_VINCULADO', '')))
-                    except: idx_prod = 0
+                    opcoes_produtos_edit, pos_produtos_edit = opcoes_catalogo(catalogo, "produtos", "Nenhum / Post Institucional")
+                    idx_prod = pos_produtos_edit.get(str(dados_atuais.get('PRODUTO_VINCULADO', '')), 0)
                     novo_produto = e_c1.selectbox("Produto Vinculado", opcoes_produtos_edit, index=idx_prod)
                     
                     lista_formatos = ["📸 Foto para o Feed", "🎬 Reels", "📱 Story", "🛒 Atualizar no Site (Odoo)", "🎨 Outro (Banner, Logo...)"]
@@ -4347,7 +5492,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                     if salvar:
                         with st.spinner("Atualizando na planilha..."):
                             try:
-                                aba_mkt = planilha_mestre.worksheet("MARKETING")
+                                aba_mkt = pegar_aba("MARKETING")
                                 nova_data_str = nova_data.strftime("%d/%m/%Y")
                                 
                                 atualizacoes = [
@@ -4363,7 +5508,7 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                                 
                                 # 💡 MOTOR DO RECIBO E REFRESH
                                 st.session_state['recibo_mkt'] = {"acao": "editado", "id": dados_atuais.get('ID_TAREFA', '')}
-                                st.cache_data.clear(); st.rerun()
+                                invalidar("MARKETING"); st.rerun()
                             except Exception as e:
                                 st.error(f"Erro ao salvar: {e}")
                                 
@@ -4371,12 +5516,12 @@ elif menu_selecionado == "📢 Gestão de Marketing":
                         if confirma_exclusao:
                             with st.spinner("Apagando registro..."):
                                 try:
-                                    aba_mkt = planilha_mestre.worksheet("MARKETING")
+                                    aba_mkt = pegar_aba("MARKETING")
                                     aba_mkt.delete_rows(linha_alvo)
                                     
                                     # 💡 MOTOR DO RECIBO E REFRESH
                                     st.session_state['recibo_mkt'] = {"acao": "excluido"}
-                                    st.cache_data.clear(); st.rerun()
+                                    invalidar("MARKETING"); st.rerun()
                                 except Exception as e:
                                     st.error(f"Erro ao excluir: {e}")
                         else:
@@ -4415,9 +5560,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
 
     # Carrega a aba CONTABILIDADE
     try:
-        aba_contabilidade = planilha_mestre.worksheet("CONTABILIDADE")
-        dados_cont = aba_contabilidade.get_all_values()
-        df_cont = pd.DataFrame(dados_cont[1:], columns=dados_cont[0]) if len(dados_cont) > 1 else pd.DataFrame()
+        df_cont = obter_abas(["CONTABILIDADE"])["CONTABILIDADE"].copy()
     except:
         df_cont = pd.DataFrame()
 
@@ -4441,7 +5584,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
             (vendas_ano_foco['DATA_DT'] >= data_corte_cnpj) # 🛡️ Só soma o que foi vendido DEPOIS da empresa abrir
         ].copy()
 
-        vendas_validas['VALOR_BRUTO'] = vendas_validas.iloc[:, 11].apply(limpar_v) 
+        vendas_validas['VALOR_BRUTO'] = valores_num(vendas_validas, 'VALOR_NUM', vendas_validas.iloc[:, 11])
         faturamento_atual = vendas_validas['VALOR_BRUTO'].sum()
         
         # 🧠 O CÉREBRO TRIBUTÁRIO (Limites Proporcionais e Regra dos 20%)
@@ -4549,7 +5692,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                     (vendas_ano_anterior['DATA_DT'] >= data_corte_cnpj)
                 ].copy()
                 
-                vendas_validas_passado['VALOR_BRUTO'] = vendas_validas_passado.iloc[:, 11].apply(limpar_v)
+                vendas_validas_passado['VALOR_BRUTO'] = valores_num(vendas_validas_passado, 'VALOR_NUM', vendas_validas_passado.iloc[:, 11])
                 faturamento_passado = vendas_validas_passado['VALOR_BRUTO'].sum()
                 
                 # 2. Calcula o limite proporcional do ano passado
@@ -4664,9 +5807,9 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                             import pytz
                                             fuso = pytz.timezone('America/Sao_Paulo')
                                             data_agora = datetime.now(fuso).strftime("%d/%m/%Y")
-                                            aba_contabilidade = planilha_mestre.worksheet("CONTABILIDADE")
+                                            aba_contabilidade = pegar_aba("CONTABILIDADE")
                                             aba_contabilidade.append_row(["DASN (Declaração Anual)", f"Ano-Calendário {ano_declaracao}", "31/05", 0.00, 0.00, 0.00, 0, "ENTREGUE", data_agora, link_cloud], value_input_option='USER_ENTERED')
-                                            st.success(f"✅ Declaração salva com sucesso!"); st.cache_data.clear(); st.rerun()
+                                            st.success(f"✅ Declaração salva com sucesso!"); invalidar("CONTABILIDADE"); st.rerun()
                                         except Exception as e: st.error(f"Erro: {e}")
                             else:
                                 st.warning("Anexe o arquivo primeiro.")
@@ -4724,7 +5867,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
             ].copy()
 
             if not vendas_totais_ano.empty:
-                vendas_totais_ano['VALOR_BRUTO'] = vendas_totais_ano.iloc[:, 11].apply(limpar_v)
+                vendas_totais_ano['VALOR_BRUTO'] = valores_num(vendas_totais_ano, 'VALOR_NUM', vendas_totais_ano.iloc[:, 11])
                 
                 # O Divisor de Águas (Matemática Temporal)
                 vendas_pf = vendas_totais_ano[vendas_totais_ano['DATA_DT'] < data_corte_cnpj]
@@ -4881,11 +6024,12 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                     valor_base, valor_pago, prejuizo_juros, dias_atraso, "PAGO", 
                                     dt_pagamento.strftime("%d/%m/%Y"), link_cloud
                                 ]
+                                aba_contabilidade = pegar_aba("CONTABILIDADE")
                                 aba_contabilidade.append_row(linha_cont, value_input_option='USER_ENTERED')
                                 
                                 # 2️⃣ INTEGRAÇÃO GIGANTE: Lança o valor pago diretamente na aba DESPESAS (DRE)
                                 try:
-                                    aba_despesas = planilha_mestre.worksheet("DESPESAS")
+                                    aba_despesas = pegar_aba("DESPESAS")
                                     obs_desp = f"Ref: {comp_mes}/{ano_selecionado}."
                                     if prejuizo_juros > 0:
                                         obs_desp += f" Inclui R$ {prejuizo_juros:.2f} de Multa/Juros."
@@ -4901,7 +6045,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                 
                                 # 3️⃣ INTEGRAÇÃO: Salva no cofre de Documentos
                                 try:
-                                    aba_docs_global = planilha_mestre.worksheet("DOCUMENTOS")
+                                    aba_docs_global = pegar_aba("DOCUMENTOS")
                                     aba_docs_global.append_row([datetime.now(fuso).strftime("%d/%m/%Y %H:%M"), "Guia DAS / Imposto", nome_doc, id_cloud, link_cloud, "Receita Federal", "-"], value_input_option='USER_ENTERED')
                                 except: pass 
                                 
@@ -4910,7 +6054,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                 else:
                                     st.success(f"✅ Guia de {comp_mes} contabilizada e integrada ao Caixa com sucesso!")
                                 
-                                st.cache_data.clear(); st.rerun()
+                                invalidar("DESPESAS", "DOCUMENTOS", "CONTABILIDADE"); st.rerun()
                             except Exception as e: st.error(f"Erro na integração: {e}")
                         else: st.error("Falha no upload do arquivo.")
                 else:
@@ -5076,7 +6220,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                 novo_atraso = diferenca_dias if diferenca_dias > 0 else 0
                                 novo_prejuizo = novo_v_pago - novo_v_base if novo_v_pago > novo_v_base else 0.0
 
-                                aba_cont_edit = planilha_mestre.worksheet("CONTABILIDADE")
+                                aba_cont_edit = pegar_aba("CONTABILIDADE")
 
                                 atualizacoes = [
                                     {'range': f'C{linha_alvo}', 'values': [[novo_venc.strftime("%d/%m/%Y")]]},
@@ -5090,7 +6234,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
 
                                 # Opcional: Registra na Auditoria
                                 try:
-                                    planilha_mestre.worksheet("LOG_AUDITORIA").append_row([
+                                    pegar_aba("LOG_AUDITORIA").append_row([
                                         dt.datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y %H:%M"),
                                         st.session_state.get('usuario_logado', 'Sistema'), "EDIÇÃO CONTÁBIL", f"Linha {linha_alvo}",
                                         "Receita Federal", f"Ajustou guia {dados_atuais.get('COMPETENCIA', '')} para R$ {novo_v_pago:.2f}"
@@ -5098,7 +6242,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                 except: pass
 
                                 st.session_state['recibo_cont'] = {"acao": "editado"}
-                                st.cache_data.clear(); st.rerun()
+                                invalidar("CONTABILIDADE", completo=True); invalidar("LOG_AUDITORIA"); st.rerun()
                             except Exception as e:
                                 st.error(f"Erro ao salvar: {e}")
 
@@ -5127,15 +6271,15 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
 
                                     # 3️⃣ O LIXEIRO: Deleta a linha da aba DOCUMENTOS (O Cofre)
                                     if linha_docs_excluir:
-                                        try: planilha_mestre.worksheet("DOCUMENTOS").delete_rows(linha_docs_excluir)
+                                        try: pegar_aba("DOCUMENTOS").delete_rows(linha_docs_excluir)
                                         except: pass
 
                                     # 4️⃣ O FINALIZADOR: Deleta da aba CONTABILIDADE
-                                    planilha_mestre.worksheet("CONTABILIDADE").delete_rows(linha_alvo)
+                                    pegar_aba("CONTABILIDADE").delete_rows(linha_alvo)
 
                                     # Registra o crime na Auditoria
                                     try:
-                                        planilha_mestre.worksheet("LOG_AUDITORIA").append_row([
+                                        pegar_aba("LOG_AUDITORIA").append_row([
                                             dt.datetime.now(pytz.timezone('America/Sao_Paulo')).strftime("%d/%m/%Y %H:%M"),
                                             st.session_state.get('usuario_logado', 'Sistema'), "EXCLUSÃO CONTÁBIL", f"Linha {linha_alvo}",
                                             "Receita Federal", f"Apagou guia {dados_atuais.get('COMPETENCIA', '')}"
@@ -5143,7 +6287,7 @@ elif menu_selecionado == "🏛️ Contabilidade e MEI":
                                     except: pass
 
                                     st.session_state['recibo_cont'] = {"acao": "excluido"}
-                                    st.cache_data.clear(); st.rerun()
+                                    invalidar("CONTABILIDADE", completo=True); invalidar("LOG_AUDITORIA"); st.rerun()
                                 except Exception as e:
                                     st.error(f"Erro na exclusão: {e}")
                         else:
@@ -5275,7 +6419,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
     # -----------------------------------------------------
     with tab_equipe:
         try:
-            aba_cred = planilha_mestre.worksheet("CREDENCIAIS")
+            aba_cred = pegar_aba("CREDENCIAIS")
             dados_cred = aba_cred.get_all_values()
             df_cred = pd.DataFrame(dados_cred[1:], columns=dados_cred[0]) if len(dados_cred) > 1 else pd.DataFrame(columns=['NOME', 'USUARIO', 'SENHA', 'NIVEL', 'STATUS', 'CARGO'])
         except: df_cred = pd.DataFrame()
@@ -5313,7 +6457,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
                         with st.spinner("A criar perfis de segurança..."):
                             # Salva os 6 dados na ordem exata da planilha (com o Cargo na coluna F)
                             aba_cred.append_row([n_nome, n_user, gerar_hash_senha(n_senha), n_nivel, "Ativo", n_cargo], value_input_option='USER_ENTERED')
-                            st.success("Criado com sucesso!"); st.cache_data.clear(); st.rerun()
+                            st.success("Criado com sucesso!"); invalidar("CREDENCIAIS"); st.rerun()
                     else: st.warning("Preencha todos os campos do formulário.")
 
         with col_edit:
@@ -5333,7 +6477,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
                                     celula_user = aba_cred.find(u_alvo, in_column=2)
                                     aba_cred.update_cell(celula_user.row, 5, u_novo_status)
                                     if u_nova_senha.strip() != "": aba_cred.update_cell(celula_user.row, 3, gerar_hash_senha(u_nova_senha))
-                                    st.success("Atualizado!"); st.cache_data.clear(); st.rerun()
+                                    st.success("Atualizado!"); invalidar("CREDENCIAIS"); st.rerun()
                 else: st.info("Aguardando base de dados.")
 
     # -----------------------------------------------------
@@ -5342,7 +6486,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
     with tab_marca:
         # Função Ninja para salvar/atualizar chaves na planilha sem dar erro
         def atualizar_config(chave, valor):
-            aba_conf = planilha_mestre.worksheet("CONFIGURACOES")
+            aba_conf = pegar_aba("CONFIGURACOES")
             try:
                 celula = aba_conf.find(chave, in_column=1)
                 aba_conf.update_cell(celula.row, 2, valor)
@@ -5370,7 +6514,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
                             
                             st.success(f"✅ Empresa: {dados_cnpj.get('nome', '')} | Abertura: {data_abertura_receita}")
                             import time; time.sleep(2)
-                            st.cache_data.clear(); st.cache_resource.clear(); st.rerun()
+                            carregar_identidade_visual.clear(); st.rerun()
                         else:
                             st.error("❌ CNPJ inválido ou sistema da Receita indisponível.")
                 else:
@@ -5395,8 +6539,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
                         st.success("✅ Nome atualizado! O sistema será reiniciado.")
                         import time
                         time.sleep(1)
-                        st.cache_data.clear()
-                        st.cache_resource.clear()
+                        carregar_identidade_visual.clear()
                         st.rerun()
                 else:
                     st.warning("O nome não pode ficar vazio.")
@@ -5409,7 +6552,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
         
         # Função Ninja para salvar/atualizar chaves na planilha sem dar erro
         def atualizar_config(chave, valor):
-            aba_conf = planilha_mestre.worksheet("CONFIGURACOES")
+            aba_conf = pegar_aba("CONFIGURACOES")
             try:
                 celula = aba_conf.find(chave, in_column=1)
                 aba_conf.update_cell(celula.row, 2, valor)
@@ -5474,7 +6617,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
                                 st.success("✅ Logótipo e Paleta visual calculada com sucesso! A repintar o ecrã...")
                                 import time
                                 time.sleep(2)
-                                st.cache_data.clear(); st.cache_resource.clear(); st.rerun()
+                                carregar_identidade_visual.clear(); st.rerun()
                             else:
                                 st.error("Falha no upload para o servidor de imagens.")
                     else:
@@ -5501,7 +6644,7 @@ elif menu_selecionado == "⚙️ Painel de Administração":
                     st.success("✅ Cores atualizadas!")
                     import time
                     time.sleep(1)
-                    st.cache_data.clear(); st.cache_resource.clear(); st.rerun()
+                    carregar_identidade_visual.clear(); st.rerun()
 
 
 
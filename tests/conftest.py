@@ -0,0 +1,32 @@
+"""
+O app.py é um script do Streamlit (roda a interface ao ser importado), então os testes pegam dele só
+as funções/classes/constantes que precisam, com as dependências (Google, Streamlit...) trocadas por falsas.
+"""
+import ast
+import pathlib
+
+import pytest
+
+APP = pathlib.Path(__file__).resolve().parent.parent / "app.py"
+
+
+def carregar_do_app(nomes, **globais):
+    """Executa só as definições 'nomes' do app.py num namespace com 'globais' e devolve esse namespace."""
+    arvore = ast.parse(APP.read_text(encoding="utf-8"))
+    escolhidos = []
+    for no in arvore.body:
+        if isinstance(no, (ast.FunctionDef, ast.ClassDef)) and no.name in nomes:
+            no.decorator_list = [] # Sem @st.cache_resource: cada teste recebe objetos novos
+            escolhidos.append(no)
+        elif isinstance(no, ast.Assign) and any(getattr(alvo, "id", None) in nomes for alvo in no.targets):
+            escolhidos.append(no)
+    faltando = set(nomes) - {getattr(no, "name", None) for no in escolhidos} - {alvo.id for no in escolhidos if isinstance(no, ast.Assign) for alvo in no.targets}
+    assert not faltando, f"Não encontrado no app.py: {faltando}"
+    namespace = dict(globais)
+    exec(compile(ast.Module(escolhidos, []), str(APP), "exec"), namespace)
+    return namespace
+
+
+@pytest.fixture
+def app():
+    return carregar_do_app
@@ -0,0 +1,96 @@
+import json
+import random
+import threading
+import time
+import types
+
+import gspread
+import pytest
+import requests
+
+URL = "https://sheets.invalid/teste"
+
+
+class SessaoFalsaSheets:
+    """No lugar do requests.Session: responde 'falhas' vezes com 'codigo' e depois 200."""
+
+    def __init__(self, falhas=0, codigo=429):
+        self.falhas, self.codigo, self.chamadas = falhas, codigo, []
+
+    def request(self, method, url, **kwargs):
+        self.chamadas.append(method)
+        resposta = requests.Response()
+        if self.falhas > 0:
+            self.falhas -= 1
+            resposta.status_code = self.codigo
+            resposta._content = json.dumps({"error": {"code": self.codigo, "message": "resposta simulada", "status": "SIMULADO"}}).encode()
+        else:
+            resposta.status_code = 200
+            resposta._content = b"{}"
+        return resposta
+
+
+@pytest.fixture
+def cliente(app):
+    ns = app(
+        ["novo_estado_cota", "reservar_cota", "ClienteSheetsComCota"],
+        gspread=gspread, requests=requests, random=random, threading=threading, time=time,
+        st=types.SimpleNamespace(secrets={}),
+    )
+
+    def criar(sessao, leituras_minuto=60, escritas_minuto=60):
+        c = ns["ClienteSheetsComCota"](None, session=sessao)
+        c.cota, c.esperas = ns["novo_estado_cota"](leituras_minuto, escritas_minuto), []
+        c.dormir = c.esperas.append # Só anota quanto teria esperado
+        return c
+
+    return criar
+
+
+def test_leitura_com_429_repete_com_espera_exponencial_e_jitter(cliente):
+    sessao = SessaoFalsaSheets(falhas=3, codigo=429)
+    c = cliente(sessao)
+    c.request("GET", URL)
+    assert len(sessao.chamadas) == 4
+    assert len(c.esperas) == 3
+    assert all(0.5 * 2 ** i <= espera <= 1.5 * 2 ** i for i, espera in enumerate(c.esperas))
+    assert c.cota["erros_429"] == 3 and c.cota["retentativas"] == 3
+
+
+def test_429_sem_fim_desiste_apos_as_tentativas(cliente):
+    sessao = SessaoFalsaSheets(falhas=99, codigo=429)
+    c = cliente(sessao)
+    with pytest.raises(gspread.exceptions.APIError) as erro:
+        c.request("GET", URL)
+    assert erro.value.code == 429
+    assert len(sessao.chamadas) == c.TENTATIVAS
+    assert max(c.esperas) <= c.ESPERA_MAXIMA * 1.5
+
+
+def test_leitura_com_5xx_repete(cliente):
+    sessao = SessaoFalsaSheets(falhas=1, codigo=503)
+    cliente(sessao).request("GET", URL)
+    assert sessao.chamadas == ["GET", "GET"]
+
+
+def test_escrita_com_5xx_nao_repete(cliente):
+    # O Google pode ter gravado antes de responder 5xx: repetir duplicaria a linha
+    sessao = SessaoFalsaSheets(falhas=1, codigo=503)
+    with pytest.raises(gspread.exceptions.APIError):
+        cliente(sessao).request("POST", URL)
+    assert sessao.chamadas == ["POST"]
+
+
+def test_escrita_com_429_repete(cliente):
+    sessao = SessaoFalsaSheets(falhas=1, codigo=429)
+    cliente(sessao).request("POST", URL)
+    assert sessao.chamadas == ["POST", "POST"]
+
+
+def test_orcamento_por_minuto_poe_as_excedentes_na_fila(cliente):
+    c = cliente(SessaoFalsaSheets(), leituras_minuto=3)
+    for _ in range(5):
+        c.request("GET", URL)
+    assert len(c.esperas) == 2
+    assert all(55 <= espera <= 61 for espera in c.esperas)
+    assert c.cota["esperas"] == 2
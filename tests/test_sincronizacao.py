@@ -0,0 +1,55 @@
+import re
+import time
+
+import pytest
+
+
+class PlanilhaFalsa:
+    def __init__(self, linhas):
+        self.linhas, self.pedidos = linhas, []
+
+    def values_batch_get(self, intervalos):
+        self.pedidos.extend(intervalos)
+        respostas = []
+        for intervalo in intervalos:
+            inicio = int(re.search(r"!A(\d+):", intervalo).group(1))
+            respostas.append({"values": self.linhas[inicio - 1:]})
+        return {"valueRanges": respostas}
+
+
+def vendas(n):
+    return [["", "DATA", "CLIENTE", "PRODUTO"]] + [["", f"{i:04d}", f"cliente {i}", "lençol"] for i in range(1, n + 1)]
+
+
+@pytest.fixture
+def ler(app):
+    ns = app(["JANELA_CONFERENCIA", "linha_de_dados", "ler_abas_incremental"], time=time, tempos_de_carga=dict)
+    return ns["ler_abas_incremental"], ns["JANELA_CONFERENCIA"]
+
+
+def test_so_o_fim_da_aba_e_lido_e_as_linhas_novas_entram(ler):
+    ler_abas_incremental, janela = ler
+    memoria = vendas(1000)
+    planilha = PlanilhaFalsa(vendas(1003))
+
+    resultado = ler_abas_incremental(planilha, {"VENDAS": memoria})
+
+    nova, ancora = resultado["VENDAS"]
+    assert nova == vendas(1003)
+    assert ancora == 1000
+    # Um único intervalo, começando na janela de conferência (não a coluna inteira)
+    assert planilha.pedidos == [f"'VENDAS'!A{1001 - janela + 1}:D"]
+
+
+def test_edicao_dentro_da_janela_manda_para_a_carga_completa(ler):
+    ler_abas_incremental, _ = ler
+    atual = vendas(1001)
+    atual[990][2] = "cliente corrigido"
+    assert ler_abas_incremental(PlanilhaFalsa(atual), {"VENDAS": vendas(1000)}) == {}
+
+
+def test_exclusao_acima_da_janela_manda_para_a_carga_completa(ler):
+    ler_abas_incremental, _ = ler
+    atual = vendas(1001)
+    del atual[5] # Linha apagada lá no começo: tudo abaixo sobe uma posição
+    assert ler_abas_incremental(PlanilhaFalsa(atual), {"VENDAS": vendas(1000)}) == {}
@@ -0,0 +1,78 @@
+import re
+import threading
+
+import gspread
+
+
+class PlanilhaFalsa:
+    """Guarda as chamadas e responde às leituras com as linhas de cada aba (lista de listas)."""
+
+    def __init__(self, abas):
+        self.abas, self.lotes, self.escritas = abas, [], []
+
+    def values_batch_get(self, intervalos):
+        respostas = []
+        for intervalo in intervalos:
+            nome, colunas = re.match(r"'(.+)'!A:([A-Z])", intervalo).groups()
+            largura = ord(colunas) - ord("A") + 1
+            respostas.append({"values": [linha[:largura] for linha in self.abas[nome]]})
+        return {"valueRanges": respostas}
+
+    def batch_update(self, corpo):
+        self.lotes.append(corpo)
+
+    def values_batch_update(self, corpo):
+        self.escritas.append(corpo)
+
+
+class AbaFalsa:
+    def __init__(self, id_aba):
+        self.id, self.anexadas = id_aba, []
+
+    def append_rows(self, linhas, value_input_option=None):
+        self.anexadas.extend(linhas)
+
+
+def preparar(app, planilha, abas_falsas):
+    return app(
+        ["COLUNAS_ROTULO_TOTAIS", "linha_totais", "aba_sumiu", "inserir_linhas_antes_totais"],
+        gspread=gspread, TOTAIS_NAS_ABAS=True, threading=threading,
+        aba_registrada=abas_falsas.__getitem__, pegar_aba=abas_falsas.__getitem__,
+        esquecer_aba=lambda *nomes: None,
+    )
+
+
+def test_totais_fora_da_coluna_a_recebe_a_venda_acima(app):
+    # VENDAS: coluna A sempre vazia, o rótulo TOTAIS fica na coluna do cliente (D)
+    vendas = [
+        ["", "DATA", "CÓD. CLIENTE", "CLIENTE"],
+        ["", "01/01/2025", "C1", "Ana"],
+        ["", "02/01/2025", "C2", "Bia"],
+        ["", "", "", "TOTAIS"],
+    ]
+    planilha, abas = PlanilhaFalsa({"VENDAS": vendas}), {"VENDAS": AbaFalsa(7)}
+    ns = preparar(app, planilha, abas)
+
+    ns["inserir_linhas_antes_totais"](planilha, {"VENDAS": [["", "03/01/2025", "C3", "Cris"]]})
+
+    pedido = planilha.lotes[0]["requests"][0]["insertDimension"]["range"]
+    assert pedido == {"sheetId": 7, "dimension": "ROWS", "startIndex": 3, "endIndex": 4}
+    assert planilha.escritas[0]["data"][0]["range"] == "'VENDAS'!A4"
+    assert abas["VENDAS"].anexadas == []
+
+
+def test_sem_totais_vai_para_o_fim(app):
+    planilha = PlanilhaFalsa({"CLIENTES": [["CÓD", "NOME"], ["1", "Ana"]]})
+    abas = {"CLIENTES": AbaFalsa(3)}
+    ns = preparar(app, planilha, abas)
+
+    ns["inserir_linhas_antes_totais"](planilha, {"CLIENTES": [["2", "Bia"]]})
+
+    assert planilha.lotes == []
+    assert abas["CLIENTES"].anexadas == [["2", "Bia"]]
+
+
+def test_linha_totais_ignora_caixa_e_espacos(app):
+    linha_totais = app(["linha_totais"])["linha_totais"]
+    assert linha_totais([["CÓD"], ["1", "x"], ["", " totais "]]) == 3
+    assert linha_totais([["CÓD"], ["1", "SUBTOTAIS"]]) is None